@@ -0,0 +1,231 @@
+"""
+Offline batch runner for JSONL generate requests.
+
+Each input line is a JSON object with `prompt`, `query` and `context` (and an optional
+`id`). Results are appended to the output JSONL as they finish and progress is saved to
+a checkpoint file, so an interrupted run resumes where it stopped. On resume the output
+is truncated to its size at the last checkpoint, so no line is written twice.
+
+Each line runs under its own deadline (`--timeout`). Lines that fail with a retryable
+status (429, 5xx) are written with their status but not marked done, so the next run
+retries them.
+
+Usage:
+    python batch_runner.py requests.jsonl --output results.jsonl --provider openai --model-name gpt-4o-mini
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from array import array
+
+from utils.admission import status_code_for
+from utils.deadlines import deadline_scope
+from utils.fast_drivers import aclose_http_clients
+from utils.generation import GenerationRequest, generate
+from utils.latency import summarize
+from utils.providers import PROVIDERS, build_chat, resolve_model
+
+DEFAULT_PROMPT = "You have to answer the query by using or without using context"
+
+
+def is_retryable(status_code: int) -> bool:
+    # Rate limited, overloaded or out of time: worth another try on the next run
+    return status_code == 429 or status_code >= 500
+
+
+class Checkpoint:
+    def __init__(self, path: str):
+        """
+        Track which input lines are finished.
+
+        Every line below `line` (which starts at byte `offset`) is done; `done` holds
+        the finished lines above it. The watermark stops at the oldest line that is
+        still running or failed with a retryable status, while the workers keep
+        finishing the lines after it, so `done` (and the checkpoint file) grows with
+        the rest of the input until that line is done, on this run or a later one.
+
+        `output_offset` is the size of the output file when the checkpoint was saved:
+        the results written after it are not recorded as done, so they are cut off
+        on resume and written again.
+
+        Args:
+            path (str): The checkpoint file.
+        """
+        self.path = path
+        self.line = 0
+        self.offset = 0
+        self.done = set()
+        self.output_offset = None
+        self._ends = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                state = json.load(f)
+            self.line = state["line"]
+            self.offset = state["offset"]
+            self.done = set(state["done"])
+            self.output_offset = state.get("output_offset")
+
+    def started(self, line: int, end_offset: int):
+        self._ends[line] = end_offset
+
+    def finished(self, line: int):
+        self.done.add(line)
+        # Slide the watermark over every contiguous finished line
+        while self.line in self.done and self.line in self._ends:
+            self.done.remove(self.line)
+            self.offset = self._ends.pop(self.line)
+            self.line += 1
+
+    def save(self, output_offset: int):
+        self.output_offset = output_offset
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"line": self.line, "offset": self.offset, "done": sorted(self.done),
+                       "output_offset": output_offset}, f)
+        os.replace(tmp_path, self.path)
+
+
+def read_lines(path: str, checkpoint: Checkpoint):
+    """
+    Lazily yield (line number, raw line) for the lines not done yet, starting at the
+    checkpoint offset.
+    """
+    with open(path, "rb") as f:
+        f.seek(checkpoint.offset)
+        offset = checkpoint.offset
+        line = checkpoint.line
+        for raw in f:
+            offset += len(raw)
+            checkpoint.started(line, offset)
+            if raw.strip() and line not in checkpoint.done:
+                yield line, raw
+            else:
+                # Blank or already finished lines are done as soon as they are seen
+                checkpoint.finished(line)
+            line += 1
+
+
+def credentials_from_args(args):
+    if args.provider == "azure":
+        return {
+            "azure_endpoint": args.azure_endpoint or os.getenv("AZURE_OPENAI_ENDPOINT"),
+            "api_key": args.api_key or os.getenv("AZURE_OPENAI_API_KEY"),
+            "api_version": args.api_version or os.getenv("OPENAI_API_VERSION"),
+            "azure_deployment": args.azure_deployment or os.getenv("AZURE_OPENAI_DEPLOYMENT"),
+        }
+    env_name = "OPENAI_API_KEY" if args.provider == "openai" else "GOOGLE_API_KEY"
+    return args.api_key or os.getenv(env_name)
+
+
+async def run(args) -> int:
+    api_key = credentials_from_args(args)
+    chat = build_chat(args.provider, api_key, args.model_name, args.temperature)
+    model_name, temperature = resolve_model(args.provider, api_key, args.model_name, args.temperature)
+
+    checkpoint = Checkpoint(args.checkpoint or args.output + ".checkpoint")
+    queue = asyncio.Queue(maxsize=args.concurrency * 2)
+    latencies = array("d")
+    counts = {"ok": 0, "error": 0, "retryable": 0}
+
+    if checkpoint.output_offset is not None and os.path.exists(args.output):
+        # Drop the results written after the last checkpoint; their lines run again
+        os.truncate(args.output, min(checkpoint.output_offset, os.path.getsize(args.output)))
+    output = open(args.output, "ab")
+    since_save = 0
+
+    async def process(line: int, raw: bytes) -> dict:
+        try:
+            item = json.loads(raw)
+        except ValueError as e:
+            # A broken line fails the same way every time, never retry it
+            return {"line": line, "statusCode": 400, "message": f"Invalid JSON: {e}"}
+        try:
+            request = GenerationRequest(
+                args.provider, model_name, temperature, api_key,
+                item.get("prompt") or DEFAULT_PROMPT, item.get("query", ""), item.get("context", ""),
+                use_cache=not args.no_cache,
+            )
+            with deadline_scope(args.timeout):
+                result, cached = await generate(chat, request)
+            return {"line": line, "id": item.get("id"), "response": result, "cached": cached}
+        except Exception as e:
+            return {"line": line, "statusCode": status_code_for(e), "message": str(e)}
+
+    async def worker():
+        nonlocal since_save
+        while True:
+            entry = await queue.get()
+            if entry is None:
+                return
+            line, raw = entry
+            started = time.perf_counter()
+            record = await process(line, raw)
+            latencies.append(time.perf_counter() - started)
+            retry = "statusCode" in record and is_retryable(record["statusCode"])
+            counts["retryable" if retry else "error" if "statusCode" in record else "ok"] += 1
+
+            output.write((json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8"))
+            if not retry:
+                checkpoint.finished(line)
+            since_save += 1
+            if since_save >= args.checkpoint_every:
+                # Results must be on disk before the checkpoint says they are done
+                output.flush()
+                checkpoint.save(output.tell())
+                since_save = 0
+
+    started_at = time.perf_counter()
+    workers = [asyncio.ensure_future(worker()) for _ in range(args.concurrency)]
+    try:
+        for line, raw in read_lines(args.input, checkpoint):
+            await queue.put((line, raw))
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+    finally:
+        for task in workers:
+            task.cancel()
+        output.flush()
+        checkpoint.save(output.tell())
+        output.close()
+        await aclose_http_clients()
+
+    elapsed = time.perf_counter() - started_at
+    processed = counts["ok"] + counts["error"] + counts["retryable"]
+    report = {
+        "processed": processed,
+        "errors": counts["error"],
+        "retryable": counts["retryable"],
+        "elapsed_s": round(elapsed, 2),
+        "throughput_rps": round(processed / elapsed, 2) if elapsed else 0.0,
+        "latency": summarize(latencies),
+    }
+    print(json.dumps(report, indent=2))
+    return 1 if counts["error"] or counts["retryable"] else 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run JSONL generate requests in bulk.")
+    parser.add_argument("input", help="Input JSONL file with prompt/query/context objects.")
+    parser.add_argument("--output", required=True, help="Output JSONL file; results are appended.")
+    parser.add_argument("--checkpoint", help="Checkpoint file (default: <output>.checkpoint).")
+    parser.add_argument("--checkpoint-every", type=int, default=100, help="Save the checkpoint every N results.")
+    parser.add_argument("--provider", choices=PROVIDERS, default="openai")
+    parser.add_argument("--model-name", help="The model name (not used for Azure).")
+    parser.add_argument("--temperature", type=float, default=0)
+    parser.add_argument("--concurrency", type=int, default=8, help="Number of requests in flight.")
+    parser.add_argument("--no-cache", action="store_true", help="Bypass the response cache.")
+    parser.add_argument("--timeout", type=float, default=None,
+                        help="Seconds each line may take (default and maximum: LLM_REQUEST_TIMEOUT).")
+    parser.add_argument("--api-key", help="API key (defaults to OPENAI_API_KEY, GOOGLE_API_KEY or AZURE_OPENAI_API_KEY).")
+    parser.add_argument("--azure-endpoint")
+    parser.add_argument("--api-version")
+    parser.add_argument("--azure-deployment")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(run(parse_args())))
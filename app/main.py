@@ -1,13 +1,60 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from router import llm_openai, llm_azure, llm_gemini
+from router import llm_openai, llm_azure, llm_gemini, llm_batch, llm_generate, llm_websocket, contexts, metrics
+from utils.deadlines import REQUEST_TIMEOUT, DeadlineMiddleware
+from utils.fast_drivers import aclose_http_clients
+from utils.metrics import EndpointLabelMiddleware
+from utils.providers import ENABLED_PROVIDERS, PRELOAD_PROVIDERS, preload_providers, provider_report, rss_bytes
+from utils.tracing import TracingMiddleware, profiler, trace_log
 import uvicorn
 
-app = FastAPI(title="FastAPI App")
 
-app.include_router(llm_openai.router)
-app.include_router(llm_azure.router)
-app.include_router(llm_gemini.router)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if PRELOAD_PROVIDERS:
+        preload_providers()
+    # Startup report: what each provider costs this worker (SDKs load on first use unless preloaded)
+    print(f"Worker RSS at startup: {rss_bytes() / 2**20:.1f} MiB")
+    for provider, report in provider_report().items():
+        if not report["enabled"]:
+            status = "disabled"
+        elif report["fast_path"]:
+            status = "fast path, no SDK"
+        elif report["loaded"]:
+            status = f"SDK imported in {report['import_ms']:.0f} ms, +{report['rss_bytes'] / 2**20:.1f} MiB"
+        else:
+            status = "SDK loads on first use"
+        print(f"Provider {provider}: {status}")
+    print(f"Request timeout: {f'{REQUEST_TIMEOUT:g}s' if REQUEST_TIMEOUT > 0 else 'none'}")
+    if trace_log is not None:
+        print(f"Trace log: {trace_log.path} (sample rate {trace_log.sample_rate})")
+    if profiler.enabled:
+        profiler.start(asyncio.get_running_loop())
+        print(f"Profiler: keeping the {profiler.slowest} slowest requests")
+    yield
+    await aclose_http_clients()
+    profiler.stop()
+    if trace_log is not None:
+        trace_log.close()
+
+
+app = FastAPI(title="FastAPI App", lifespan=lifespan)
+app.add_middleware(EndpointLabelMiddleware)
+app.add_middleware(DeadlineMiddleware)
+# Outermost, so the request's total time covers the other middleware too
+app.add_middleware(TracingMiddleware)
+
+# Only the routes of the providers enabled by LLM_PROVIDERS
+provider_routers = {"openai": llm_openai.router, "azure": llm_azure.router, "gemini": llm_gemini.router}
+for provider in ENABLED_PROVIDERS:
+    app.include_router(provider_routers[provider])
+app.include_router(llm_batch.router)
+app.include_router(llm_generate.router)
+app.include_router(llm_websocket.router)
+app.include_router(contexts.router)
+app.include_router(metrics.router)
 
 if __name__ == "__main__":
     # Run the FastAPI app using Uvicorn
-    uvicorn.run(app, host="127.0.0.1", port=8000)
\ No newline at end of file
+    uvicorn.run(app, host="127.0.0.1", port=8000)
@@ -0,0 +1,119 @@
+import time
+from typing import Any, Callable, Optional
+
+from fastapi.responses import JSONResponse
+from utils.admission import status_code_for
+from utils.context_store import get_context_store
+from utils.deadlines import RequestRejected, rejection_headers
+from utils.generation import GenerationRequest, generate, open_stream
+from utils.providers import ProviderTarget
+from utils.streaming import streaming_response
+from utils.tracing import mark_parsed, span
+
+
+async def resolve_context(context: str, context_id: Optional[str]) -> str:
+    """
+    Return the stored context for `context_id`, or the inline `context` when no ID is given.
+
+    Raises:
+        ContextNotFound: When the ID is unknown.
+    """
+    if not context_id:
+        return context
+    with span("context"):
+        return await get_context_store().require(context_id)
+
+
+def error_response(error: Exception):
+    """
+    Return the error body of the generate endpoints.
+
+    Requests turned away (shed, or past their deadline) get a real 503/504 status
+    with Retry-After; other errors keep the legacy 200 body.
+    """
+    body = {"statusCode": status_code_for(error), "message": str(error)}
+    if isinstance(error, RequestRejected):
+        return JSONResponse(status_code=body["statusCode"], content=body, headers=rejection_headers(error))
+    return body
+
+
+def context_fit_fields(request: GenerationRequest) -> dict:
+    """
+    Return the `context_fit` response field of a request fitted to a token budget.
+    """
+    if request.context_fit is None:
+        return {}
+    return {"context_fit": request.context_fit.as_dict()}
+
+
+def context_fit_headers(request: GenerationRequest) -> dict:
+    """
+    Return the context budget headers of a streamed response.
+    """
+    if request.context_fit is None:
+        return {}
+    return {
+        "X-Context-Tokens": str(request.context_fit.tokens),
+        "X-Context-Tokens-Removed": str(request.context_fit.tokens_removed),
+    }
+
+
+async def generate_endpoint_response(
+    target: ProviderTarget,
+    prompt: str,
+    query: str,
+    context: str,
+    streaming: bool,
+    cache: bool,
+    priority: int = 0,
+    format_result: Optional[Callable[[str], Any]] = None,
+    format_chunk: Optional[Callable[[str], str]] = None,
+    stream_format: str = "text",
+    context_id: Optional[str] = None,
+    context_token_budget: Optional[int] = None,
+):
+    """
+    Shared body of the per-provider generate endpoints.
+
+    Args:
+        target (ProviderTarget): The provider, credentials and model.
+        prompt (str): The system prompt to guide the AI.
+        query (str): The user's query or input.
+        context (str): Additional context for the query.
+        streaming (bool): Whether to stream the response.
+        cache (bool): Whether the response cache may be used.
+        priority (int): Admission priority, higher first.
+        format_result (callable): Shapes the full response for providers with a legacy format.
+        format_chunk (callable): Shapes each streamed chunk of the `text` format for providers with a legacy format.
+        stream_format (str): Wire format of the stream: `text`, `sse` or `ndjson`.
+        context_id (str): ID of a stored context, used instead of `context`.
+        context_token_budget (int): Context tokens allowed; None for the configured default, 0 for no limit.
+
+    Returns:
+        A StreamingResponse in streaming mode, otherwise the response dictionary.
+    """
+    started = time.perf_counter()
+    mark_parsed()
+    context = await resolve_context(context, context_id)
+    with span("client"):
+        chat = target.build_chat()
+    request = target.generation_request(prompt, query, context, use_cache=cache, priority=priority,
+                                        context_id=context_id, context_budget=context_token_budget)
+    if streaming:
+        # Streaming mode: Use a generator wrapped in StreamingResponse
+        chunks, cached = await open_stream(chat, request)
+        headers = {"X-Cache": "HIT" if cached else "MISS"}
+        headers.update(context_fit_headers(request))
+        return streaming_response(
+            chunks, stream_format,
+            headers=headers,
+            prompt_tokens=request.estimated_tokens(), started=started, cached=cached,
+            format_chunk=format_chunk,
+            extra=context_fit_fields(request)
+        )
+
+    # Non-streaming mode: Return the full response
+    result, cached = await generate(chat, request)
+    if format_result is not None:
+        result = format_result(result)
+    return {"response": result, "cached": cached, **context_fit_fields(request)}
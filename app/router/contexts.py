@@ -0,0 +1,68 @@
+from fastapi import APIRouter, HTTPException, Request
+from utils.context_store import ENCODINGS, ContextStoreError, get_context_store
+
+router = APIRouter()
+
+
+async def _read_body(request: Request, limit: int) -> bytes:
+    # Stops reading as soon as the body is too large, instead of buffering all of it
+    length = request.headers.get("content-length")
+    if length is not None and length.isdigit() and int(length) > limit:
+        raise HTTPException(status_code=413, detail=f"Upload exceeds {limit} bytes")
+    chunks = []
+    received = 0
+    async for chunk in request.stream():
+        received += len(chunk)
+        if received > limit:
+            raise HTTPException(status_code=413, detail=f"Upload exceeds {limit} bytes")
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+@router.post("/contexts")
+async def upload_context(request: Request):
+    """
+    Endpoint to upload a context once and reference it by ID in generate calls.
+
+    The request body is the raw UTF-8 context text. It may be compressed, in which case
+    `Content-Encoding` is `gzip` or `zstd`.
+
+    Returns:
+    - The `context_id` (hex SHA-256 of the text) to send instead of `context`, and its size.
+    """
+    encoding = request.headers.get("content-encoding", "identity").strip().lower() or "identity"
+    if encoding not in ENCODINGS:
+        raise HTTPException(status_code=415, detail=f"Unsupported content encoding: {encoding}")
+    store = get_context_store()
+    body = await _read_body(request, store.max_body_bytes(encoding))
+    try:
+        context_id, size = await store.aput(body, encoding)
+    except ContextStoreError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    return {"context_id": context_id, "size": size}
+
+
+@router.get("/contexts/{context_id}")
+async def get_context(context_id: str):
+    """
+    Endpoint to check whether a context is stored.
+
+    Returns:
+    - The `context_id` and its size, or 404 when it is unknown (or was evicted).
+    """
+    size = get_context_store().size(context_id)
+    if size is None:
+        raise HTTPException(status_code=404, detail=f"Unknown context_id: {context_id}")
+    return {"context_id": context_id, "size": size}
+
+
+@router.delete("/contexts/{context_id}")
+async def delete_context(context_id: str):
+    """
+    Endpoint to remove a stored context.
+    """
+    store = get_context_store()
+    if store.size(context_id) is None:
+        raise HTTPException(status_code=404, detail=f"Unknown context_id: {context_id}")
+    await store.adelete(context_id)
+    return {"context_id": context_id, "deleted": True}
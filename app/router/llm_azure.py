@@ -1,9 +1,11 @@
+from typing import Literal, Optional
+
 from fastapi import APIRouter
 from fastapi import APIRouter, HTTPException, Query, Body 
-from fastapi.responses import StreamingResponse
-from utils.openai_utils import OpenAIChat
+from router.common import error_response, generate_endpoint_response
+from utils.providers import ProviderTarget
 
-from utils.llm_auth_utils import validate_azure_api_key
+from utils.llm_auth_utils import credential_validator
 router = APIRouter()
 
 @router.get("/azure/authenticate")
@@ -28,7 +30,7 @@ async def authenticate_openai(
     - A confirmation if azure is correct or not.
     """
     if azure_endpoint and api_key and api_version and azure_deployment:
-        return validate_azure_api_key({
+        return await credential_validator.validate("azure", {
         "azure_endpoint": azure_endpoint,
         "api_key": api_key,
         "api_version": api_version,
@@ -48,6 +50,11 @@ async def generate_response(
     context: str = Body( description="Additional context for the query.", default= "Chess is the best sport in the world"),
     streaming: bool = Body(False, description="Enable or disable streaming mode."),
     api_key: dict = Body({"azure_endpoint":"","api_key":"","api_version":"","azure_deployment":""}, description="The correct Azure Key."),
+    cache: bool = Body(True, description="Use the response cache for deterministic requests."),
+    priority: int = Body(0, description="Higher priorities are admitted first when the provider key is saturated."),
+    stream_format: Literal["text", "sse", "ndjson"] = Body("text", description="Streaming wire format: raw text, Server-Sent Events or NDJSON."),
+    context_id: Optional[str] = Body(None, description="ID of a context uploaded to /contexts, used instead of `context`."),
+    context_token_budget: Optional[int] = Body(None, description="Context tokens allowed; the context is trimmed to the chunks most relevant to the query. Defaults to LLM_CONTEXT_TOKEN_BUDGET, 0 disables trimming.")
 ):
     """
     Endpoint to generate a response using Azure via LangChain.
@@ -59,20 +66,10 @@ async def generate_response(
         # if key_valid["statusCode"]!=200:
         #     return key_valid
         
-        # Initialize Azure instance and authenticate
-        openai_chat = OpenAIChat(api_key=api_key)
-        if streaming:
-            # Streaming mode: Use a generator wrapped in StreamingResponse
-            response_generator = openai_chat.generate_response(prompt, query, context, streaming=True)
-            return StreamingResponse(
-                response_generator, media_type="text/plain"
-            )
-        else:
-            # Non-streaming mode: Return the full response
-            result = openai_chat.generate_response(prompt, query, context, streaming=False)
-            return {"response": result}
+        # Initialize Azure instance and generate
+        target = ProviderTarget(provider="azure", api_key=api_key)
+        return await generate_endpoint_response(target, prompt, query, context, streaming, cache, priority,
+                                                stream_format=stream_format, context_id=context_id,
+                                                context_token_budget=context_token_budget)
     except Exception as e:
-        return {
-            "statusCode": 500,
-            "message": str(e) 
-        }
\ No newline at end of file
+        return error_response(e)
\ No newline at end of file
@@ -0,0 +1,109 @@
+import asyncio
+import json
+import os
+from typing import List, Optional, Union
+
+from fastapi import APIRouter, HTTPException, Body
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from router.common import context_fit_fields, resolve_context
+from utils.admission import status_code_for
+from utils.deadlines import current_timeout, deadline_scope
+from utils.generation import generate
+from utils.providers import ENABLED_PROVIDERS, PROVIDERS, ProviderTarget
+from utils.tracing import mark_parsed, span
+
+router = APIRouter()
+
+DEFAULT_BATCH_CONCURRENCY = int(os.getenv("LLM_BATCH_CONCURRENCY", "16"))
+
+# One limit per provider, shared by every batch running in this process
+_provider_limits = {
+    provider: asyncio.Semaphore(
+        int(os.getenv(f"LLM_BATCH_CONCURRENCY_{provider.upper()}", DEFAULT_BATCH_CONCURRENCY))
+    )
+    for provider in PROVIDERS
+}
+
+
+class BatchItem(BaseModel):
+    prompt: str = "You have to answer the query by using or without using context"
+    query: str
+    context: str = ""
+    context_id: Optional[str] = None
+
+
+async def _run_item(provider: str, index: int, item: BatchItem, api_key, model_name, temperature, cache,
+                    context_token_budget) -> dict:
+    async with _provider_limits[provider]:
+        # Each item gets the request's budget from when it starts, not what is left of it
+        with deadline_scope(current_timeout.get(), detached=True):
+            try:
+                target = ProviderTarget(provider=provider, api_key=api_key, model_name=model_name,
+                                        temperature=temperature)
+                context = await resolve_context(item.context, item.context_id)
+                request = target.generation_request(item.prompt, item.query, context, use_cache=cache,
+                                                    context_id=item.context_id, context_budget=context_token_budget)
+                with span("client"):
+                    chat = target.build_chat()
+                result, cached = await generate(chat, request)
+                return {"index": index, "response": result, "cached": cached, **context_fit_fields(request)}
+            except Exception as e:
+                # One failing item must not fail the rest of the batch
+                return {"index": index, "statusCode": status_code_for(e), "message": str(e)}
+
+
+async def _stream_results(provider: str, items: List[BatchItem], api_key, model_name, temperature, cache,
+                          context_token_budget):
+    tasks = [
+        asyncio.ensure_future(_run_item(provider, index, item, api_key, model_name, temperature, cache,
+                                        context_token_budget))
+        for index, item in enumerate(items)
+    ]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            yield json.dumps(await finished, ensure_ascii=False) + "\n"
+    finally:
+        # The client went away or the response was aborted, stop the remaining work
+        for task in tasks:
+            task.cancel()
+
+
+@router.post("/{provider}/generate/batch")
+async def generate_batch(
+    provider: str,
+    items: List[BatchItem] = Body(..., description="The prompt/query/context items to generate."),
+    api_key: Union[str, dict] = Body(..., description="The provider API key (the credential dictionary for Azure)."),
+    model_name: Optional[str] = Body(None, description="The model name (not used for Azure)."),
+    temperature: float = Body(0, description="Enter the temperature"),
+    cache: bool = Body(True, description="Use the response cache for deterministic (temperature 0) requests."),
+    context_token_budget: Optional[int] = Body(None, description="Context tokens allowed per item. Defaults to LLM_CONTEXT_TOKEN_BUDGET, 0 disables trimming.")
+):
+    """
+    Endpoint to generate responses for many items in one call.
+
+    Items run concurrently under a per-provider concurrency limit. Each result is
+    streamed back as one NDJSON line, tagged with the index of its item, as soon
+    as it finishes. The request timeout applies to each item, not the whole batch.
+    """
+    mark_parsed()
+    if provider not in ENABLED_PROVIDERS:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Unknown or disabled provider: {provider}"
+        )
+    if provider == "azure" and not isinstance(api_key, dict):
+        raise HTTPException(
+            status_code=400,
+            detail="Azure requires the credential dictionary as api_key."
+        )
+    if provider != "azure" and not model_name:
+        raise HTTPException(
+            status_code=400,
+            detail="model_name is required."
+        )
+
+    return StreamingResponse(
+        _stream_results(provider, items, api_key, model_name, temperature, cache, context_token_budget),
+        media_type="application/x-ndjson"
+    )
@@ -1,7 +1,12 @@
+import json
+from typing import Literal, Optional
+
 from fastapi import APIRouter, HTTPException, Query, Body
-from fastapi.responses import StreamingResponse
-from utils.gemini_utils import GeminiChat  # Assume this is the custom module for Gemini
-from utils.llm_auth_utils import validate_gemini_api_key  # Custom validation method for Gemini API
+from router.common import generate_endpoint_response
+from utils.admission import status_code_for
+from utils.deadlines import rejection_headers
+from utils.providers import ProviderTarget
+from utils.llm_auth_utils import credential_validator  # Cached validation for Gemini API keys
 
 router = APIRouter()
 
@@ -17,8 +22,8 @@ async def authenticate_gemini(api_key: str = Query(..., description="Enter your
     - A confirmation if the Gemini API key is valid or not.
     """
     if api_key:
-        # Assuming validate_gemini_api_key validates the API key for Gemini
-        return validate_gemini_api_key(api_key)
+        # Cached and deduplicated validation of the Gemini API key
+        return await credential_validator.validate("gemini", api_key)
     else:
         raise HTTPException(
             status_code=400,
@@ -33,7 +38,12 @@ async def generate_response(
     streaming: bool = Body(False, description="Enable or disable streaming mode."),
     api_key: str = Body(..., description="The correct Google Gemini API key."),
     temperature: str = Body(0, description="Enter the temperature"),
-    model_name: str = Body(..., description=" the Model name")
+    model_name: str = Body(..., description=" the Model name"),
+    cache: bool = Body(True, description="Use the response cache for deterministic (temperature 0) requests."),
+    priority: int = Body(0, description="Higher priorities are admitted first when the provider key is saturated."),
+    stream_format: Literal["text", "sse", "ndjson"] = Body("text", description="Streaming wire format: raw text, Server-Sent Events or NDJSON."),
+    context_id: Optional[str] = Body(None, description="ID of a context uploaded to /contexts, used instead of `context`."),
+    context_token_budget: Optional[int] = Body(None, description="Context tokens allowed; the context is trimmed to the chunks most relevant to the query. Defaults to LLM_CONTEXT_TOKEN_BUDGET, 0 disables trimming.")
 ):
     """
     Endpoint to generate a response using Google Gemini via a custom utility class.
@@ -44,24 +54,22 @@ async def generate_response(
         # if key_valid["statusCode"] != 200:
         #     return key_valid
         
-        # Initialize GeminiChat instance and authenticate
-        gemini_chat = GeminiChat(api_key=api_key, model_name=model_name, temperature=temperature)
-        
-        if streaming:
-            # Streaming mode: Use a generator wrapped in StreamingResponse
-            response_generator = gemini_chat.generate_response(prompt, query, context, streaming=True)
-            return StreamingResponse(
-                response_generator, media_type="text/plain"
-            )
-        else:
-            # Non-streaming mode: Return the full response
-            result = gemini_chat.generate_response(prompt, query, context, streaming=False)
-            print(result)
-            return {"response": result}
+        # Initialize GeminiChat instance and generate
+        target = ProviderTarget(provider="gemini", api_key=api_key, model_name=model_name, temperature=temperature)
+        return await generate_endpoint_response(
+            target, prompt, query, context, streaming, cache, priority,
+            format_result=lambda result: {"status":200,"message":result},
+            # One JSON object per line in the plain text format
+            format_chunk=lambda chunk: json.dumps({"status":200,"message":chunk}) + "\n",
+            stream_format=stream_format,
+            context_id=context_id,
+            context_token_budget=context_token_budget
+        )
     
     except Exception as e:
         # Return a generic error message
         raise HTTPException(
-            status_code=500,
-            detail=f"An error occurred: {str(e)}"
+            status_code=status_code_for(e),
+            detail=f"An error occurred: {str(e)}",
+            headers=rejection_headers(e) or None
         )
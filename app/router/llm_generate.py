@@ -0,0 +1,101 @@
+import time
+from contextlib import aclosing
+from typing import List, Literal, Optional
+
+from fastapi import APIRouter, HTTPException, Body
+from fastapi.responses import JSONResponse
+from router.common import context_fit_fields, context_fit_headers, resolve_context
+from utils.context_store import ContextNotFound
+from utils.hedging import AllTargetsFailed, hedged_generate
+from utils.providers import ENABLED_PROVIDERS, ProviderTarget
+from utils.streaming import streaming_response
+from utils.tracing import mark_parsed, set_attributes
+
+router = APIRouter()
+
+
+async def _continue_stream(first_chunk: str, chunks):
+    async with aclosing(chunks):
+        if first_chunk:
+            yield first_chunk
+        async for chunk in chunks:
+            yield chunk
+
+
+@router.post("/generate")
+async def generate_response(
+    targets: List[ProviderTarget] = Body(..., description="Provider targets in order of preference."),
+    prompt: str = Body(description="The system prompt to guide the AI.", default="You have to answer the query by using or without using context"),
+    query: str = Body(description="The user's query or input.", default="Who is Magnus Carlson"),
+    context: str = Body(description="Additional context for the query.", default="Chess is the best sport in the world"),
+    streaming: bool = Body(False, description="Enable or disable streaming mode."),
+    cache: bool = Body(True, description="Use the response cache for deterministic (temperature 0) requests."),
+    hedge: bool = Body(True, description="Start the next target when the current one is slow to produce a first token."),
+    hedge_after_ms: Optional[float] = Body(None, description="Hedging threshold in milliseconds; defaults to the observed p95 time to first token."),
+    priority: int = Body(0, description="Higher priorities are admitted first when a provider key is saturated."),
+    stream_format: Literal["text", "sse", "ndjson"] = Body("text", description="Streaming wire format: raw text, Server-Sent Events or NDJSON."),
+    context_id: Optional[str] = Body(None, description="ID of a context uploaded to /contexts, used instead of `context`. The same ID works for every provider."),
+    context_token_budget: Optional[int] = Body(None, description="Context tokens allowed; the context is trimmed to the chunks most relevant to the query. Defaults to LLM_CONTEXT_TOKEN_BUDGET, 0 disables trimming."),
+):
+    """
+    Provider-agnostic endpoint to generate a response.
+
+    Targets are tried in order. A target that fails is replaced by the next one, and
+    with hedging enabled a target that is slow to produce its first token is raced
+    against the next one; the first answer wins.
+    """
+    started = time.perf_counter()
+    mark_parsed()
+    for target in targets:
+        if target.provider not in ENABLED_PROVIDERS:
+            raise HTTPException(status_code=400, detail=f"Unknown or disabled provider: {target.provider}")
+    if not targets:
+        raise HTTPException(status_code=400, detail="At least one target is required.")
+
+    try:
+        context = await resolve_context(context, context_id)
+    except ContextNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+    try:
+        winner = await hedged_generate(targets, prompt, query, context, streaming=streaming,
+                                       use_cache=cache, hedge=hedge, hedge_after_ms=hedge_after_ms,
+                                       priority=priority, context_id=context_id,
+                                       context_budget=context_token_budget)
+    except AllTargetsFailed as e:
+        # Every target shed, or out of time: say so, so callers back off
+        statuses = {error["statusCode"] for error in e.errors}
+        status = statuses.pop() if statuses in ({503}, {504}) else 502
+        return JSONResponse(status_code=status, content={
+            "statusCode": status,
+            "message": str(e),
+            "errors": e.errors
+        })
+
+    target = targets[winner.target_index]
+    set_attributes(provider=target.provider, model=winner.request.model_name, attempts=winner.attempts)
+    if streaming:
+        first_chunk, chunks, cached = winner.result
+        headers = {
+            "X-Provider": target.provider,
+            "X-Cache": "HIT" if cached else "MISS",
+            "X-Attempts": str(winner.attempts)
+        }
+        headers.update(context_fit_headers(winner.request))
+        return streaming_response(
+            _continue_stream(first_chunk, chunks), stream_format,
+            headers=headers,
+            prompt_tokens=winner.request.estimated_tokens(), started=started, cached=cached,
+            extra={"provider": target.provider, "attempts": winner.attempts, **context_fit_fields(winner.request)}
+        )
+
+    result, cached = winner.result
+    return {
+        "response": result,
+        "provider": target.provider,
+        "model_name": target.model_name,
+        "cached": cached,
+        "attempts": winner.attempts,
+        "errors": winner.errors,
+        **context_fit_fields(winner.request)
+    }
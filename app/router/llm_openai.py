@@ -1,9 +1,11 @@
+from typing import Literal, Optional
+
 from fastapi import APIRouter
 from fastapi import APIRouter, HTTPException, Query, Body 
-from fastapi.responses import StreamingResponse
-from utils.openai_utils import OpenAIChat
+from router.common import error_response, generate_endpoint_response
+from utils.providers import ProviderTarget
 
-from utils.llm_auth_utils import validate_openai_api_key
+from utils.llm_auth_utils import credential_validator
 router = APIRouter()
 
 @router.get("/openai/authenticate")
@@ -18,7 +20,7 @@ async def authenticate_openai(api_key: str = Query(..., description="Enter your
     - A confirmation if openai is correct or not.
     """
     if api_key:
-        return validate_openai_api_key(api_key)
+        return await credential_validator.validate("openai", api_key)
     else:
         return {
             "error": "API key is required to authenticate OpenAI API.",
@@ -34,7 +36,12 @@ async def generate_response(
     streaming: bool = Body(False, description="Enable or disable streaming mode."),
     api_key: str = Body(..., description="The correct Openai Key."),
     model_name: str = Body(..., description="Enter the model name"),
-    temperature: float = Body(0,description="Enter the temperature")
+    temperature: float = Body(0,description="Enter the temperature"),
+    cache: bool = Body(True, description="Use the response cache for deterministic (temperature 0) requests."),
+    priority: int = Body(0, description="Higher priorities are admitted first when the provider key is saturated."),
+    stream_format: Literal["text", "sse", "ndjson"] = Body("text", description="Streaming wire format: raw text, Server-Sent Events or NDJSON."),
+    context_id: Optional[str] = Body(None, description="ID of a context uploaded to /contexts, used instead of `context`."),
+    context_token_budget: Optional[int] = Body(None, description="Context tokens allowed; the context is trimmed to the chunks most relevant to the query. Defaults to LLM_CONTEXT_TOKEN_BUDGET, 0 disables trimming.")
 ):
     """
     Endpoint to generate a response using OpenAI via LangChain.
@@ -46,20 +53,10 @@ async def generate_response(
         # if key_valid["statusCode"]!=200:
         #     return key_valid
         
-        # Initialize OpenAIChat instance and authenticate
-        openai_chat = OpenAIChat(api_key=api_key,model_name=model_name, temperature=temperature)
-        if streaming:
-            # Streaming mode: Use a generator wrapped in StreamingResponse
-            response_generator = openai_chat.generate_response(prompt, query, context, streaming=True)
-            return StreamingResponse(
-                response_generator, media_type="text/plain"
-            )
-        else:
-            # Non-streaming mode: Return the full response
-            result = openai_chat.generate_response(prompt, query, context, streaming=False)
-            return {"response": result}
+        # Initialize OpenAIChat instance and generate
+        target = ProviderTarget(provider="openai", api_key=api_key, model_name=model_name, temperature=temperature)
+        return await generate_endpoint_response(target, prompt, query, context, streaming, cache, priority,
+                                                stream_format=stream_format, context_id=context_id,
+                                                context_token_budget=context_token_budget)
     except Exception as e:
-        return {
-            "statusCode": 500,
-            "message": str(e) 
-        }
\ No newline at end of file
+        return error_response(e)
\ No newline at end of file
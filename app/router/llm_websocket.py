@@ -0,0 +1,203 @@
+import asyncio
+import json
+import os
+import time
+from contextlib import aclosing
+from typing import Optional
+
+from fastapi import APIRouter, WebSocket
+from pydantic import Field, ValidationError
+from router.common import context_fit_fields, resolve_context
+from utils.admission import status_code_for
+from utils.deadlines import deadline_scope, parse_timeout_ms
+from utils.generation import generate, open_stream
+from utils.metrics import websocket_connections, websocket_rejected_total
+from utils.providers import ENABLED_PROVIDERS, ProviderTarget
+from utils.streaming import stream_frames, trace_frame
+from utils.tracing import request_trace, span
+
+# Generations one connection may run at the same time
+WS_MAX_CONCURRENT = int(os.getenv("LLM_WS_MAX_CONCURRENT", "16"))
+
+router = APIRouter()
+
+
+class WebSocketGenerate(ProviderTarget):
+    """
+    A `generate` message: a provider target plus the request, tagged with the
+    client's request ID.
+    """
+    id: str
+    prompt: str = "You have to answer the query by using or without using context"
+    query: str
+    context: str = ""
+    context_id: Optional[str] = None
+    context_token_budget: Optional[int] = None
+    streaming: bool = True
+    cache: bool = True
+    priority: int = 0
+    # Budget in milliseconds, like the X-Request-Timeout-Ms header of HTTP requests
+    timeout_ms: Optional[float] = Field(None, allow_inf_nan=False)
+
+
+class _Connection:
+    def __init__(self, websocket: WebSocket, max_concurrent: int):
+        """
+        The generations running on one WebSocket, keyed by request ID.
+
+        Every frame goes through `send`, so frames of concurrent generations are
+        interleaved whole, and a generation waits while the socket is busy.
+        """
+        self.websocket = websocket
+        self.max_concurrent = max_concurrent
+        self.tasks = {}
+        self.closed = False
+        self._send_lock = asyncio.Lock()
+
+    async def send(self, kind: str, request_id: Optional[str], data: Optional[dict] = None) -> bool:
+        """
+        Send one frame; returns False once the client is gone.
+        """
+        if self.closed:
+            return False
+        try:
+            async with self._send_lock:
+                await self.websocket.send_text(json.dumps({"type": kind, "id": request_id, **(data or {})}))
+            return True
+        except Exception:
+            # The other end went away; the receive loop cancels the rest
+            self.closed = True
+            return False
+
+    async def reject(self, request_id: Optional[str], status_code: int, message: str, reason: str, **extra):
+        websocket_rejected_total.labels(reason).inc()
+        await self.send("error", request_id, {"statusCode": status_code, "message": message, **extra})
+
+    async def handle(self, raw: str):
+        try:
+            message = json.loads(raw)
+        except ValueError:
+            return await self.reject(None, 400, "Messages must be JSON objects.", "invalid")
+        if not isinstance(message, dict):
+            return await self.reject(None, 400, "Messages must be JSON objects.", "invalid")
+
+        kind = message.get("type", "generate")
+        request_id = message.get("id")
+        if kind == "cancel":
+            # The ID stays registered until the task has finished (see _forget), so it
+            # can't be reused while the cancelled task may still send frames under it
+            task = self.tasks.get(str(request_id))
+            # Cancelling a request that already finished (or is being cancelled) is not an error
+            if task is not None and not task.done() and not task.cancelling():
+                task.cancel()
+                await self.send("cancelled", str(request_id))
+            return
+        if kind != "generate":
+            return await self.reject(request_id, 400, f"Unknown message type: {kind}", "invalid")
+
+        try:
+            request = WebSocketGenerate.model_validate(message)
+        except ValidationError as e:
+            return await self.reject(request_id, 422, "Invalid generate message.", "invalid",
+                                     errors=e.errors(include_url=False, include_input=False))
+        if request.provider not in ENABLED_PROVIDERS:
+            return await self.reject(request.id, 400, f"Unknown or disabled provider: {request.provider}", "invalid")
+        if request.id in self.tasks:
+            return await self.reject(request.id, 409, "A request with this ID is already running.", "duplicate")
+        if len(self.tasks) >= self.max_concurrent:
+            return await self.reject(request.id, 429, f"At most {self.max_concurrent} requests may run on one connection.",
+                                     "concurrency")
+
+        task = asyncio.ensure_future(self._run(request))
+        self.tasks[request.id] = task
+        task.add_done_callback(lambda _, request_id=request.id: self._forget(request_id, task))
+
+    def _forget(self, request_id: str, task: asyncio.Task):
+        if self.tasks.get(request_id) is task:
+            del self.tasks[request_id]
+
+    async def _run(self, request: WebSocketGenerate):
+        with request_trace("WS", self.websocket.url.path) as trace:
+            # 499: cancelled by the client, or the connection closed
+            status = 499
+            try:
+                with deadline_scope(parse_timeout_ms(request.timeout_ms)):
+                    status = await self._generate(request)
+            finally:
+                if trace is not None:
+                    trace.status = status
+                    trace.attributes["request_id"] = request.id
+
+    async def _generate(self, request: WebSocketGenerate) -> int:
+        started = time.perf_counter()
+        try:
+            context = await resolve_context(request.context, request.context_id)
+            with span("client"):
+                chat = request.build_chat()
+            generation = request.generation_request(request.prompt, request.query, context, use_cache=request.cache,
+                                                    priority=request.priority, context_id=request.context_id,
+                                                    context_budget=request.context_token_budget)
+            if not request.streaming:
+                result, cached = await generate(chat, generation)
+                await self.send("response", request.id,
+                                {"response": result, "cached": cached, **context_fit_fields(generation)})
+                await self._send_trailer(request.id)
+                return 200
+
+            chunks, cached = await open_stream(chat, generation)
+        except Exception as e:
+            status = status_code_for(e)
+            await self.send("error", request.id, {"statusCode": status, "message": str(e)})
+            await self._send_trailer(request.id)
+            return status
+
+        status = 200
+        frames = stream_frames(chunks, generation.estimated_tokens(), started, cached,
+                               {"provider": request.provider, **context_fit_fields(generation)})
+        async with aclosing(frames):
+            async for kind, data in frames:
+                if kind == "error":
+                    status = data["statusCode"]
+                if not await self.send(kind, request.id, data):
+                    break
+        return status
+
+    async def _send_trailer(self, request_id: str):
+        trailer = trace_frame()
+        if trailer:
+            await self.send(trailer[0], request_id, trailer[1])
+
+    async def close(self):
+        """
+        Cancel the running generations, releasing their upstream streams.
+        """
+        self.closed = True
+        tasks = list(self.tasks.values())
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.wait(tasks)
+
+
+@router.websocket("/generate/ws")
+async def generate_websocket(websocket: WebSocket):
+    """
+    WebSocket endpoint running many generations, for any enabled provider, over one connection.
+
+    The client sends `generate` messages (a provider target and the request fields
+    of the generate endpoints, tagged with its own `id`) and `cancel` messages. The
+    frames of concurrent generations are interleaved, each labelled with its `id`.
+    """
+    await websocket.accept()
+    connection = _Connection(websocket, WS_MAX_CONCURRENT)
+    gauge = websocket_connections.labels()
+    gauge.inc()
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            await connection.handle(message.get("text") or (message.get("bytes") or b"").decode("utf-8", "replace"))
+    finally:
+        gauge.dec()
+        await connection.close()
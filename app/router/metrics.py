@@ -0,0 +1,80 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import PlainTextResponse
+from utils.admission import admission_controller
+from utils.client_pool import get_client_registry
+from utils.context_store import get_context_store
+from utils.llm_auth_utils import credential_validator
+from utils.metrics import registry
+from utils.providers import provider_report
+from utils.response_cache import get_response_cache
+from utils.tracing import profiler
+
+router = APIRouter()
+
+
+def _cache_gauges() -> dict:
+    clients = get_client_registry().stats()
+    responses = get_response_cache().stats()
+    contexts = get_context_store().stats()
+    admission = admission_controller.stats().values()
+    return {
+        "llm_client_pool_size": clients["size"],
+        "llm_response_cache_bytes": responses["bytes"],
+        "llm_context_store_bytes": contexts["bytes"],
+        "llm_context_store_disk_bytes": contexts["disk_bytes"],
+        "llm_admission_in_flight": sum(key["in_flight"] for key in admission),
+        "llm_admission_queued": sum(key["queued"] for key in admission),
+    }
+
+
+def _cache_counters() -> dict:
+    clients = get_client_registry().stats()
+    responses = get_response_cache().stats()
+    auth = credential_validator.stats()
+    contexts = get_context_store().stats()
+    return {
+        "llm_client_pool_hits_total": clients["hits"],
+        "llm_client_pool_misses_total": clients["misses"],
+        "llm_client_pool_evictions_total": clients["evictions"],
+        "llm_response_cache_memory_hits_total": responses["memory_hits"],
+        "llm_response_cache_disk_hits_total": responses["disk_hits"],
+        "llm_response_cache_misses_total": responses["misses"],
+        "llm_context_store_memory_hits_total": contexts["memory_hits"],
+        "llm_context_store_disk_hits_total": contexts["disk_hits"],
+        "llm_context_store_misses_total": contexts["misses"],
+        "llm_auth_cache_hits_total": auth["hits"],
+        "llm_auth_cache_shared_hits_total": auth["shared_hits"],
+        "llm_auth_cache_misses_total": auth["misses"],
+    }
+
+
+registry.add_collector(_cache_gauges)
+registry.add_collector(_cache_counters, kind="counter")
+
+
+@router.get("/providers")
+async def providers():
+    """
+    Endpoint reporting which providers are enabled, and the import time and memory
+    of each provider SDK loaded so far.
+    """
+    return provider_report()
+
+
+@router.get("/debug/profiles")
+async def profiles(top: int = 30):
+    """
+    Endpoint returning the sampled stacks of the slowest requests, slowest first
+    (LLM_PROFILE_SLOWEST). Each stack is in the folded format flame graph tools read.
+    """
+    if not profiler.enabled:
+        raise HTTPException(status_code=404, detail="The profiler is disabled, set LLM_PROFILE_SLOWEST.")
+    return profiler.profiles(top)
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """
+    Endpoint exposing the service metrics in the Prometheus text format.
+    """
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
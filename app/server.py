@@ -0,0 +1,75 @@
+"""
+Production entry point: serves the app with several uvicorn worker processes.
+
+Workers share the listening socket. The supervisor restarts a worker that dies,
+replaces the workers one at a time on SIGHUP (each finishes its in-flight requests
+first), and adds or removes a worker on SIGTTIN / SIGTTOU. With more than one
+worker, the response cache and credential validations go through a shared SQLite
+store so every worker sees the others' entries.
+
+Usage:
+    cd app
+    python server.py --workers 4 --host 0.0.0.0 --port 8000
+"""
+import argparse
+import os
+import shutil
+
+import uvicorn
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run the service with several worker processes.")
+    parser.add_argument("--host", default=os.getenv("LLM_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("LLM_PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("LLM_WORKERS", str(os.cpu_count() or 1))),
+                        help="Worker processes.")
+    parser.add_argument("--graceful-timeout", type=float, default=float(os.getenv("LLM_GRACEFUL_TIMEOUT", "30")),
+                        help="Seconds a stopping worker may spend finishing its requests.")
+    parser.add_argument("--max-requests", type=int, default=int(os.getenv("LLM_WORKER_MAX_REQUESTS", "0")) or None,
+                        help="Recycle a worker after this many requests.")
+    parser.add_argument("--shared-store", default=os.getenv("LLM_SHARED_STORE_PATH"),
+                        help="SQLite file shared by the workers (a private temp file for this run by default "
+                             "with several workers).")
+    parser.add_argument("--log-level", default=os.getenv("LLM_LOG_LEVEL", "info"))
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    private_dirs = []
+    if args.shared_store is None and args.workers > 1:
+        # Imported lazily: the workers re-import everything in their own process
+        from utils.shared_store import private_store_path
+        args.shared_store = private_store_path()
+        private_dirs.append(os.path.dirname(args.shared_store))
+    if args.shared_store:
+        # Inherited by the worker processes, which read it on import
+        os.environ["LLM_SHARED_STORE_PATH"] = args.shared_store
+    if not os.getenv("LLM_CONTEXT_STORE_DIR"):
+        # One private directory for the run, so every worker sees every upload
+        from utils.context_store import private_context_dir
+        os.environ["LLM_CONTEXT_STORE_DIR"] = private_context_dir()
+        private_dirs.append(os.environ["LLM_CONTEXT_STORE_DIR"])
+
+    try:
+        uvicorn.run(
+            "main:app",
+            host=args.host,
+            port=args.port,
+            workers=args.workers,
+            app_dir=APP_DIR,
+            timeout_graceful_shutdown=args.graceful_timeout,
+            limit_max_requests=args.max_requests,
+            log_level=args.log_level,
+        )
+    finally:
+        # Entries of this run never outlive it
+        for path in private_dirs:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
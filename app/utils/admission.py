@@ -0,0 +1,477 @@
+import asyncio
+import heapq
+import itertools
+import os
+import random
+import re
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional
+
+from utils.client_pool import credential_hash
+from utils.deadlines import (
+    DeadlineExceeded, Overloaded, check_deadline, current_deadline, deadline_guard, remaining, stream_with_deadline,
+)
+from utils.metrics import model_label, queue_wait_seconds, requests_shed_total
+from utils.tracing import record_span, span
+
+
+# How much more load each priority level tolerates before it is shed (lower levels less)
+SHED_PRIORITY_STEP = float(os.getenv("LLM_SHED_PRIORITY_STEP", "0.5"))
+
+
+def _setting(name: str, provider: str, default: str) -> float:
+    # Per-provider override (e.g. LLM_RATE_LIMIT_RPM_OPENAI) falling back to the global value
+    return float(os.getenv(f"{name}_{provider.upper()}", os.getenv(name, default)))
+
+
+class AdmissionRejected(Exception):
+    """
+    Raised when a request cannot be queued because the admission queue is full.
+    """
+
+
+# Rate limiting spelled out in an error message, for errors without a status code
+_RATE_LIMIT_MESSAGE = re.compile(
+    r"\berror code: 429\b|^429\b|\brate limit|\bresource (?:has been )?exhausted|\bresourceexhausted", re.IGNORECASE
+)
+
+
+def is_rate_limited(error: BaseException) -> bool:
+    """
+    Return True when an upstream error means the provider is rate limiting us.
+    """
+    if isinstance(error, AdmissionRejected):
+        return True
+    for attr in ("status_code", "code"):
+        if getattr(error, attr, None) == 429:
+            return True
+    return _RATE_LIMIT_MESSAGE.search(str(error)) is not None
+
+
+def is_timeout(error: BaseException) -> bool:
+    """
+    Return True when an upstream error is a timeout.
+    """
+    return isinstance(error, (asyncio.TimeoutError, TimeoutError)) or "timeout" in type(error).__name__.lower()
+
+
+def status_code_for(error: BaseException) -> int:
+    """
+    Map an exception from the generate path to the status code reported to the caller.
+    """
+    if is_rate_limited(error):
+        return 429
+    if is_timeout(error):
+        return 504
+    status = getattr(error, "status_code", None)
+    return status if isinstance(status, int) and status >= 400 else 500
+
+
+def _retry_after(error: BaseException) -> Optional[float]:
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    def __init__(self, per_minute: float, burst: Optional[float] = None):
+        """
+        Token bucket refilled continuously at `per_minute` tokens per minute.
+
+        Args:
+            per_minute (float): Refill rate.
+            burst (float): Bucket capacity, one minute's worth by default.
+        """
+        self.rate = per_minute / 60.0
+        self.capacity = burst or per_minute
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_time(self, amount: float) -> float:
+        """
+        Return the seconds until `amount` tokens are available (0 when they are now).
+        """
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float):
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+
+class AdaptiveLimiter:
+    def __init__(self, initial: float, minimum: float, maximum: float, backoff: float = 0.5):
+        """
+        AIMD concurrency limit: grows by about one slot per limit's worth of successes
+        and is multiplied by `backoff` on every 429 or timeout.
+
+        Args:
+            initial (float): Starting limit.
+            minimum (float): Lowest limit.
+            maximum (float): Highest limit.
+            backoff (float): Multiplicative decrease factor.
+        """
+        self.limit = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.backoff = backoff
+        self.in_flight = 0
+
+    def has_capacity(self) -> bool:
+        return self.in_flight < max(1, int(self.limit))
+
+    def on_success(self):
+        self.limit = min(self.maximum, self.limit + 1.0 / max(self.limit, 1.0))
+
+    def on_overload(self):
+        self.limit = max(self.minimum, self.limit * self.backoff)
+
+
+class _KeyState:
+    def __init__(self, provider: str):
+        self.provider = provider
+        self.limiter = AdaptiveLimiter(
+            initial=_setting("LLM_CONCURRENCY_INITIAL", provider, "16"),
+            minimum=_setting("LLM_CONCURRENCY_MIN", provider, "1"),
+            maximum=_setting("LLM_CONCURRENCY_MAX", provider, "256"),
+        )
+        rpm = _setting("LLM_RATE_LIMIT_RPM", provider, "0")
+        tpm = _setting("LLM_RATE_LIMIT_TPM", provider, "0")
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.waiters = []
+        self.wakeup = None
+        # Load shedding thresholds (0 disables each signal)
+        self.shed_queue_depth = _setting("LLM_SHED_QUEUE_DEPTH", provider, "0")
+        self.shed_queue_wait = _setting("LLM_SHED_QUEUE_WAIT_MS", provider, "0") / 1000
+        # Moving average of how long a request holds its slot
+        self.service_time = None
+
+    def observe(self, held: float):
+        self.service_time = held if self.service_time is None else 0.8 * self.service_time + 0.2 * held
+
+    def estimated_wait(self, priority: int, tokens: float) -> float:
+        """
+        Estimate how long a new request of this priority would wait to start: the
+        requests queued ahead of it drain at `limit` per observed service time.
+        """
+        wait = self.wait_time(tokens)
+        if self.service_time is None:
+            return wait
+        limit = max(1, int(self.limiter.limit))
+        ahead = len(self._waiting_ahead(priority))
+        queued = ahead + 1 - (limit - self.limiter.in_flight)
+        if queued <= 0:
+            return wait
+        return max(wait, queued * self.service_time / limit)
+
+    def _waiting_ahead(self, priority: int) -> list:
+        # Live waiters dispatched before a new request of this priority; lower
+        # priorities and entries already cancelled or timed out don't delay it
+        return [entry for entry in self.waiters if -entry[0] >= priority and not entry[3].done()]
+
+    def oldest_wait(self, priority: int) -> float:
+        # How long the longest-waiting request ahead of this priority has been queued
+        ahead = self._waiting_ahead(priority)
+        if not ahead:
+            return 0.0
+        return time.monotonic() - min(entry[4] for entry in ahead)
+
+    def load(self, priority: int, estimated_wait: float) -> float:
+        """
+        Return the queue's load as seen by a new request of `priority`: 1.0 when the
+        depth or the latency (the oldest wait, or the estimated wait of the new
+        request) of the waiters ahead of it reaches the shedding threshold.
+        """
+        load = 0.0
+        if self.shed_queue_depth:
+            load = len(self._waiting_ahead(priority)) / self.shed_queue_depth
+        if self.shed_queue_wait:
+            load = max(load, max(estimated_wait, self.oldest_wait(priority)) / self.shed_queue_wait)
+        return load
+
+    def wait_time(self, tokens: float) -> float:
+        wait = 0.0
+        if self.requests is not None:
+            wait = max(wait, self.requests.wait_time(1))
+        if self.tokens is not None and tokens:
+            wait = max(wait, self.tokens.wait_time(tokens))
+        return wait
+
+    def start(self, tokens: float):
+        self.limiter.in_flight += 1
+        if self.requests is not None:
+            self.requests.consume(1)
+        if self.tokens is not None and tokens:
+            self.tokens.consume(tokens)
+
+
+class AdmissionController:
+    def __init__(self, queue_size: int = 1000, retries: int = 3, retry_base_delay: float = 0.5, retry_max_delay: float = 10.0,
+                 idle_ttl: float = 900.0):
+        """
+        Admission layer in front of upstream calls, keyed by (provider, credential).
+
+        A request starts when the key's adaptive concurrency limit has room and its
+        request/token buckets allow it. Otherwise it waits in a bounded queue ordered
+        by priority (higher first), then arrival. Rate-limited calls are retried with
+        jittered exponential backoff.
+
+        Before queueing, a request is turned away (Overloaded) when it can't start
+        before its deadline, or when the queue's load exceeds what its priority
+        tolerates. While queued and while running it is bounded by its deadline.
+
+        Args:
+            queue_size (int): Maximum number of waiting requests per key.
+            retries (int): Retries after a 429 from the provider.
+            retry_base_delay (float): Base backoff delay in seconds.
+            retry_max_delay (float): Maximum backoff delay in seconds.
+            idle_ttl (float): Seconds an unused key's state (learned limit, buckets)
+                is kept before it is dropped.
+        """
+        self.queue_size = queue_size
+        self.retries = retries
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.idle_ttl = idle_ttl
+        # Least recently used first, with the time each key was last used
+        self._states = OrderedDict()
+        self._sequence = itertools.count()
+
+    def _state(self, provider: str, credentials: Any) -> _KeyState:
+        now = time.monotonic()
+        self._evict_idle(now)
+        key = (provider, credential_hash(credentials))
+        entry = self._states.get(key)
+        if entry is None:
+            entry = self._states[key] = [_KeyState(provider), now]
+        else:
+            self._states.move_to_end(key)
+            entry[1] = now
+        return entry[0]
+
+    def _evict_idle(self, now: float):
+        # Entries are in LRU order, so the stale ones are all at the front; a stale
+        # key still running a long request (or with a wakeup pending) is kept
+        stale = []
+        for key, (state, last_used) in self._states.items():
+            if now - last_used < self.idle_ttl:
+                break
+            if not state.waiters and not state.limiter.in_flight and state.wakeup is None:
+                stale.append(key)
+        for key in stale:
+            del self._states[key]
+
+    def _shed(self, state: _KeyState, priority: int, tokens: float):
+        wait = state.estimated_wait(priority, tokens)
+        left = remaining()
+        if left is not None and wait >= left:
+            requests_shed_total.labels(state.provider, "deadline").inc()
+            raise Overloaded(f"Cannot start before the deadline: estimated queue wait {wait:.2f}s, "
+                             f"{max(left, 0):.2f}s left", retry_after=wait)
+        load = state.load(priority, wait)
+        if load >= max(0.1, 1 + SHED_PRIORITY_STEP * priority):
+            requests_shed_total.labels(state.provider, "overload").inc()
+            raise Overloaded(f"Shed under load (queue load {load:.2f}, priority {priority})",
+                             retry_after=max(wait, state.oldest_wait(priority)))
+
+    async def acquire(self, state: _KeyState, priority: int = 0, tokens: float = 0):
+        """
+        Wait until a request may start on `state`.
+
+        Raises:
+            AdmissionRejected: When the queue for this key is full.
+            Overloaded: When the request is shed instead of queued.
+            DeadlineExceeded: When the deadline passes before the request starts.
+        """
+        check_deadline("admission")
+        if not state.waiters and state.limiter.has_capacity() and state.wait_time(tokens) == 0:
+            state.start(tokens)
+            return
+        if len(state.waiters) >= self.queue_size:
+            raise AdmissionRejected("Too many requests queued for this provider key")
+        self._shed(state, priority, tokens)
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(state.waiters, (-priority, next(self._sequence), tokens, future, time.monotonic()))
+        self._dispatch(state)
+        try:
+            async with asyncio.timeout_at(current_deadline.get()):
+                await future
+        except (asyncio.CancelledError, TimeoutError) as e:
+            if future.done() and not future.cancelled():
+                # Admitted just as we were cancelled, hand the slot back
+                self.release(state, None)
+            if isinstance(e, TimeoutError):
+                raise DeadlineExceeded("Deadline exceeded while queued for admission") from None
+            raise
+
+    def release(self, state: _KeyState, success: Optional[bool], held: Optional[float] = None):
+        """
+        Mark a request as finished.
+
+        Args:
+            state (_KeyState): The key state returned with the admission.
+            success (bool): True on success, False on 429/timeout, None when neutral.
+            held (float): Seconds the request held its slot, for the wait estimates.
+        """
+        state.limiter.in_flight -= 1
+        if held is not None:
+            state.observe(held)
+        if success:
+            state.limiter.on_success()
+        elif success is False:
+            state.limiter.on_overload()
+        self._dispatch(state)
+
+    def _dispatch(self, state: _KeyState):
+        while state.waiters and state.limiter.has_capacity():
+            _, _, tokens, future, _ = state.waiters[0]
+            if future.done():
+                # The caller went away while queued
+                heapq.heappop(state.waiters)
+                continue
+            wait = state.wait_time(tokens)
+            if wait > 0:
+                if state.wakeup is None:
+                    state.wakeup = asyncio.get_running_loop().call_later(wait, self._wake, state)
+                return
+            heapq.heappop(state.waiters)
+            state.start(tokens)
+            future.set_result(None)
+
+    def _wake(self, state: _KeyState):
+        state.wakeup = None
+        self._dispatch(state)
+
+    def _backoff(self, attempt: int, error: BaseException) -> float:
+        retry_after = _retry_after(error)
+        if retry_after is not None:
+            return min(self.retry_max_delay, retry_after) + random.uniform(0, self.retry_base_delay)
+        # Full jitter keeps retries from synchronising into a storm
+        return random.uniform(0, min(self.retry_max_delay, self.retry_base_delay * 2 ** attempt))
+
+    @staticmethod
+    def _retry_fits(delay: float) -> bool:
+        # A retry that can't start before the deadline only delays the error
+        left = remaining()
+        return left is None or delay < left
+
+    async def _admit(self, state: _KeyState, provider: str, model_name: Optional[str], priority: int, tokens: float):
+        started = time.perf_counter()
+        await self.acquire(state, priority, tokens)
+        queue_wait_seconds.labels(provider, model_label(model_name)).observe(time.perf_counter() - started)
+        record_span("queue", started)
+
+    async def run(self, provider: str, credentials: Any, func: Callable[[], Awaitable[Any]],
+                  priority: int = 0, tokens: float = 0, model_name: Optional[str] = None) -> Any:
+        """
+        Run an upstream call under admission control, retrying on 429.
+
+        Args:
+            provider (str): The provider name.
+            credentials (str or dict): The credentials of the call.
+            func (callable): Coroutine function making the upstream call.
+            priority (int): Higher priorities leave the queue first.
+            tokens (float): Estimated tokens, charged to the tokens-per-minute bucket.
+            model_name (str): Model label for the queue wait metric.
+
+        Returns:
+            The result of `func`.
+        """
+        state = self._state(provider, credentials)
+        for attempt in range(self.retries + 1):
+            await self._admit(state, provider, model_name, priority, tokens)
+            admitted = time.monotonic()
+            try:
+                with span("upstream", provider=provider, attempt=attempt):
+                    async with deadline_guard("the upstream call"):
+                        result = await func()
+            except asyncio.CancelledError:
+                self.release(state, None)
+                raise
+            except Exception as e:
+                overloaded = is_rate_limited(e) or is_timeout(e)
+                self.release(state, False if overloaded else None)
+                if is_rate_limited(e) and attempt < self.retries:
+                    backoff = self._backoff(attempt, e)
+                    if self._retry_fits(backoff):
+                        with span("backoff"):
+                            await asyncio.sleep(backoff)
+                        continue
+                raise
+            self.release(state, True, time.monotonic() - admitted)
+            return result
+
+    async def stream(self, provider: str, credentials: Any, factory: Callable[[], AsyncIterator[str]],
+                     priority: int = 0, tokens: float = 0, model_name: Optional[str] = None) -> AsyncIterator[str]:
+        """
+        Stream an upstream response under admission control.
+
+        The slot is held until the stream ends. A 429 before the first chunk is retried
+        like in `run`; once chunks have been sent the error is raised. Waiting for a
+        chunk past the deadline raises DeadlineExceeded and closes the upstream.
+        """
+        state = self._state(provider, credentials)
+        for attempt in range(self.retries + 1):
+            await self._admit(state, provider, model_name, priority, tokens)
+            admitted = time.monotonic()
+            outcome = None
+            started = False
+            stream = stream_with_deadline(factory(), "the upstream stream")
+            try:
+                async for chunk in stream:
+                    started = True
+                    yield chunk
+                outcome = True
+                return
+            except Exception as e:
+                overloaded = is_rate_limited(e) or is_timeout(e)
+                outcome = False if overloaded else None
+                if started or not is_rate_limited(e) or attempt >= self.retries:
+                    raise
+                backoff = self._backoff(attempt, e)
+                if not self._retry_fits(backoff):
+                    raise
+            finally:
+                if outcome is not True:
+                    # Stop the upstream when the consumer goes away mid-stream
+                    await stream.aclose()
+                self.release(state, outcome, time.monotonic() - admitted if outcome else None)
+            with span("backoff"):
+                await asyncio.sleep(backoff)
+
+    def stats(self) -> dict:
+        """
+        Return the limit, in-flight and queued counts per provider key.
+        """
+        return {
+            f"{provider}:{key[:8]}": {
+                "limit": round(state.limiter.limit, 2),
+                "in_flight": state.limiter.in_flight,
+                "queued": len(state.waiters),
+            }
+            for (provider, key), (state, _) in self._states.items()
+        }
+
+
+admission_controller = AdmissionController(
+    queue_size=int(os.getenv("LLM_ADMISSION_QUEUE_SIZE", "1000")),
+    retries=int(os.getenv("LLM_RETRY_ATTEMPTS", "3")),
+    retry_base_delay=float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5")),
+    retry_max_delay=float(os.getenv("LLM_RETRY_MAX_DELAY", "10")),
+    idle_ttl=float(os.getenv("LLM_ADMISSION_IDLE_TTL", "900")),
+)
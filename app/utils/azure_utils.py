@@ -1,6 +1,9 @@
 from langchain.chat_models import AzureChatOpenAI
-from langchain.prompts.chat import ChatPromptTemplate
-from typing import Generator
+from contextlib import aclosing
+from typing import AsyncIterator, Generator
+from utils.client_pool import client_key, get_client_registry
+from utils.deadlines import remaining
+from utils.messages import build_messages
 
 class AzureChatOpenAIService:
     def __init__(self, api_key: dict):
@@ -16,12 +19,16 @@ class AzureChatOpenAIService:
         self.endpoint = api_key.get("azure_endpoint")
         self.deployment_name = api_key.get("azure_deployment")
         self.api_version = api_key.get("api_version")
-        self.chat_model = AzureChatOpenAI(
-            openai_api_key=self.api_key,
-            azure_endpoint=self.endpoint,
-            azure_deployment=self.deployment_name,
-            openai_api_version=self.api_version,  # Use the correct API version
-            temperature=0
+        # Reuse a pooled client so warm requests keep their HTTP connections
+        self.chat_model = get_client_registry().get_or_create(
+            client_key("azure", api_key, self.deployment_name, 0, self.api_version),
+            lambda: AzureChatOpenAI(
+                openai_api_key=self.api_key,
+                azure_endpoint=self.endpoint,
+                azure_deployment=self.deployment_name,
+                openai_api_version=self.api_version,  # Use the correct API version
+                temperature=0
+            )
         )
 
 
@@ -41,26 +48,57 @@ class AzureChatOpenAIService:
             str or generator: The generated response. If streaming is True, returns a generator.
         """
         try:
-            # Create the chat prompt template
-            chat_prompt = ChatPromptTemplate.from_messages([
-                ("system", prompt),
-                ("user", f"Context: {context}\n\nQuery: {query}")
-            ])
-
-            # Generate messages based on the prompt template
-            messages = chat_prompt.format_messages()
+            messages = build_messages(prompt, query, context)
 
             if streaming:
                 # Streaming: Return a generator
-                response = self.chat_model.stream(messages)
-                for chunk in response:
-                    yield chunk.content
+                return (chunk.content for chunk in self.chat_model.stream(messages))
             else:
                 # Non-streaming: Return the full response
-                response = self.chat_model(messages)
+                response = self.chat_model.invoke(messages)
                 return response.content
         except Exception as e:
             return {
             "statusCode": 500,
             "message": str(e) 
-        }
\ No newline at end of file
+        }
+
+    async def agenerate(self, prompt: str, query: str, context: str) -> str:
+        """
+        Generate a full response without blocking the event loop.
+
+        Args:
+            prompt (str): The initial system prompt to guide the AI.
+            query (str): The user's input or query.
+            context (str): Additional context for the AI.
+
+        Returns:
+            str: The generated response.
+        """
+        messages = build_messages(prompt, query, context)
+        response = await self.chat_model.ainvoke(messages)
+        return response.content
+
+    async def astream(self, prompt: str, query: str, context: str) -> AsyncIterator[str]:
+        """
+        Stream the response chunk by chunk without blocking the event loop.
+
+        Args:
+            prompt (str): The initial system prompt to guide the AI.
+            query (str): The user's input or query.
+            context (str): Additional context for the AI.
+
+        Yields:
+            str: The content of each streamed chunk.
+        """
+        messages = build_messages(prompt, query, context)
+        kwargs = {}
+        left = remaining()
+        if left is not None:
+            # Give up on the provider at the request's deadline
+            kwargs["timeout"] = max(left, 0.001)
+        # Closed explicitly so an abandoned stream releases its upstream connection
+        async with aclosing(self.chat_model.astream(messages, **kwargs)) as chunks:
+            async for chunk in chunks:
+                if chunk.content:
+                    yield chunk.content
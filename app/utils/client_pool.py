@@ -0,0 +1,145 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+
+def credential_hash(credentials: Any) -> str:
+    """
+    Hash credentials so they can be used in cache keys without keeping the raw secret around.
+
+    Args:
+        credentials (str or dict): The API key, or the Azure credential dictionary.
+
+    Returns:
+        str: A hex SHA-256 digest of the canonicalised credentials.
+    """
+    if isinstance(credentials, dict):
+        raw = json.dumps(credentials, sort_keys=True, separators=(",", ":"))
+    else:
+        raw = str(credentials).strip()
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ClientRegistry:
+    def __init__(self, max_size: int = 64, idle_ttl: float = 900.0):
+        """
+        Process-wide registry of chat-model clients.
+
+        Clients are kept in LRU order and dropped when the registry is over `max_size`
+        or when a client has not been used for `idle_ttl` seconds.
+
+        Args:
+            max_size (int): The maximum number of clients kept alive.
+            idle_ttl (float): Seconds a client may stay unused before it is evicted.
+        """
+        self.max_size = max_size
+        self.idle_ttl = idle_ttl
+        self._clients = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_create(self, key: Hashable, factory: Callable[[], Any]) -> Any:
+        """
+        Return the client stored under `key`, building it with `factory` on a miss.
+
+        Args:
+            key (tuple): The registry key, see `client_key`.
+            factory (callable): Builds a new client when none is cached.
+
+        Returns:
+            The cached or newly created client.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._evict_idle(now)
+            entry = self._clients.get(key)
+            if entry is not None:
+                self._clients.move_to_end(key)
+                entry[1] = now
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        # Build outside the lock so a slow constructor doesn't block other lookups
+        client = factory()
+
+        with self._lock:
+            entry = self._clients.get(key)
+            if entry is not None:
+                # Another thread won the race, reuse its client
+                self._clients.move_to_end(key)
+                entry[1] = now
+                return entry[0]
+            self._clients[key] = [client, now]
+            while len(self._clients) > self.max_size:
+                self._clients.popitem(last=False)
+                self.evictions += 1
+        return client
+
+    def _evict_idle(self, now: float):
+        # Entries are in LRU order, so the idle ones are all at the front
+        while self._clients:
+            key, (client, last_used) = next(iter(self._clients.items()))
+            if now - last_used < self.idle_ttl:
+                break
+            self._clients.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        """
+        Drop every cached client.
+        """
+        with self._lock:
+            self._clients.clear()
+
+    def stats(self) -> dict:
+        """
+        Return the registry counters.
+
+        Returns:
+            dict: size, max_size, hits, misses and evictions.
+        """
+        with self._lock:
+            return {
+                "size": len(self._clients),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+def client_key(provider: str, credentials: Any, model_name: Optional[str], temperature: Any, variant: Optional[str] = None) -> tuple:
+    """
+    Build the registry key for a chat-model client.
+
+    Args:
+        provider (str): The provider name, e.g. "openai".
+        credentials (str or dict): The credentials used by the client.
+        model_name (str): The model (or Azure deployment) name.
+        temperature (float): The temperature setting.
+        variant (str): Extra distinguishing value such as the Azure api_version.
+
+    Returns:
+        tuple: The hashable key.
+    """
+    return (provider, credential_hash(credentials), model_name, float(temperature or 0), variant)
+
+
+_registry = ClientRegistry(
+    max_size=int(os.getenv("LLM_CLIENT_POOL_MAX_SIZE", "64")),
+    idle_ttl=float(os.getenv("LLM_CLIENT_POOL_IDLE_TTL", "900")),
+)
+
+
+def get_client_registry() -> ClientRegistry:
+    """
+    Return the process-wide client registry.
+    """
+    return _registry
@@ -0,0 +1,291 @@
+import hashlib
+import math
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+from utils.executor import run_sync
+
+# Context tokens allowed per request (0 disables trimming); requests may override it
+CONTEXT_TOKEN_BUDGET = int(os.getenv("LLM_CONTEXT_TOKEN_BUDGET", "0"))
+# Target size of the chunks the context is cut into before ranking
+CHUNK_TOKENS = int(os.getenv("LLM_CONTEXT_CHUNK_TOKENS", "256"))
+# "auto" uses the model's tokenizer when one is available, "approximate" never does
+TOKENIZER = os.getenv("LLM_TOKENIZER", "auto")
+# Contexts whose token counts and chunk index are kept
+INDEX_CACHE_SIZE = int(os.getenv("LLM_CONTEXT_INDEX_CACHE_SIZE", "32"))
+# Contexts shorter than this are fitted on the event loop instead of the thread pool
+_INLINE_CHARS = 16 * 1024
+
+_TERM = re.compile(r"\w+")
+# Chunk boundaries, coarsest first: paragraphs, lines, sentences, words
+_SEPARATORS = (re.compile(r"\n\s*\n"), re.compile(r"\n"), re.compile(r"(?<=[.!?])\s+"), re.compile(r"\s+"))
+_GAP = "\n\n"
+_BM25_K1 = 1.5
+_BM25_B = 0.75
+
+
+class ApproximateTokenizer:
+    """
+    Offline token estimate of about four characters per token, like the admission
+    budget. Rounded up, so the chunks of a context never add up to less than it.
+    """
+    name = "approximate"
+
+    def count(self, text: str) -> int:
+        return (len(text) + 3) // 4
+
+
+class TiktokenTokenizer:
+    def __init__(self, encoding):
+        """
+        Exact counts for OpenAI models, from the optional `tiktoken` package.
+        """
+        self.encoding = encoding
+        self.name = f"tiktoken:{encoding.name}"
+
+    def count(self, text: str) -> int:
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+
+_approximate = ApproximateTokenizer()
+
+
+def _openai_tokenizer(model_name: Optional[str]):
+    try:
+        # Imported on first use like the provider SDKs
+        import tiktoken
+    except ImportError:  # Optional: the approximate tokenizer is used without it
+        return None
+    try:
+        return TiktokenTokenizer(tiktoken.encoding_for_model(model_name or ""))
+    except KeyError:
+        # Unknown model or an Azure deployment name
+        return TiktokenTokenizer(tiktoken.get_encoding("o200k_base"))
+
+
+# Provider -> factory(model_name) returning a tokenizer, or None for the approximate one
+_tokenizer_factories: Dict[str, Callable] = {
+    "openai": _openai_tokenizer,
+    "azure": _openai_tokenizer,
+}
+_tokenizers: Dict[Tuple[str, Optional[str]], object] = {}
+
+
+def register_tokenizer(provider: str, factory: Callable):
+    """
+    Plug in the tokenizer of a provider.
+
+    Args:
+        provider (str): The provider name.
+        factory (callable): Called with the model name; returns an object with a
+            `name` and a `count(text) -> int` method, or None to use the approximate tokenizer.
+    """
+    _tokenizer_factories[provider] = factory
+    for key in [key for key in _tokenizers if key[0] == provider]:
+        del _tokenizers[key]
+
+
+def get_tokenizer(provider: str, model_name: Optional[str] = None):
+    """
+    Return the tokenizer used to count the tokens of a provider's model.
+    """
+    key = (provider, model_name)
+    tokenizer = _tokenizers.get(key)
+    if tokenizer is None:
+        factory = _tokenizer_factories.get(provider)
+        if TOKENIZER != "approximate" and factory is not None:
+            tokenizer = factory(model_name)
+        tokenizer = tokenizer or _approximate
+        _tokenizers[key] = tokenizer
+    return tokenizer
+
+
+@dataclass
+class ContextFit:
+    """
+    How a context was fitted to its token budget.
+    """
+    tokenizer: str
+    budget: int
+    original_tokens: int
+    tokens: int
+    tokens_removed: int
+    chunks_total: int
+    chunks_kept: int
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+class _ChunkIndex:
+    def __init__(self, text: str, tokenizer, chunk_tokens: int, total: int):
+        """
+        The context cut into chunks of about `chunk_tokens` tokens, with a BM25
+        inverted index of their terms.
+        """
+        self.chunks: List[Tuple[int, int]] = []
+        self.tokens: List[int] = []
+        for start, end, tokens in _pack(_pieces(text, 0, len(text), tokenizer, chunk_tokens, 0, total), chunk_tokens):
+            self.chunks.append((start, end))
+            self.tokens.append(tokens)
+
+        self.postings: Dict[str, List[Tuple[int, int]]] = {}
+        lengths = []
+        for index, (start, end) in enumerate(self.chunks):
+            terms = Counter(_TERM.findall(text[start:end].lower()))
+            lengths.append(sum(terms.values()))
+            for term, frequency in terms.items():
+                self.postings.setdefault(term, []).append((index, frequency))
+        self.lengths = lengths
+        self.average_length = (sum(lengths) / len(lengths)) if lengths else 0.0
+
+    def scores(self, query: str) -> List[float]:
+        scores = [0.0] * len(self.chunks)
+        count = len(self.chunks)
+        for term in set(_TERM.findall(query.lower())):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for index, frequency in postings:
+                norm = 1 - _BM25_B + _BM25_B * self.lengths[index] / (self.average_length or 1)
+                scores[index] += idf * frequency * (_BM25_K1 + 1) / (frequency + _BM25_K1 * norm)
+        return scores
+
+
+def _pieces(text: str, start: int, end: int, tokenizer, limit: int, level: int, tokens: Optional[int] = None):
+    # Split text[start:end] at the coarsest separator that yields pieces under `limit`
+    if tokens is None:
+        tokens = tokenizer.count(text[start:end])
+    if tokens <= limit or level == len(_SEPARATORS):
+        if text[start:end].strip():
+            yield start, end, tokens
+        return
+    position = start
+    for match in _SEPARATORS[level].finditer(text, start, end):
+        if match.start() > position:
+            yield from _pieces(text, position, match.start(), tokenizer, limit, level + 1)
+        position = match.start()
+    if end > position:
+        yield from _pieces(text, position, end, tokenizer, limit, level + 1)
+
+
+def _pack(pieces, limit: int):
+    # Merge adjacent pieces into chunks of up to `limit` tokens
+    current = None
+    for start, end, tokens in pieces:
+        if current is not None and current[2] + tokens <= limit:
+            current = (current[0], end, current[2] + tokens)
+            continue
+        if current is not None:
+            yield current
+        current = (start, end, tokens)
+    if current is not None:
+        yield current
+
+
+class ContextFitter:
+    def __init__(self, chunk_tokens: int = CHUNK_TOKENS, cache_size: int = INDEX_CACHE_SIZE):
+        """
+        Fits contexts to a token budget by keeping the chunks most relevant to the query.
+
+        Token counts and chunk indexes are memoized per tokenizer and context hash,
+        so a context reused across requests is only counted and indexed once.
+
+        Args:
+            chunk_tokens (int): Target size of a chunk, in tokens.
+            cache_size (int): Number of contexts whose counts and indexes are kept.
+        """
+        self.chunk_tokens = chunk_tokens
+        self.cache_size = cache_size
+        self._lock = threading.Lock()
+        self._counts = OrderedDict()
+        self._indexes = OrderedDict()
+
+    def _memoized(self, cache: OrderedDict, key, build):
+        with self._lock:
+            if key in cache:
+                cache.move_to_end(key)
+                return cache[key]
+        value = build()
+        with self._lock:
+            cache[key] = value
+            while len(cache) > self.cache_size:
+                cache.popitem(last=False)
+        return value
+
+    def count(self, text: str, tokenizer, context_hash: Optional[str] = None) -> int:
+        """
+        Return the number of tokens of a context, memoized per context hash.
+        """
+        context_hash = context_hash or hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return self._memoized(self._counts, (tokenizer.name, context_hash), lambda: tokenizer.count(text))
+
+    def fit(self, text: str, query: str, budget: int, tokenizer,
+            context_hash: Optional[str] = None) -> Tuple[str, ContextFit]:
+        """
+        Fit a context to `budget` tokens.
+
+        A context over the budget is cut into chunks, the chunks are ranked by BM25
+        relevance to `query`, and the best ones that fit are kept in their original
+        order. Chunks of equal relevance are kept in document order.
+
+        Args:
+            text (str): The context.
+            query (str): The user's query, used to rank the chunks.
+            budget (int): Maximum context tokens.
+            tokenizer: The model's tokenizer (see get_tokenizer).
+            context_hash (str): Content hash of the context, computed when not given.
+
+        Returns:
+            tuple: The fitted context and a ContextFit report.
+        """
+        context_hash = context_hash or hashlib.sha256(text.encode("utf-8")).hexdigest()
+        total = self.count(text, tokenizer, context_hash)
+        if total <= budget:
+            return text, ContextFit(tokenizer.name, budget, total, total, 0, 1, 1)
+
+        # Small budgets get smaller chunks, so that several of them fit
+        chunk_tokens = max(1, min(self.chunk_tokens, budget // 4))
+        index = self._memoized(
+            self._indexes, (tokenizer.name, context_hash, chunk_tokens),
+            lambda: _ChunkIndex(text, tokenizer, chunk_tokens, total),
+        )
+        scores = index.scores(query)
+        gap_tokens = tokenizer.count(_GAP)
+        kept = []
+        used = 0
+        for chunk in sorted(range(len(index.chunks)), key=lambda i: (-scores[i], i)):
+            cost = index.tokens[chunk] + (gap_tokens if kept else 0)
+            if used + cost <= budget:
+                kept.append(chunk)
+                used += cost
+        kept.sort()
+
+        parts = []
+        previous = None
+        for chunk in kept:
+            start, end = index.chunks[chunk]
+            if previous is not None:
+                # Adjacent chunks keep their original separator, skipped text becomes a gap
+                parts.append(text[index.chunks[previous][1]:start] if chunk == previous + 1 else _GAP)
+            parts.append(text[start:end])
+            previous = chunk
+        fitted = "".join(parts)
+        return fitted, ContextFit(tokenizer.name, budget, total, used, total - used, len(index.chunks), len(kept))
+
+    async def afit(self, text: str, query: str, budget: int, tokenizer,
+                   context_hash: Optional[str] = None) -> Tuple[str, ContextFit]:
+        """
+        fit() without blocking the event loop on large contexts.
+        """
+        if len(text) < _INLINE_CHARS:
+            return self.fit(text, query, budget, tokenizer, context_hash)
+        return await run_sync(self.fit, text, query, budget, tokenizer, context_hash)
+
+
+context_fitter = ContextFitter()
@@ -0,0 +1,357 @@
+import atexit
+import hashlib
+import mmap
+import os
+import re
+import shutil
+import tempfile
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from utils.executor import run_sync
+
+try:
+    import zstandard
+except ImportError:  # Optional: zstd uploads are rejected without it
+    zstandard = None
+
+CONTEXT_ID_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+ENCODINGS = ("identity", "gzip", "zstd")
+_READ_SIZE = 1024 * 1024
+
+
+class ContextStoreError(Exception):
+    status_code = 400
+
+
+class ContextNotFound(ContextStoreError):
+    status_code = 404
+
+
+class ContextTooLarge(ContextStoreError):
+    status_code = 413
+
+
+class UnsupportedEncoding(ContextStoreError):
+    status_code = 415
+
+
+def _decompress(data: bytes, encoding: str, limit: int) -> bytes:
+    # Decompressed in bounded steps so a small bomb can't exhaust memory
+    if encoding == "gzip":
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        result = decompressor.decompress(data, limit + 1)
+        if len(result) > limit:
+            raise ContextTooLarge(f"Context exceeds {limit} bytes once decompressed")
+        if not decompressor.eof:
+            raise ContextStoreError("Truncated gzip body")
+        return result
+    if encoding == "zstd":
+        if zstandard is None:
+            raise UnsupportedEncoding("zstd uploads need the optional 'zstandard' package")
+        reader = zstandard.ZstdDecompressor().stream_reader(data)
+        chunks = []
+        size = 0
+        while True:
+            chunk = reader.read(_READ_SIZE)
+            if not chunk:
+                return b"".join(chunks)
+            size += len(chunk)
+            if size > limit:
+                raise ContextTooLarge(f"Context exceeds {limit} bytes once decompressed")
+            chunks.append(chunk)
+    raise UnsupportedEncoding(f"Unsupported content encoding: {encoding}")
+
+
+def _prepare(data: bytes, encoding: str, limit: int) -> Tuple[str, str, int]:
+    if encoding != "identity":
+        data = _decompress(data, encoding, limit)
+    if len(data) > limit:
+        raise ContextTooLarge(f"Context exceeds {limit} bytes")
+    try:
+        text = data.decode("utf-8")
+    except UnicodeDecodeError:
+        raise ContextStoreError("Context must be UTF-8 text")
+    return hashlib.sha256(data).hexdigest(), text, len(data)
+
+
+def private_context_dir() -> str:
+    """
+    Return a new directory only this user can read (0700), holding the contexts of
+    one run of the server.
+    """
+    return tempfile.mkdtemp(prefix="llm-context-store-")
+
+
+def _file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(_READ_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class _SpillDirectory:
+    def __init__(self, path: str, max_bytes: int):
+        """
+        Files holding every stored context, read back through mmap.
+
+        Least recently used files are deleted once the directory exceeds `max_bytes`.
+        A file is only served if its content hashes to its name.
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._files = OrderedDict()
+        self._bytes = 0
+        os.makedirs(path, mode=0o700, exist_ok=True)
+        # Contexts uploaded before a restart stay available
+        entries = []
+        for name in os.listdir(path):
+            if CONTEXT_ID_PATTERN.match(name) and _file_hash(self._file(name)) == name:
+                stat = os.stat(self._file(name))
+                entries.append((stat.st_mtime, name, stat.st_size))
+        for _, name, size in sorted(entries):
+            self._files[name] = size
+            self._bytes += size
+
+    def _file(self, context_id: str) -> str:
+        return os.path.join(self.path, context_id)
+
+    def _adopt(self, context_id: str) -> Optional[int]:
+        # A file written by another worker process sharing the directory
+        if not CONTEXT_ID_PATTERN.match(context_id):
+            return None
+        try:
+            size = os.stat(self._file(context_id)).st_size
+            if _file_hash(self._file(context_id)) != context_id:
+                return None
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            if context_id not in self._files:
+                self._files[context_id] = size
+                self._bytes += size
+        return size
+
+    def size(self, context_id: str) -> Optional[int]:
+        with self._lock:
+            size = self._files.get(context_id)
+        return size if size is not None else self._adopt(context_id)
+
+    def write(self, context_id: str, text: str):
+        with self._lock:
+            if context_id in self._files:
+                self._files.move_to_end(context_id)
+                return
+        data = text.encode("utf-8")
+        fd, tmp = tempfile.mkstemp(dir=self.path, prefix=".upload-")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        # Atomic, so readers never see a partial file
+        os.replace(tmp, self._file(context_id))
+        with self._lock:
+            # A concurrent upload (or adoption) of the same content may have
+            # accounted for the file since the check above
+            old_size = self._files.get(context_id, 0)
+            self._files[context_id] = len(data)
+            self._files.move_to_end(context_id)
+            self._bytes += len(data) - old_size
+            evicted = []
+            while self._bytes > self.max_bytes and len(self._files) > 1:
+                name, size = self._files.popitem(last=False)
+                self._bytes -= size
+                evicted.append(name)
+        for name in evicted:
+            try:
+                os.remove(self._file(name))
+            except FileNotFoundError:
+                pass
+
+    def read(self, context_id: str) -> Optional[str]:
+        with self._lock:
+            known = context_id in self._files
+            if known:
+                self._files.move_to_end(context_id)
+        if not known and self._adopt(context_id) is None:
+            return None
+        try:
+            with open(self._file(context_id), "rb") as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    return ""
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    return str(mapped, "utf-8")
+        except FileNotFoundError:
+            return None
+
+    def delete(self, context_id: str):
+        with self._lock:
+            size = self._files.pop(context_id, None)
+            if size is None:
+                return
+            self._bytes -= size
+        try:
+            os.remove(self._file(context_id))
+        except FileNotFoundError:
+            pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"files": len(self._files), "bytes": self._bytes}
+
+
+class ContextStore:
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, directory: Optional[str] = None,
+                 max_disk_bytes: int = 4 * 1024 * 1024 * 1024, max_upload_bytes: int = 64 * 1024 * 1024):
+        """
+        Content-addressed store of large contexts, so callers upload them once and
+        send a `context_id` instead of the text.
+
+        Every context is written to a file in `directory`. The most recently used
+        contexts are also kept in memory, in an LRU bounded by their UTF-8 size;
+        contexts evicted from memory are read back from their memory-mapped file.
+
+        Args:
+            max_bytes (int): Byte budget of the memory tier.
+            directory (str): Directory of the context files, a private temp directory by default.
+            max_disk_bytes (int): Byte budget of the directory; least recently used files are deleted.
+            max_upload_bytes (int): Maximum size of one context, after decompression.
+        """
+        self.max_bytes = max_bytes
+        self.max_upload_bytes = max_upload_bytes
+        self._memory = OrderedDict()
+        self._bytes = 0
+        if directory is None:
+            # Private to this process, and gone when it exits
+            directory = private_context_dir()
+            atexit.register(shutil.rmtree, directory, ignore_errors=True)
+        self._spill = _SpillDirectory(directory, max_disk_bytes)
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def max_body_bytes(self, encoding: str) -> int:
+        """
+        Return the largest upload body accepted for `encoding`: the context limit,
+        plus the framing overhead of compressed data that doesn't compress.
+        """
+        if encoding == "identity":
+            return self.max_upload_bytes
+        return self.max_upload_bytes + self.max_upload_bytes // 100 + 1024
+
+    def _memory_set(self, context_id: str, text: str, size: int):
+        if size > self.max_bytes or context_id in self._memory:
+            return
+        self._memory[context_id] = (text, size)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            _, (_, evicted_size) = self._memory.popitem(last=False)
+            self._bytes -= evicted_size
+
+    async def aput(self, data: bytes, encoding: str = "identity") -> Tuple[str, int]:
+        """
+        Store a context and return its content address.
+
+        Args:
+            data (bytes): The uploaded body.
+            encoding (str): "identity", "gzip" or "zstd".
+
+        Returns:
+            tuple: The context ID and the decompressed size in bytes.
+
+        Raises:
+            ContextStoreError: When the body can't be decoded or is too large.
+        """
+        # Decompressing and hashing megabytes is kept off the event loop
+        context_id, text, size = await run_sync(_prepare, data, encoding, self.max_upload_bytes)
+        # Even when the text is still in memory: the file may have been evicted,
+        # and other workers sharing the directory only see the file
+        await run_sync(self._spill.write, context_id, text)
+        self._memory_set(context_id, text, size)
+        return context_id, size
+
+    async def aget(self, context_id: str) -> Optional[str]:
+        """
+        Return the context with this ID, or None if it isn't stored.
+        """
+        entry = self._memory.get(context_id)
+        if entry is not None:
+            self._memory.move_to_end(context_id)
+            self.memory_hits += 1
+            return entry[0]
+        if not CONTEXT_ID_PATTERN.match(context_id):
+            self.misses += 1
+            return None
+        text = await run_sync(self._spill.read, context_id)
+        if text is None:
+            self.misses += 1
+            return None
+        self.disk_hits += 1
+        self._memory_set(context_id, text, self._spill.size(context_id) or len(text.encode("utf-8")))
+        return text
+
+    async def require(self, context_id: str) -> str:
+        """
+        Return the context with this ID.
+
+        Raises:
+            ContextNotFound: When it isn't stored (or was evicted).
+        """
+        text = await self.aget(context_id)
+        if text is None:
+            raise ContextNotFound(f"Unknown context_id: {context_id}")
+        return text
+
+    def size(self, context_id: str) -> Optional[int]:
+        """
+        Return the size in bytes of a stored context, or None if it isn't stored.
+        """
+        entry = self._memory.get(context_id)
+        if entry is not None:
+            return entry[1]
+        return self._spill.size(context_id)
+
+    async def adelete(self, context_id: str):
+        """
+        Remove a context from every tier.
+        """
+        entry = self._memory.pop(context_id, None)
+        if entry is not None:
+            self._bytes -= entry[1]
+        await run_sync(self._spill.delete, context_id)
+
+    def stats(self) -> dict:
+        """
+        Return store counters.
+        """
+        spill = self._spill.stats()
+        return {
+            "entries": len(self._memory),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "files": spill["files"],
+            "disk_bytes": spill["bytes"],
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+        }
+
+
+_context_store = None
+
+
+def get_context_store() -> ContextStore:
+    """
+    Return the process-wide context store, creating it on first use.
+    """
+    global _context_store
+    if _context_store is None:
+        _context_store = ContextStore(
+            max_bytes=int(os.getenv("LLM_CONTEXT_STORE_MAX_BYTES", str(256 * 1024 * 1024))),
+            directory=os.getenv("LLM_CONTEXT_STORE_DIR") or None,
+            max_disk_bytes=int(os.getenv("LLM_CONTEXT_STORE_MAX_DISK_BYTES", str(4 * 1024 * 1024 * 1024))),
+            max_upload_bytes=int(os.getenv("LLM_CONTEXT_MAX_BYTES", str(64 * 1024 * 1024))),
+        )
+    return _context_store
@@ -0,0 +1,230 @@
+import asyncio
+import json
+import math
+import os
+import time
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Optional
+
+# Default and maximum time a request may take, in seconds (0 for no limit)
+REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT", "600"))
+# Header carrying the caller's timeout budget in milliseconds
+TIMEOUT_HEADER = "x-request-timeout-ms"
+
+# Absolute deadline of the request being served, in time.monotonic() seconds (the
+# clock of the default event loop, so it can be used with asyncio.timeout_at)
+current_deadline = ContextVar("llm_deadline", default=None)
+# The caller's own budget in seconds (None for the default), for work that gets a
+# deadline of its own, like the items of a batch
+current_timeout = ContextVar("llm_timeout", default=None)
+
+
+class RequestRejected(Exception):
+    """
+    A request turned away by the server rather than failed by the provider.
+    """
+    status_code = 503
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class Overloaded(RequestRejected):
+    """
+    Shed under overload, or unable to start before its deadline.
+    """
+    status_code = 503
+
+
+class DeadlineExceeded(RequestRejected):
+    """
+    The request's deadline passed before it finished.
+    """
+    status_code = 504
+
+
+def rejection_headers(error: BaseException) -> dict:
+    """
+    Return the Retry-After header of a rejected request, if it has one.
+    """
+    retry_after = getattr(error, "retry_after", None)
+    if not isinstance(error, RequestRejected) or retry_after is None:
+        return {}
+    return {"Retry-After": str(max(1, math.ceil(retry_after)))}
+
+
+def _deadline_for(timeout: Optional[float], detached: bool) -> Optional[float]:
+    # The caller may shorten the configured timeout, not extend it
+    if REQUEST_TIMEOUT > 0:
+        timeout = REQUEST_TIMEOUT if timeout is None else min(timeout, REQUEST_TIMEOUT)
+    if timeout is None:
+        return None
+    deadline = time.monotonic() + timeout
+    outer = None if detached else current_deadline.get()
+    return deadline if outer is None else min(deadline, outer)
+
+
+@contextmanager
+def deadline_scope(timeout: Optional[float] = None, detached: bool = False):
+    """
+    Run the enclosed block under a deadline `timeout` seconds from now.
+
+    Without a timeout the configured LLM_REQUEST_TIMEOUT applies. A deadline
+    already in effect is never extended, unless `detached`: then the block gets
+    a deadline of its own (each item of a batch gets the full budget).
+
+    Args:
+        timeout (float): The caller's budget in seconds, None for the default.
+        detached (bool): Replace the deadline in effect instead of capping it.
+    """
+    deadline_token = current_deadline.set(_deadline_for(timeout, detached))
+    timeout_token = current_timeout.set(timeout)
+    try:
+        yield
+    finally:
+        current_timeout.reset(timeout_token)
+        current_deadline.reset(deadline_token)
+
+
+def remaining() -> Optional[float]:
+    """
+    Return the seconds left before the current deadline (negative once it passed),
+    or None when the request has no deadline.
+    """
+    deadline = current_deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def check_deadline(stage: str):
+    """
+    Raise DeadlineExceeded if the current deadline has already passed.
+
+    Args:
+        stage (str): What the request was about to do, for the error message.
+    """
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded(f"Deadline exceeded before {stage}")
+
+
+@asynccontextmanager
+async def deadline_guard(stage: str):
+    """
+    Cancel the enclosed block when the current deadline passes and raise
+    DeadlineExceeded instead. Does nothing for requests without a deadline.
+
+    Args:
+        stage (str): What the block does, for the error message.
+    """
+    deadline = current_deadline.get()
+    if deadline is None:
+        yield
+        return
+    check_deadline(stage)
+    timeout = asyncio.timeout_at(deadline)
+    try:
+        async with timeout:
+            yield
+    except TimeoutError:
+        if timeout.expired():
+            raise DeadlineExceeded(f"Deadline exceeded during {stage}") from None
+        raise
+
+
+async def stream_with_deadline(stream: AsyncIterator[str], stage: str = "the stream") -> AsyncIterator[str]:
+    """
+    Iterate over `stream`, raising DeadlineExceeded (and closing the stream) when
+    the current deadline passes while waiting for a chunk.
+
+    The deadline is read when iteration starts. Only the wait for each chunk is
+    timed, never the consumer's own work between chunks.
+
+    Args:
+        stream (AsyncIterator[str]): The chunk stream.
+        stage (str): What the stream is, for the error message.
+
+    Yields:
+        str: The chunks of `stream`.
+    """
+    deadline = current_deadline.get()
+    iterator = stream.__aiter__()
+    try:
+        while deadline is None:
+            try:
+                chunk = await iterator.__anext__()
+            except StopAsyncIteration:
+                return
+            yield chunk
+        while True:
+            timeout = asyncio.timeout_at(deadline)
+            try:
+                async with timeout:
+                    chunk = await iterator.__anext__()
+            except StopAsyncIteration:
+                return
+            except TimeoutError:
+                if timeout.expired():
+                    raise DeadlineExceeded(f"Deadline exceeded during {stage}") from None
+                raise
+            yield chunk
+    finally:
+        aclose = getattr(iterator, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+
+def parse_timeout_ms(value) -> Optional[float]:
+    """
+    Parse a timeout budget in milliseconds into seconds.
+
+    Raises:
+        ValueError: When the value is not a number.
+    """
+    if value is None or value == "":
+        return None
+    timeout = float(value) / 1000
+    if math.isnan(timeout):
+        raise ValueError("timeout is not a number")
+    return timeout
+
+
+class DeadlineMiddleware:
+    def __init__(self, app):
+        """
+        ASGI middleware starting each HTTP request's deadline when it arrives.
+
+        The budget is the `X-Request-Timeout-Ms` header, capped by (and defaulting
+        to) LLM_REQUEST_TIMEOUT. A request whose budget is already spent is
+        answered 504 right away. WebSocket connections are left alone; their
+        messages carry their own `timeout_ms`.
+        """
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        header = None
+        for name, value in scope.get("headers", ()):
+            if name == TIMEOUT_HEADER.encode("latin-1"):
+                header = value.decode("latin-1")
+                break
+        try:
+            timeout = parse_timeout_ms(header)
+        except ValueError:
+            return await self._reject(send, 400, f"Invalid {TIMEOUT_HEADER} header: {header}")
+        if timeout is not None and timeout <= 0:
+            return await self._reject(send, 504, "Deadline exceeded before the request started")
+        with deadline_scope(timeout):
+            await self.app(scope, receive, send)
+
+    @staticmethod
+    async def _reject(send, status: int, message: str):
+        body = json.dumps({"statusCode": status, "message": message}).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
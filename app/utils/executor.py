@@ -0,0 +1,33 @@
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+# Bounded pool for the blocking calls that still exist (SDK validation, client construction)
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("LLM_SYNC_WORKERS", "32")),
+    thread_name_prefix="llm-sync",
+)
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """
+    Return the process-wide thread pool used for blocking calls.
+    """
+    return _executor
+
+
+async def run_sync(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    Run a blocking function on the bounded thread pool without blocking the event loop.
+
+    Args:
+        func (callable): The blocking function.
+        *args, **kwargs: Arguments forwarded to `func`.
+
+    Returns:
+        The value returned by `func`.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
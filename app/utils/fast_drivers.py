@@ -0,0 +1,311 @@
+import asyncio
+import json
+import os
+import weakref
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+import httpx
+from utils.deadlines import remaining
+from utils.messages import user_message
+from utils.tracing import http_trace_extensions, span
+
+try:
+    import h2  # noqa: F401 - HTTP/2 support of httpx
+except ImportError:  # Optional: connections fall back to HTTP/1.1 keep-alive without it
+    h2 = None
+
+# Providers served by the direct drivers instead of LangChain: "all" or e.g. "openai,azure"
+FAST_PATH = os.getenv("LLM_FAST_PATH", "")
+HTTP2 = os.getenv("LLM_HTTP2", "1") == "1" and h2 is not None
+HTTP_MAX_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "200"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("LLM_HTTP_MAX_KEEPALIVE", "50"))
+HTTP_TIMEOUT = float(os.getenv("LLM_HTTP_TIMEOUT", "600"))
+
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or "https://api.openai.com/v1"
+GEMINI_BASE_URL = os.getenv("GEMINI_API_ENDPOINT") or "https://generativelanguage.googleapis.com"
+if "://" not in GEMINI_BASE_URL:
+    GEMINI_BASE_URL = f"https://{GEMINI_BASE_URL}"
+
+
+def fast_path_enabled(provider: str) -> bool:
+    """
+    Return True when `provider` is served by its direct driver (LLM_FAST_PATH).
+    """
+    enabled = {name.strip().lower() for name in FAST_PATH.split(",") if name.strip()}
+    return "all" in enabled or "1" in enabled or provider in enabled
+
+
+class ProviderHTTPError(Exception):
+    def __init__(self, provider: str, response: httpx.Response):
+        """
+        Non-2xx answer of a provider API.
+
+        Carries `status_code` and `response` like the vendor SDK errors, so admission
+        control retries 429s (honouring Retry-After) and reports the real status.
+        """
+        self.status_code = response.status_code
+        self.response = response
+        try:
+            body = response.json()
+            error = body[0].get("error") if isinstance(body, list) else body.get("error")
+            message = error.get("message") if isinstance(error, dict) else str(error or body)
+        except (ValueError, AttributeError, IndexError):
+            message = response.text[:500]
+        super().__init__(f"Error code: {response.status_code} - {provider}: {message}")
+
+
+# One pool per event loop: httpx connections can't move between loops
+_http_clients = weakref.WeakKeyDictionary()
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Return the shared keep-alive (HTTP/2 when `h2` is installed) client of the running loop.
+    """
+    loop = asyncio.get_running_loop()
+    client = _http_clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            http2=HTTP2,
+            limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_KEEPALIVE),
+            timeout=httpx.Timeout(HTTP_TIMEOUT, connect=10.0),
+        )
+        _http_clients[loop] = client
+    return client
+
+
+async def aclose_http_clients():
+    """
+    Close the connection pool of the running loop, so its keep-alive connections
+    are shut down cleanly. Call it when the loop's work is done (app shutdown).
+    """
+    client = _http_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+def _timeout():
+    # Never wait on the provider past the request's deadline
+    left = remaining()
+    if left is None:
+        return httpx.USE_CLIENT_DEFAULT
+    left = max(left, 0.001)
+    return httpx.Timeout(min(HTTP_TIMEOUT, left), connect=min(10.0, left))
+
+
+async def _post_json(provider: str, url: str, headers: dict, body: dict, params: Optional[dict] = None) -> dict:
+    response = await get_http_client().post(url, headers=headers, json=body, params=params,
+                                            timeout=_timeout(), extensions=http_trace_extensions())
+    if response.status_code >= 400:
+        raise ProviderHTTPError(provider, response)
+    return response.json()
+
+
+@asynccontextmanager
+async def _open_events(provider: str, url: str, headers: dict, body: dict, params: Optional[dict] = None):
+    # Closing the response releases the connection (and stops the upstream) early
+    async with get_http_client().stream("POST", url, headers=headers, json=body, params=params,
+                                        timeout=_timeout(), extensions=http_trace_extensions()) as response:
+        if response.status_code >= 400:
+            await response.aread()
+            raise ProviderHTTPError(provider, response)
+        yield _events(response)
+
+
+async def _events(response: httpx.Response) -> AsyncIterator[str]:
+    # The `data` payloads of a Server-Sent Events response
+    async for line in response.aiter_lines():
+        if line.startswith("data:"):
+            data = line[5:].strip()
+            if data == "[DONE]":
+                return
+            if data:
+                yield data
+
+
+class _OpenAICompatibleDriver:
+    provider = "openai"
+
+    def _url(self) -> str:
+        raise NotImplementedError
+
+    def _headers(self) -> dict:
+        raise NotImplementedError
+
+    def _params(self) -> Optional[dict]:
+        return None
+
+    def _body(self, prompt: str, query: str, context: str, stream: bool) -> dict:
+        with span("template"):
+            body = {
+                "messages": [
+                    {"role": "system", "content": prompt},
+                    {"role": "user", "content": user_message(query, context)},
+                ],
+                "n": 1,
+                "stream": stream,
+                "temperature": self.temperature,
+            }
+            if self.model_name:
+                body["model"] = self.model_name
+            return body
+
+    async def agenerate(self, prompt: str, query: str, context: str) -> str:
+        """
+        Generate a full response.
+
+        Args:
+            prompt (str): The initial system prompt to guide the AI.
+            query (str): The user's input or query.
+            context (str): Additional context to provide to the AI.
+
+        Returns:
+            str: The generated response.
+        """
+        result = await _post_json(self.provider, self._url(), self._headers(),
+                                  self._body(prompt, query, context, False), self._params())
+        return result["choices"][0]["message"].get("content") or ""
+
+    async def astream(self, prompt: str, query: str, context: str) -> AsyncIterator[str]:
+        """
+        Stream the response chunk by chunk.
+
+        Args:
+            prompt (str): The initial system prompt to guide the AI.
+            query (str): The user's input or query.
+            context (str): Additional context to provide to the AI.
+
+        Yields:
+            str: The content of each streamed chunk.
+        """
+        async with _open_events(self.provider, self._url(), self._headers(),
+                                self._body(prompt, query, context, True), self._params()) as events:
+            async for data in events:
+                choices = json.loads(data).get("choices")
+                if choices and (choices[0].get("delta") or {}).get("content"):
+                    yield choices[0]["delta"]["content"]
+
+
+class FastOpenAIChat(_OpenAICompatibleDriver):
+    def __init__(self, api_key: str, model_name: str, temperature: float = 0.7):
+        """
+        Direct driver for the OpenAI chat completions API, a drop-in for OpenAIChat.
+
+        Args:
+            api_key (str): The OpenAI API key for authentication.
+            model_name (str): The model name.
+            temperature (float): The temperature setting for response generation.
+        """
+        self.api_key = api_key
+        self.model_name = model_name
+        self.temperature = float(temperature or 0)
+
+    def _url(self) -> str:
+        return f"{OPENAI_BASE_URL.rstrip('/')}/chat/completions"
+
+    def _headers(self) -> dict:
+        return {"Authorization": f"Bearer {self.api_key}"}
+
+
+class FastAzureChatOpenAIService(_OpenAICompatibleDriver):
+    provider = "azure"
+
+    def __init__(self, api_key: dict):
+        """
+        Direct driver for Azure OpenAI deployments, a drop-in for AzureChatOpenAIService.
+
+        Args:
+            api_key (dict): azure_endpoint, api_key, api_version and azure_deployment.
+        """
+        self.api_key = api_key.get("api_key")
+        self.endpoint = api_key.get("azure_endpoint")
+        self.deployment_name = api_key.get("azure_deployment")
+        self.api_version = api_key.get("api_version")
+        # The deployment selects the model; the LangChain service always uses 0
+        self.model_name = None
+        self.temperature = 0.0
+
+    def _url(self) -> str:
+        return f"{self.endpoint.rstrip('/')}/openai/deployments/{self.deployment_name}/chat/completions"
+
+    def _headers(self) -> dict:
+        return {"api-key": self.api_key}
+
+    def _params(self) -> Optional[dict]:
+        return {"api-version": self.api_version}
+
+
+class FastGeminiChat:
+    provider = "gemini"
+
+    def __init__(self, api_key: str, model_name: str, temperature: float = 0.7):
+        """
+        Direct driver for the Gemini REST API, a drop-in for GeminiChat.
+
+        Args:
+            api_key (str): The Google Gemini API key for authentication.
+            model_name (str): The model name, with or without the `models/` prefix.
+            temperature (float): The temperature setting for response generation.
+        """
+        self.api_key = api_key
+        self.model_name = model_name
+        self.temperature = float(temperature or 0)
+
+    def _url(self, method: str) -> str:
+        model = self.model_name if self.model_name.startswith("models/") else f"models/{self.model_name}"
+        return f"{GEMINI_BASE_URL.rstrip('/')}/v1beta/{model}:{method}"
+
+    def _headers(self) -> dict:
+        return {"x-goog-api-key": self.api_key}
+
+    def _body(self, prompt: str, query: str, context: str) -> dict:
+        with span("template"):
+            return {
+                "systemInstruction": {"parts": [{"text": prompt}]},
+                "contents": [{"role": "user", "parts": [{"text": user_message(query, context)}]}],
+                "generationConfig": {"temperature": self.temperature},
+            }
+
+    @staticmethod
+    def _text(response: dict) -> str:
+        candidates = response.get("candidates") or []
+        if not candidates:
+            return ""
+        parts = (candidates[0].get("content") or {}).get("parts") or []
+        return "".join(part.get("text", "") for part in parts)
+
+    async def agenerate(self, prompt: str, query: str, context: str) -> str:
+        """
+        Generate a full response.
+
+        Args:
+            prompt (str): The initial system prompt to guide the AI.
+            query (str): The user's input or query.
+            context (str): Additional context to provide to the AI.
+
+        Returns:
+            str: The generated response.
+        """
+        result = await _post_json(self.provider, self._url("generateContent"), self._headers(),
+                                  self._body(prompt, query, context))
+        return self._text(result)
+
+    async def astream(self, prompt: str, query: str, context: str) -> AsyncIterator[str]:
+        """
+        Stream the response chunk by chunk.
+
+        Args:
+            prompt (str): The initial system prompt to guide the AI.
+            query (str): The user's input or query.
+            context (str): Additional context to provide to the AI.
+
+        Yields:
+            str: The content of each streamed chunk.
+        """
+        async with _open_events(self.provider, self._url("streamGenerateContent"), self._headers(),
+                                self._body(prompt, query, context), {"alt": "sse"}) as events:
+            async for data in events:
+                text = self._text(json.loads(data))
+                if text:
+                    yield text
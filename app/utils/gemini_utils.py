@@ -1,7 +1,27 @@
-from langchain.chat_models import ChatOpenAI  # Placeholder import until Gemini's own models are available
-from langchain.prompts.chat import ChatPromptTemplate
-from typing import Optional
+from contextlib import aclosing
+import json
+import os
+from typing import AsyncIterator, Optional
 from langchain_google_genai import ChatGoogleGenerativeAI
+from utils.client_pool import client_key, get_client_registry
+from utils.messages import build_messages
+
+# Optional override of the Gemini API host (e.g. a local mock); uses the REST transport
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT")
+
+
+class _RestChatGoogleGenerativeAI(ChatGoogleGenerativeAI):
+    """
+    ChatGoogleGenerativeAI for a custom REST endpoint.
+
+    The async Gemini client only speaks gRPC, so the async calls fall back to the
+    sync REST client on an executor.
+    """
+
+    @property
+    def async_client(self):
+        return None
+
 
 class GeminiChat:
     def __init__(self, api_key: str, model_name: str, temperature: float = 0.7):
@@ -14,22 +34,19 @@ class GeminiChat:
         """
         self.api_key = api_key
         self.temperature = temperature
-        # Assuming you would initialize the Gemini API client here
-        self.chat_model = ChatGoogleGenerativeAI(google_api_key=api_key,
-                               model=model_name,
-                               temperature=temperature)
+        # Reuse a pooled client so warm requests keep their HTTP connections
+        self.chat_model = get_client_registry().get_or_create(
+            client_key("gemini", api_key, model_name, temperature),
+            lambda: self._build_chat_model(api_key, model_name, temperature)
+        )
 
+    @staticmethod
+    def _build_chat_model(api_key: str, model_name: str, temperature: float) -> ChatGoogleGenerativeAI:
+        if not GEMINI_API_ENDPOINT:
+            return ChatGoogleGenerativeAI(google_api_key=api_key, model=model_name, temperature=temperature)
+        return _RestChatGoogleGenerativeAI(google_api_key=api_key, model=model_name, temperature=temperature,
+                                           transport="rest", client_options={"api_endpoint": GEMINI_API_ENDPOINT})
 
-    def initialize_gemini_client(self):
-        """
-        Initialize the Gemini API client. This function needs to be implemented when Gemini's SDK or API is available.
-
-        Returns:
-            GeminiClient: The client for interacting with the Gemini API.
-        """
-        # Replace with the actual code to initialize the Gemini client
-        # Example: return GeminiClient(api_key=self.api_key)
-        pass
 
     def generate_response(self, prompt: str, query: str, context: str, streaming: bool = False):
         """
@@ -45,27 +62,52 @@ class GeminiChat:
             str or generator: The generated response. If streaming is True, returns a generator.
         """
         try:
-            # Build the prompt template
-            chat_prompt = ChatPromptTemplate.from_messages([
-                ("system", prompt),
-                ("user", f"Context: {context}\n\nQuery: {query}")
-            ])
-
-            # Generate the messages based on the template
-            messages = chat_prompt.format_messages()
+            messages = build_messages(prompt, query, context)
 
             if streaming:
                 # Streaming: Return a generator (simulating a chunk-by-chunk response)
-                response = self.chat_model.stream(messages)
-                for chunk in response:
-                    yield str({"status":200,"message":chunk.content})
+                return (json.dumps({"status":200,"message":chunk.content}) + "\n" for chunk in self.chat_model.stream(messages))
             else:
                 # Non-streaming: Return the full response
-                response = self.chat_model(messages)
-                yield {"status":200,"message":response.content}
+                response = self.chat_model.invoke(messages)
+                return {"status":200,"message":response.content}
         except Exception as e:
             print(str(e))
             return {
                 "statusCode": 500,
                 "message": str(e)
-            }
\ No newline at end of file
+            }
+
+    async def agenerate(self, prompt: str, query: str, context: str) -> str:
+        """
+        Generate a full response without blocking the event loop.
+
+        Args:
+            prompt (str): The initial system prompt to guide the AI.
+            query (str): The user's input or query.
+            context (str): Additional context to provide to the AI.
+
+        Returns:
+            str: The generated response.
+        """
+        messages = build_messages(prompt, query, context)
+        response = await self.chat_model.ainvoke(messages)
+        return response.content
+
+    async def astream(self, prompt: str, query: str, context: str) -> AsyncIterator[str]:
+        """
+        Stream the response chunk by chunk without blocking the event loop.
+
+        Args:
+            prompt (str): The initial system prompt to guide the AI.
+            query (str): The user's input or query.
+            context (str): Additional context to provide to the AI.
+
+        Yields:
+            str: The content of each streamed chunk.
+        """
+        messages = build_messages(prompt, query, context)
+        # Closed explicitly so an abandoned stream releases its upstream connection
+        async with aclosing(self.chat_model.astream(messages)) as chunks:
+            async for chunk in chunks:
+                yield chunk.content
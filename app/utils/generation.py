@@ -0,0 +1,305 @@
+import os
+import time
+from contextlib import aclosing
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Optional, Tuple
+
+from utils.admission import admission_controller
+from utils.context_budget import CONTEXT_TOKEN_BUDGET, ContextFit, context_fitter, get_tokenizer
+from utils.deadlines import deadline_guard, stream_with_deadline
+from utils.latency import LatencyTracker, latency_tracker
+from utils.metrics import (
+    cache_hits_total, context_tokens_removed_total, current_endpoint, error_class, errors_total, in_flight,
+    model_label, request_duration_seconds,
+    requests_total, stream_chunks, stream_tokens_per_second, stream_tokens_saved_total, streams_cancelled_total,
+    time_to_first_token_seconds,
+)
+from utils.response_cache import get_response_cache, response_cache_key
+from utils.singleflight import SingleFlight, StreamFlight
+from utils.tracing import record_span, set_attributes, span
+
+REPLAY_CHUNK_SIZE = int(os.getenv("LLM_RESPONSE_CACHE_REPLAY_CHUNK", "256"))
+COALESCE_REQUESTS = os.getenv("LLM_COALESCE_REQUESTS", "1") == "1"
+
+# Identical in-flight generations share one upstream call
+_generation_flight = SingleFlight()
+_stream_flight = StreamFlight()
+# Characters of recent complete upstream streams, to estimate what a cancellation saved
+_completion_sizes = LatencyTracker(window=int(os.getenv("LLM_LATENCY_WINDOW", "200")))
+
+
+@dataclass
+class GenerationRequest:
+    """
+    Everything needed to generate (or look up) one response.
+    """
+    provider: str
+    model_name: str
+    temperature: float
+    credentials: Any
+    prompt: str
+    query: str
+    context: str
+    use_cache: bool = True
+    priority: int = 0
+    context_id: Optional[str] = None
+    # Context tokens allowed (None for LLM_CONTEXT_TOKEN_BUDGET, 0 for no limit)
+    context_budget: Optional[int] = None
+    # Set by fit_context once the context is fitted to the budget
+    context_fit: Optional[ContextFit] = None
+
+    @property
+    def cacheable(self) -> bool:
+        # Only deterministic requests give the same answer twice
+        return self.use_cache and float(self.temperature or 0) == 0
+
+    @property
+    def effective_context_budget(self) -> int:
+        return CONTEXT_TOKEN_BUDGET if self.context_budget is None else self.context_budget
+
+    def estimated_tokens(self) -> int:
+        # Rough prompt size (about four characters per token) for tokens-per-minute limits
+        if self.context_fit is not None:
+            return (len(self.prompt) + len(self.query)) // 4 + self.context_fit.tokens
+        return (len(self.prompt) + len(self.query) + len(self.context)) // 4
+
+    def cache_key(self) -> str:
+        # A stored context is keyed by its content hash instead of re-hashing its text
+        context = f"context_id:{self.context_id}" if self.context_id else self.context
+        if self.context_id and self.context_fit is not None and self.context_fit.tokens_removed:
+            # The trimmed text depends on the budget (and the query, already in the key)
+            context += f":budget:{self.context_fit.budget}"
+        return response_cache_key(
+            self.provider, self.model_name, self.temperature,
+            self.prompt, self.query, context, self.credentials,
+        )
+
+
+def _labels(request: GenerationRequest) -> tuple:
+    return request.provider, model_label(request.model_name), current_endpoint.get()
+
+
+async def fit_context(request: GenerationRequest):
+    """
+    Fit the context of a request to its token budget, keeping the chunks most
+    relevant to the query, and record the result in `request.context_fit`.
+
+    Does nothing when the request has no budget or was already fitted.
+
+    Args:
+        request (GenerationRequest): The request, updated in place.
+    """
+    budget = request.effective_context_budget
+    if budget <= 0 or request.context_fit is not None or not request.context:
+        return
+    tokenizer = get_tokenizer(request.provider, request.model_name)
+    with span("context_fit"):
+        request.context, request.context_fit = await context_fitter.afit(
+            request.context, request.query, budget, tokenizer, request.context_id,
+        )
+    if request.context_fit.tokens_removed:
+        context_tokens_removed_total.labels(*_labels(request)).inc(request.context_fit.tokens_removed)
+
+
+async def generate(chat, request: GenerationRequest) -> Tuple[str, bool]:
+    """
+    Generate a full response, serving deterministic requests from the response cache
+    and coalescing identical concurrent requests into one upstream call.
+
+    Args:
+        chat: An OpenAIChat, AzureChatOpenAIService or GeminiChat instance.
+        request (GenerationRequest): The request.
+
+    Returns:
+        tuple: The response text and whether it came from the cache.
+    """
+    labels = _labels(request)
+    requests_total.labels(*labels).inc()
+    gauge = in_flight.labels(*labels)
+    gauge.inc()
+    started = time.perf_counter()
+    try:
+        # Shared (coalesced) work runs under the first caller's deadline; each
+        # caller stops waiting at its own
+        async with deadline_guard("generation"):
+            result, cached = await _generate(chat, request)
+    except Exception as e:
+        errors_total.labels(*labels, error_class(e)).inc()
+        raise
+    finally:
+        gauge.dec()
+
+    elapsed = time.perf_counter() - started
+    set_attributes(provider=request.provider, model=request.model_name, streaming=False, cached=cached)
+    if cached:
+        cache_hits_total.labels(*labels).inc()
+    time_to_first_token_seconds.labels(*labels).observe(elapsed)
+    request_duration_seconds.labels(*labels).observe(elapsed)
+    return result, cached
+
+
+async def _generate(chat, request: GenerationRequest) -> Tuple[str, bool]:
+    await fit_context(request)
+    key = request.cache_key()
+    if request.cacheable:
+        with span("cache"):
+            cached = await get_response_cache().aget(key)
+        if cached is not None:
+            return cached, True
+
+    async def upstream():
+        started = time.perf_counter()
+        result = await admission_controller.run(
+            request.provider, request.credentials,
+            lambda: chat.agenerate(request.prompt, request.query, request.context),
+            priority=request.priority, tokens=request.estimated_tokens(), model_name=request.model_name,
+        )
+        latency_tracker.record((request.provider, request.model_name, "full"), time.perf_counter() - started)
+        if request.cacheable:
+            await get_response_cache().aset(key, result)
+        return result
+
+    # Sampled requests (temperature > 0) each get their own answer
+    if not (COALESCE_REQUESTS and request.cacheable):
+        return await upstream(), False
+    return await _generation_flight.do(key, upstream), False
+
+
+async def open_stream(chat, request: GenerationRequest) -> Tuple[AsyncIterator[str], bool]:
+    """
+    Open a response stream, replaying cached responses as a stream and sharing
+    one upstream stream between identical concurrent requests.
+
+    Args:
+        chat: An OpenAIChat, AzureChatOpenAIService or GeminiChat instance.
+        request (GenerationRequest): The request.
+
+    Returns:
+        tuple: The chunk iterator and whether it is replayed from the cache.
+    """
+    labels = _labels(request)
+    requests_total.labels(*labels).inc()
+    gauge = in_flight.labels(*labels)
+    gauge.inc()
+    started = time.perf_counter()
+    try:
+        async with deadline_guard("opening the stream"):
+            stream, cached = await _open_stream(chat, request)
+    except Exception as e:
+        gauge.dec()
+        errors_total.labels(*labels, error_class(e)).inc()
+        raise
+    set_attributes(provider=request.provider, model=request.model_name, streaming=True, cached=cached)
+    if cached:
+        cache_hits_total.labels(*labels).inc()
+    stream = stream_with_deadline(stream, "the stream")
+    return _instrument_stream(stream, labels, time.perf_counter(), started, gauge), cached
+
+
+async def _open_stream(chat, request: GenerationRequest) -> Tuple[AsyncIterator[str], bool]:
+    await fit_context(request)
+    key = request.cache_key()
+    if request.cacheable:
+        with span("cache"):
+            cached = await get_response_cache().aget(key)
+        if cached is not None:
+            return _replay(cached), True
+
+    def upstream():
+        stream = admission_controller.stream(
+            request.provider, request.credentials,
+            lambda: chat.astream(request.prompt, request.query, request.context),
+            priority=request.priority, tokens=request.estimated_tokens(), model_name=request.model_name,
+        )
+        stream = _track_cancellation(stream, request)
+        stream = _time_first_chunk(stream, (request.provider, request.model_name, "stream"))
+        return _record(stream, key) if request.cacheable else stream
+
+    if not (COALESCE_REQUESTS and request.cacheable):
+        return upstream(), False
+    return _stream_flight.subscribe(key, upstream), False
+
+
+async def _replay(text: str) -> AsyncIterator[str]:
+    for start in range(0, len(text), REPLAY_CHUNK_SIZE):
+        yield text[start:start + REPLAY_CHUNK_SIZE]
+
+
+async def _record(stream: AsyncIterator[str], key: str) -> AsyncIterator[str]:
+    chunks = []
+    async with aclosing(stream):
+        async for chunk in stream:
+            chunks.append(chunk)
+            yield chunk
+    # Only complete streams are cached
+    await get_response_cache().aset(key, "".join(chunks))
+
+
+async def _time_first_chunk(stream: AsyncIterator[str], key) -> AsyncIterator[str]:
+    started = time.perf_counter()
+    first = True
+    async with aclosing(stream):
+        async for chunk in stream:
+            if first:
+                latency_tracker.record(key, time.perf_counter() - started)
+                first = False
+            yield chunk
+
+
+async def _track_cancellation(stream: AsyncIterator[str], request: GenerationRequest) -> AsyncIterator[str]:
+    size_key = (request.provider, request.model_name)
+    characters = 0
+    ended = False
+    try:
+        async with aclosing(stream):
+            async for chunk in stream:
+                characters += len(chunk)
+                yield chunk
+        _completion_sizes.record(size_key, characters)
+        ended = True
+    except Exception:
+        ended = True
+        raise
+    finally:
+        if not ended:
+            # Closed before the upstream finished: estimate the output we didn't pay for
+            expected = _completion_sizes.percentile(size_key, 50, min_samples=5)
+            if expected is not None and expected > characters:
+                stream_tokens_saved_total.labels(*_labels(request)).inc((expected - characters) / 4)
+
+
+async def _instrument_stream(stream: AsyncIterator[str], labels: tuple, opened: float, started: float,
+                             gauge) -> AsyncIterator[str]:
+    chunks = 0
+    characters = 0
+    first_chunk_at = None
+    ended = False
+    try:
+        async with aclosing(stream):
+            async for chunk in stream:
+                if first_chunk_at is None:
+                    first_chunk_at = time.perf_counter()
+                    time_to_first_token_seconds.labels(*labels).observe(first_chunk_at - started)
+                chunks += 1
+                characters += len(chunk)
+                yield chunk
+        ended = True
+    except Exception as e:
+        ended = True
+        errors_total.labels(*labels, error_class(e)).inc()
+        raise
+    finally:
+        if not ended:
+            # The client went away (or lost a hedging race) before the stream ended
+            streams_cancelled_total.labels(*labels).inc()
+        gauge.dec()
+        finished_at = time.perf_counter()
+        # Time to the first chunk once the stream was opened, then the rest of the stream
+        record_span("ttft", opened, first_chunk_at or finished_at)
+        if first_chunk_at is not None:
+            record_span("stream", first_chunk_at, finished_at, chunks=chunks)
+        request_duration_seconds.labels(*labels).observe(finished_at - started)
+        stream_chunks.labels(*labels).observe(chunks)
+        if first_chunk_at is not None and finished_at > first_chunk_at:
+            # About four characters per token, as for the admission estimate
+            stream_tokens_per_second.labels(*labels).observe(characters / 4 / (finished_at - first_chunk_at))
@@ -0,0 +1,169 @@
+import asyncio
+import os
+from dataclasses import dataclass, field
+from typing import Any, List, Optional
+
+from utils.admission import status_code_for
+from utils.generation import GenerationRequest, generate, open_stream
+from utils.latency import latency_tracker
+from utils.tracing import span
+
+HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+HEDGE_DEFAULT_MS = float(os.getenv("LLM_HEDGE_DEFAULT_MS", "2000"))
+
+
+class AllTargetsFailed(Exception):
+    def __init__(self, errors: list):
+        super().__init__("All provider targets failed")
+        self.errors = errors
+
+
+@dataclass
+class HedgedResult:
+    """
+    The winning attempt of a hedged generation.
+
+    `result` is (text, cached) for full responses and (first_chunk, chunks, cached)
+    for streams, where `chunks` yields the rest of the stream. `request` is the
+    request sent to the winning target.
+    """
+    target_index: int
+    result: Any
+    attempts: int
+    errors: List[dict] = field(default_factory=list)
+    request: Optional[GenerationRequest] = None
+
+
+def hedge_delay(request: GenerationRequest, streaming: bool, hedge_after_ms: Optional[float] = None) -> float:
+    """
+    Return how long to wait for a first token before hedging to the next target.
+
+    Args:
+        request (GenerationRequest): The request sent to the current target.
+        streaming (bool): Whether the request is streamed.
+        hedge_after_ms (float): Explicit threshold; the observed percentile is used when None.
+
+    Returns:
+        float: The delay in seconds.
+    """
+    if hedge_after_ms is not None:
+        return hedge_after_ms / 1000
+    observed = latency_tracker.percentile(
+        (request.provider, request.model_name, "stream" if streaming else "full"), HEDGE_PERCENTILE
+    )
+    return observed if observed is not None else HEDGE_DEFAULT_MS / 1000
+
+
+def _build_chat(target):
+    with span("client", provider=target.provider):
+        return target.build_chat()
+
+
+async def _start_full(target, request: GenerationRequest):
+    return await generate(_build_chat(target), request)
+
+
+async def _start_stream(target, request: GenerationRequest):
+    chunks, cached = await open_stream(_build_chat(target), request)
+    try:
+        first = await chunks.__anext__()
+    except StopAsyncIteration:
+        first = ""
+    except BaseException:
+        # Failed or lost the race: release the upstream stream
+        await chunks.aclose()
+        raise
+    return first, chunks, cached
+
+
+async def hedged_generate(targets: list, prompt: str, query: str, context: str, streaming: bool = False,
+                          use_cache: bool = True, hedge: bool = True, hedge_after_ms: Optional[float] = None,
+                          priority: int = 0, context_id: Optional[str] = None,
+                          context_budget: Optional[int] = None) -> HedgedResult:
+    """
+    Generate with an ordered list of targets, hedging on slow first tokens and failing over on errors.
+
+    The first target starts immediately. If it has not produced a first token within
+    `hedge_delay`, the next target is started as well and whichever answers first
+    wins; the others are cancelled. When an attempt fails, the next target starts
+    right away. Once a stream has produced its first chunk it is committed, so errors
+    after that point are not failed over.
+
+    Args:
+        targets (list): ProviderTarget instances, in order of preference.
+        prompt (str): The initial system prompt to guide the AI.
+        query (str): The user's input or query.
+        context (str): Additional context to provide to the AI.
+        streaming (bool): Whether to open a stream instead of generating the full response.
+        use_cache (bool): Whether the response cache and coalescing may be used.
+        hedge (bool): Whether to hedge on slow first tokens (failover happens regardless).
+        hedge_after_ms (float): Fixed hedging threshold instead of the observed percentile.
+        priority (int): Admission priority, higher first.
+        context_id (str): ID of the stored context `context` was loaded from.
+        context_budget (int): Context tokens allowed, fitted per target with its model's tokenizer.
+
+    Returns:
+        HedgedResult: The winning attempt.
+
+    Raises:
+        AllTargetsFailed: When every target failed.
+    """
+    requests = [
+        target.generation_request(prompt, query, context, use_cache, priority, context_id, context_budget)
+        for target in targets
+    ]
+    start = _start_stream if streaming else _start_full
+    pending = {}
+    errors = []
+    launched = 0
+
+    def launch():
+        nonlocal launched
+        task = asyncio.ensure_future(start(targets[launched], requests[launched]))
+        pending[task] = launched
+        launched += 1
+
+    launch()
+    try:
+        while pending:
+            timeout = None
+            if hedge and launched < len(targets):
+                timeout = hedge_delay(requests[launched - 1], streaming, hedge_after_ms)
+            done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                # The current attempts are slow, race the next target against them
+                launch()
+                continue
+
+            winner = None
+            for task in sorted(done, key=pending.get):
+                index = pending.pop(task)
+                error = task.exception()
+                if error is not None:
+                    errors.append({
+                        "provider": targets[index].provider,
+                        "model_name": requests[index].model_name,
+                        "statusCode": status_code_for(error),
+                        "message": str(error),
+                    })
+                elif winner is None:
+                    winner = HedgedResult(index, task.result(), launched, errors, requests[index])
+                elif streaming:
+                    await task.result()[1].aclose()
+
+            if winner is not None:
+                winner.attempts = launched
+                return winner
+            if not pending and launched < len(targets):
+                launch()
+        raise AllTargetsFailed(errors)
+    finally:
+        for task in pending:
+            task.cancel()
+        if pending:
+            # Wait for the losers, and release the stream of one that opened just
+            # before it was cancelled
+            await asyncio.gather(*pending, return_exceptions=True)
+            for task in pending:
+                if streaming and not task.cancelled() and task.exception() is None:
+                    await task.result()[1].aclose()
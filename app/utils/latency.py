@@ -0,0 +1,80 @@
+import math
+import os
+from collections import deque
+from typing import Optional, Sequence
+
+
+def percentile(sorted_values: Sequence[float], pct: float) -> float:
+    """
+    Return the `pct` percentile of already sorted values, interpolating linearly.
+
+    Args:
+        sorted_values (Sequence[float]): The values, sorted ascending.
+        pct (float): The percentile, between 0 and 100.
+
+    Returns:
+        float: The percentile, or 0.0 when there are no values.
+    """
+    if not sorted_values:
+        return 0.0
+    rank = (len(sorted_values) - 1) * pct / 100.0
+    low = math.floor(rank)
+    high = math.ceil(rank)
+    if low == high:
+        return sorted_values[low]
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (rank - low)
+
+
+def summarize(values: Sequence[float]) -> dict:
+    """
+    Summarize latencies (in seconds) as milliseconds.
+
+    Args:
+        values (Sequence[float]): The latencies in seconds.
+
+    Returns:
+        dict: count, mean, p50, p95, p99 and max in milliseconds.
+    """
+    ordered = sorted(values)
+    count = len(ordered)
+    return {
+        "count": count,
+        "mean_ms": round(sum(ordered) / count * 1000, 2) if count else 0.0,
+        "p50_ms": round(percentile(ordered, 50) * 1000, 2),
+        "p95_ms": round(percentile(ordered, 95) * 1000, 2),
+        "p99_ms": round(percentile(ordered, 99) * 1000, 2),
+        "max_ms": round(ordered[-1] * 1000, 2) if count else 0.0,
+    }
+
+
+class LatencyTracker:
+    def __init__(self, window: int = 200):
+        """
+        Rolling windows of recent latencies, one per key (e.g. provider and model).
+
+        Args:
+            window (int): Number of recent samples kept per key.
+        """
+        self.window = window
+        self._samples = {}
+
+    def record(self, key, seconds: float):
+        """
+        Add a latency sample for `key`.
+        """
+        samples = self._samples.get(key)
+        if samples is None:
+            samples = self._samples[key] = deque(maxlen=self.window)
+        samples.append(seconds)
+
+    def percentile(self, key, pct: float, min_samples: int = 20) -> Optional[float]:
+        """
+        Return the `pct` percentile for `key` in seconds, or None without enough samples.
+        """
+        samples = self._samples.get(key)
+        if not samples or len(samples) < min_samples:
+            return None
+        return percentile(sorted(samples), pct)
+
+
+latency_tracker = LatencyTracker(window=int(os.getenv("LLM_LATENCY_WINDOW", "200")))
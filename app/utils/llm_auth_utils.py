@@ -1,7 +1,46 @@
-import requests
 import json
-from openai import AzureOpenAI
-import google.generativeai as genai
+import os
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import httpx
+import requests
+
+from utils.client_pool import credential_hash
+from utils.executor import run_sync
+from utils.shared_store import SharedStore, open_shared_store
+from utils.singleflight import SingleFlight
+
+AUTH_TIMEOUT = float(os.getenv("LLM_AUTH_TIMEOUT", "10"))
+OPENAI_MODELS_URL = "https://api.openai.com/v1/models"
+GEMINI_MODELS_URL = "https://generativelanguage.googleapis.com/v1beta/models"
+
+
+def _auth_result(status_code: int, error: str = None) -> dict:
+    if status_code == 200:
+        return {
+            "message": "Authentication Success",
+            "error": None,
+            "statusCode": 200
+        }
+    return {
+        "message": "Authentication Failed",
+        "error": error or "Unknown error",
+        "statusCode": status_code
+    }
+
+
+def _error_message(response) -> str:
+    if response.status_code == 200:
+        return None
+    try:
+        body = response.json()
+        if isinstance(body, list) and body:
+            body = body[0]
+        return body.get("error", {}).get("message", "Unknown error")
+    except Exception:
+        return response.text or "Unknown error"
 
 
 def validate_openai_api_key(api_key: str) -> dict:
@@ -17,11 +56,11 @@ def validate_openai_api_key(api_key: str) -> dict:
         "Content-Type": "application/json",
         "Authorization": f"Bearer {api_key.strip()}",
     }
-    url = "https://api.openai.com/v1/models"
-    
+    url = OPENAI_MODELS_URL
+
     try:
         # Send a request to validate the API key
-        response = requests.get(url, headers=headers)
+        response = requests.get(url, headers=headers, timeout=AUTH_TIMEOUT)
         
         if response.status_code == 200:
             return {
@@ -51,30 +90,28 @@ def validate_openai_api_key(api_key: str) -> dict:
 
 
 def validate_azure_api_key(api_key: dict) -> dict:
+    """
+    Validates the given Azure OpenAI credentials with a metadata call (no tokens are spent).
+
+    Args:
+        api_key (dict): azure_endpoint, api_key, api_version and azure_deployment.
+
+    Returns:
+        dict: A dictionary containing the validation status and message.
+    """
+    url = f"{(api_key.get('azure_endpoint') or '').rstrip('/')}/openai/models"
+    headers = {"api-key": (api_key.get("api_key") or "").strip()}
+    params = {"api-version": api_key.get("api_version")}
+
     try:
-        # Make a simple request to validate the authentication
-        client = AzureOpenAI(
-                    azure_endpoint = api_key.get("azure_endpoint"),
-                    api_key = api_key.get("api_key"),
-                    api_version = api_key.get("api_version"),
-                    azure_deployment=api_key.get("azure_deployment")
-                )
-        resp = client.chat.completions.create(model= api_key.get("azure_deployment"),
-            messages=[{"role":"user","content":"Crack a joke"}]
-        )
-        resp = json.loads(resp.json())
-        if resp:
-            {
-                "message": "Authentication Success",
-                "error": None,
-                "statusCode": 200
-            }
-        else:
-            {
-                "message": "Authentication Failed",
-                "error": resp.json(),
-                "statusCode": 401
-            }
+        response = requests.get(url, headers=headers, params=params, timeout=AUTH_TIMEOUT)
+        return _auth_result(response.status_code, _error_message(response))
+    except requests.ConnectionError as conn_err:
+        return {
+            "message": "Authentication Failed",
+            "error": f"Connection error: {str(conn_err)}",
+            "statusCode": 503
+        }
     except Exception as err:
         return {
             "message": "Authentication Failed",
@@ -93,6 +130,9 @@ def validate_gemini_api_key(api_key: str) -> dict:
         dict: A dictionary containing the validation status and message.
     """
     try:
+        # Imported here: the SDK is large and only this legacy helper needs it
+        import google.generativeai as genai
+
         # Configure GenAI client with the provided API key
         genai.configure(api_key=api_key.strip())
 
@@ -119,4 +159,192 @@ def validate_gemini_api_key(api_key: str) -> dict:
             "message": "Authentication Failed",
             "error": str(err),
             "statusCode": 500
-        }
\ No newline at end of file
+        }
+
+
+_http_client = None
+
+
+def _get_http_client() -> httpx.AsyncClient:
+    # One keep-alive client shared by every async validation
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(timeout=AUTH_TIMEOUT)
+    return _http_client
+
+
+async def _async_check(url: str, **kwargs) -> dict:
+    try:
+        response = await _get_http_client().get(url, **kwargs)
+        return _auth_result(response.status_code, _error_message(response))
+    except httpx.TransportError as conn_err:
+        return {
+            "message": "Authentication Failed",
+            "error": f"Connection error: {str(conn_err)}",
+            "statusCode": 503
+        }
+    except Exception as err:
+        return {
+            "message": "Authentication Failed",
+            "error": str(err),
+            "statusCode": 500
+        }
+
+
+async def avalidate_openai_api_key(api_key: str) -> dict:
+    """
+    Async version of `validate_openai_api_key`.
+    """
+    return await _async_check(
+        OPENAI_MODELS_URL,
+        headers={"Authorization": f"Bearer {api_key.strip()}"},
+    )
+
+
+async def avalidate_azure_api_key(api_key: dict) -> dict:
+    """
+    Async version of `validate_azure_api_key`.
+    """
+    return await _async_check(
+        f"{(api_key.get('azure_endpoint') or '').rstrip('/')}/openai/models",
+        headers={"api-key": (api_key.get("api_key") or "").strip()},
+        params={"api-version": api_key.get("api_version")},
+    )
+
+
+async def avalidate_gemini_api_key(api_key: str) -> dict:
+    """
+    Async validation of a Gemini key. Sends the key per request instead of calling the
+    process-global `genai.configure`, and only asks for a single model.
+    """
+    return await _async_check(
+        GEMINI_MODELS_URL,
+        headers={"x-goog-api-key": api_key.strip()},
+        params={"pageSize": 1},
+    )
+
+
+class CredentialValidator:
+    VALIDATORS = {
+        "openai": avalidate_openai_api_key,
+        "azure": avalidate_azure_api_key,
+        "gemini": avalidate_gemini_api_key,
+    }
+
+    def __init__(self, ttl: float = 300.0, negative_ttl: float = 30.0, max_entries: int = 10000,
+                 store: Optional[SharedStore] = None):
+        """
+        Cached, deduplicated credential validation.
+
+        Successful results are cached for `ttl` seconds and rejected credentials
+        (401/403) for `negative_ttl` seconds. Transient failures are never cached.
+        Concurrent checks of the same credentials share one upstream call. With a
+        shared store, results are also written to it so the other worker processes
+        reuse them.
+
+        Args:
+            ttl (float): Seconds a successful validation is cached.
+            negative_ttl (float): Seconds a rejected validation is cached.
+            max_entries (int): Maximum number of cached results.
+            store (SharedStore): Cross-process tier, None to keep results per process.
+        """
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self._cache = OrderedDict()
+        self._flight = SingleFlight()
+        self._store_tier = store
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    def _lookup(self, key):
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        expires_at, result = entry
+        if expires_at < time.monotonic():
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        return result
+
+    def _ttl(self, result: dict) -> Optional[float]:
+        status = result.get("statusCode")
+        if status == 200:
+            return self.ttl
+        if status in (401, 403):
+            return self.negative_ttl
+        return None
+
+    def _store(self, key, result: dict, ttl: float):
+        self._cache[key] = (time.monotonic() + ttl, result)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+    async def _shared_lookup(self, key):
+        entry = await run_sync(self._store_tier.get_entry, ":".join(key))
+        if entry is None:
+            return None
+        value, expires_at = entry
+        result = json.loads(value)
+        # Kept in memory for what remains of the lifetime another worker gave it
+        self._store(key, result, expires_at - time.time())
+        return result
+
+    async def validate(self, provider: str, credentials) -> dict:
+        """
+        Validate credentials for a provider, using the cache when possible.
+
+        Args:
+            provider (str): "openai", "azure" or "gemini".
+            credentials (str or dict): The API key, or the Azure credential dictionary.
+
+        Returns:
+            dict: The validation result, same shape as `validate_openai_api_key`.
+        """
+        key = (provider, credential_hash(credentials))
+        result = self._lookup(key)
+        if result is not None:
+            self.hits += 1
+            return dict(result)
+
+        if self._store_tier is not None:
+            result = await self._shared_lookup(key)
+            if result is not None:
+                self.shared_hits += 1
+                return dict(result)
+
+        self.misses += 1
+
+        async def check():
+            result = await self.VALIDATORS[provider](credentials)
+            ttl = self._ttl(result)
+            if ttl is not None:
+                self._store(key, result, ttl)
+                if self._store_tier is not None and ttl > 0:
+                    await run_sync(self._store_tier.set, ":".join(key), json.dumps(result), ttl)
+            return result
+
+        return dict(await self._flight.do(key, check))
+
+    def stats(self) -> dict:
+        """
+        Return cache counters.
+        """
+        return {
+            "size": len(self._cache),
+            "hits": self.hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "in_flight": self._flight.in_flight(),
+        }
+
+
+credential_validator = CredentialValidator(
+    ttl=float(os.getenv("LLM_AUTH_CACHE_TTL", "300")),
+    negative_ttl=float(os.getenv("LLM_AUTH_NEGATIVE_CACHE_TTL", "30")),
+    max_entries=int(os.getenv("LLM_AUTH_CACHE_MAX_ENTRIES", "10000")),
+    store=open_shared_store("credential_cache"),
+)
@@ -0,0 +1,34 @@
+from utils.tracing import span
+
+
+def user_message(query: str, context: str) -> str:
+    """
+    Return the user message sent to every provider: the context, then the query.
+    """
+    return f"Context: {context}\n\nQuery: {query}"
+
+
+def build_messages(prompt: str, query: str, context: str) -> list:
+    """
+    Build the LangChain messages of a generate request.
+
+    These are the messages ChatPromptTemplate produced, built directly: the template
+    parser scanned the whole (possibly multi-megabyte) context for variables on every
+    call and failed on contexts containing braces.
+
+    Args:
+        prompt (str): The system prompt.
+        query (str): The user's query.
+        context (str): The context sent with the query.
+
+    Returns:
+        list: The SystemMessage and HumanMessage.
+    """
+    # Imported here so the fast-path drivers can use user_message without loading LangChain
+    from langchain_core.messages import HumanMessage, SystemMessage
+
+    with span("template"):
+        return [
+            SystemMessage(content=prompt),
+            HumanMessage(content=user_message(query, context)),
+        ]
@@ -0,0 +1,242 @@
+import bisect
+import os
+import threading
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, Sequence, Tuple
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+RATE_BUCKETS = (1, 5, 10, 20, 40, 80, 160, 320, 640, 1280)
+COUNT_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+# HTTP path of the request being served, used as the `endpoint` label
+current_endpoint = ContextVar("llm_endpoint", default="internal")
+
+# Model names exported as the `model` label. The name comes from the request body,
+# so any other name is counted as "other" instead of creating a series per value.
+DEFAULT_MODELS = (
+    "gpt-4o", "gpt-4o-mini", "gpt-4.1", "gpt-4.1-mini", "gpt-4.1-nano", "gpt-4-turbo", "gpt-4",
+    "gpt-3.5-turbo", "o1", "o1-mini", "o3", "o3-mini", "o4-mini",
+    "gemini-pro", "gemini-1.5-pro", "gemini-1.5-flash", "gemini-2.0-flash", "gemini-2.5-pro", "gemini-2.5-flash",
+)
+KNOWN_MODELS = frozenset(DEFAULT_MODELS) | {
+    name.strip() for name in os.getenv("LLM_METRIC_MODELS", "").split(",") if name.strip()
+}
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._series = {}
+        # Only taken when a new label combination is created, never on the hot path
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        """
+        Return the series for these label values, creating it on first use.
+        """
+        series = self._series.get(values)
+        if series is None:
+            with self._lock:
+                series = self._series.get(values)
+                if series is None:
+                    series = self._series[values] = self._new_series()
+        return series
+
+    def _new_series(self):
+        raise NotImplementedError
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.kind}"
+        for values, series in list(self._series.items()):
+            yield from series.render(self.name, self.labelnames, values)
+
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+    def render(self, name, labelnames, values):
+        yield f"{name}{_format_labels(labelnames, values)} {self.value}"
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_series(self):
+        return _Value()
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_series(self):
+        return _Value()
+
+
+class _HistogramSeries:
+    __slots__ = ("buckets", "counts", "sum")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def render(self, name, labelnames, values):
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            labels = _format_labels(labelnames, values, 'le="%s"' % bound)
+            yield f"{name}_bucket{labels} {cumulative}"
+        cumulative += self.counts[-1]
+        labels = _format_labels(labelnames, values, 'le="+Inf"')
+        yield f"{name}_bucket{labels} {cumulative}"
+        yield f"{name}_sum{_format_labels(labelnames, values)} {self.sum}"
+        yield f"{name}_count{_format_labels(labelnames, values)} {cumulative}"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_series(self):
+        return _HistogramSeries(self.buckets)
+
+
+class Registry:
+    def __init__(self):
+        """
+        Holds the metrics and renders them in the Prometheus text format.
+
+        Series are updated from the event loop thread without locking; a plain
+        attribute increment is all the hot path costs.
+        """
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], Dict[str, float]], kind: str = "gauge"):
+        """
+        Register a callback returning {metric_name: value}, evaluated at scrape time.
+
+        Args:
+            collector (callable): Returns the current value of each metric.
+            kind (str): The Prometheus type of every metric it returns, "gauge" or "counter".
+        """
+        self._collectors.append((collector, kind))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector, kind in self._collectors:
+            for name, value in collector().items():
+                lines.append(f"# TYPE {name} {kind}")
+                lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+LABELS = ("provider", "model", "endpoint")
+
+requests_total = registry.register(Counter(
+    "llm_requests_total", "Generate requests received.", LABELS))
+errors_total = registry.register(Counter(
+    "llm_errors_total", "Generate requests that failed, by error class.", LABELS + ("error_class",)))
+cache_hits_total = registry.register(Counter(
+    "llm_cache_hits_total", "Generate requests answered from the response cache.", LABELS))
+in_flight = registry.register(Gauge(
+    "llm_in_flight_requests", "Generate requests currently being served.", LABELS))
+queue_wait_seconds = registry.register(Histogram(
+    "llm_queue_wait_seconds", "Time spent waiting for admission to the provider.", ("provider", "model")))
+time_to_first_token_seconds = registry.register(Histogram(
+    "llm_time_to_first_token_seconds", "Time until the first chunk (or the full response) was ready.", LABELS))
+request_duration_seconds = registry.register(Histogram(
+    "llm_request_duration_seconds", "Total time to serve a generate request.", LABELS))
+stream_chunks = registry.register(Histogram(
+    "llm_stream_chunks", "Chunks sent per streamed response.", LABELS, buckets=COUNT_BUCKETS))
+stream_tokens_per_second = registry.register(Histogram(
+    "llm_stream_tokens_per_second", "Estimated output tokens per second of streamed responses.", LABELS, buckets=RATE_BUCKETS))
+streams_cancelled_total = registry.register(Counter(
+    "llm_streams_cancelled_total", "Streamed responses abandoned by the client before they ended.", LABELS))
+stream_tokens_saved_total = registry.register(Counter(
+    "llm_stream_tokens_saved_total", "Estimated output tokens not generated because an upstream stream was cancelled.", LABELS))
+context_tokens_removed_total = registry.register(Counter(
+    "llm_context_tokens_removed_total", "Context tokens trimmed to fit the context token budget.", LABELS))
+requests_shed_total = registry.register(Counter(
+    "llm_requests_shed_total", "Generate requests turned away before queueing, by provider and reason.", ("provider", "reason")))
+websocket_connections = registry.register(Gauge(
+    "llm_websocket_connections", "Open connections of the WebSocket generate endpoint."))
+websocket_rejected_total = registry.register(Counter(
+    "llm_websocket_rejected_total", "WebSocket generate messages rejected, by reason.", ("reason",)))
+
+
+def model_label(model_name) -> str:
+    """
+    Return the `model` label for a model name: the name itself when it is one of
+    KNOWN_MODELS (or LLM_METRIC_MODELS), "other" otherwise.
+    """
+    if not model_name:
+        return ""
+    return model_name if model_name in KNOWN_MODELS else "other"
+
+
+def error_class(error: BaseException) -> str:
+    """
+    Return the label used for an error in `llm_errors_total`.
+    """
+    return type(error).__name__
+
+
+class EndpointLabelMiddleware:
+    def __init__(self, app):
+        """
+        ASGI middleware exposing the request path to the metrics as the `endpoint` label.
+        """
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            return await self.app(scope, receive, send)
+        token = current_endpoint.set(scope["path"])
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_endpoint.reset(token)
@@ -1,6 +1,9 @@
 from langchain.chat_models.openai import ChatOpenAI
-from langchain.prompts.chat import ChatPromptTemplate
-from typing import Optional
+from contextlib import aclosing
+from typing import AsyncIterator, Optional
+from utils.client_pool import client_key, get_client_registry
+from utils.deadlines import remaining
+from utils.messages import build_messages
 
 class OpenAIChat:
     def __init__(self, api_key: str, model_name: str, temperature: float = 0.7):
@@ -13,10 +16,14 @@ class OpenAIChat:
         """
         self.api_key = api_key
         self.temperature = temperature
-        self.chat_model = ChatOpenAI(
-            temperature=self.temperature,
-            openai_api_key=self.api_key,
-            model_name=model_name
+        # Reuse a pooled client so warm requests keep their HTTP connections
+        self.chat_model = get_client_registry().get_or_create(
+            client_key("openai", api_key, model_name, temperature),
+            lambda: ChatOpenAI(
+                temperature=self.temperature,
+                openai_api_key=self.api_key,
+                model_name=model_name
+            )
         )
 
     def generate_response(self, prompt: str, query: str, context: str, streaming: bool = False):
@@ -33,27 +40,58 @@ class OpenAIChat:
             str or generator: The generated response. If streaming is True, returns a generator.
         """
         try:
-            # Build the prompt template
-            chat_prompt = ChatPromptTemplate.from_messages([
-                ("system", prompt),
-                ("user", f"Context: {context}\n\nQuery: {query}")
-            ])
-
-            # Generate the messages based on the template
-            messages = chat_prompt.format_messages()
+            messages = build_messages(prompt, query, context)
 
             if streaming:
                 # Streaming: Return a generator
-                response = self.chat_model.stream(messages)
-                for chunk in response:
-                    yield chunk.content
+                return (chunk.content for chunk in self.chat_model.stream(messages))
             else:
                 # Non-streaming: Return the full response
-                response = self.chat_model(messages)
+                response = self.chat_model.invoke(messages)
                 return response.content
         except Exception as e:
             print(str(e))
             return {
             "statusCode": 500,
             "message": str(e) 
-        }
\ No newline at end of file
+        }
+
+    async def agenerate(self, prompt: str, query: str, context: str) -> str:
+        """
+        Generate a full response without blocking the event loop.
+
+        Args:
+            prompt (str): The initial system prompt to guide the AI.
+            query (str): The user's input or query.
+            context (str): Additional context to provide to the AI.
+
+        Returns:
+            str: The generated response.
+        """
+        messages = build_messages(prompt, query, context)
+        response = await self.chat_model.ainvoke(messages)
+        return response.content
+
+    async def astream(self, prompt: str, query: str, context: str) -> AsyncIterator[str]:
+        """
+        Stream the response chunk by chunk without blocking the event loop.
+
+        Args:
+            prompt (str): The initial system prompt to guide the AI.
+            query (str): The user's input or query.
+            context (str): Additional context to provide to the AI.
+
+        Yields:
+            str: The content of each streamed chunk.
+        """
+        messages = build_messages(prompt, query, context)
+        kwargs = {}
+        left = remaining()
+        if left is not None:
+            # Give up on the provider at the request's deadline
+            kwargs["timeout"] = max(left, 0.001)
+        # Closed explicitly so an abandoned stream releases its upstream connection
+        async with aclosing(self.chat_model.astream(messages, **kwargs)) as chunks:
+            async for chunk in chunks:
+                if chunk.content:
+                    yield chunk.content
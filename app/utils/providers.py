@@ -0,0 +1,181 @@
+import importlib
+import os
+import resource
+import threading
+import time
+from typing import Any, Optional, Union
+
+from pydantic import BaseModel
+
+from utils.fast_drivers import FastAzureChatOpenAIService, FastGeminiChat, FastOpenAIChat, fast_path_enabled
+from utils.generation import GenerationRequest
+
+PROVIDERS = ("openai", "azure", "gemini")
+# Providers served by this deployment; the SDKs of the others are never imported
+ENABLED_PROVIDERS = tuple(
+    provider for provider in PROVIDERS
+    if provider in {name.strip().lower() for name in os.getenv("LLM_PROVIDERS", ",".join(PROVIDERS)).split(",")}
+)
+# Import the enabled providers' SDKs at startup instead of on first use
+PRELOAD_PROVIDERS = os.getenv("LLM_PRELOAD_PROVIDERS", "0") == "1"
+
+# Module and class of each LangChain utility, imported the first time the provider is used
+_CHAT_CLASSES = {
+    "openai": ("utils.openai_utils", "OpenAIChat"),
+    "azure": ("utils.azure_utils", "AzureChatOpenAIService"),
+    "gemini": ("utils.gemini_utils", "GeminiChat"),
+}
+_chat_classes = {}
+_load_report = {}
+_load_lock = threading.Lock()
+
+
+class ProviderDisabled(Exception):
+    status_code = 404
+
+
+def rss_bytes() -> int:
+    """
+    Return the resident memory of this process (its peak where /proc is unavailable).
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def load_provider(provider: str):
+    """
+    Return the chat utility class of a provider, importing its SDK on first use.
+
+    The import time and resident memory growth of the first load are recorded for
+    provider_report(). Dependencies shared between providers (e.g. langchain_core)
+    are counted for whichever provider loads them first.
+
+    Args:
+        provider (str): "openai", "azure" or "gemini".
+
+    Returns:
+        type: OpenAIChat, AzureChatOpenAIService or GeminiChat.
+
+    Raises:
+        ProviderDisabled: When the provider is not in LLM_PROVIDERS.
+    """
+    chat_class = _chat_classes.get(provider)
+    if chat_class is not None:
+        return chat_class
+    if provider not in ENABLED_PROVIDERS:
+        raise ProviderDisabled(f"Provider is not enabled: {provider}")
+    with _load_lock:
+        if provider not in _chat_classes:
+            module_name, class_name = _CHAT_CLASSES[provider]
+            rss_before = rss_bytes()
+            started = time.perf_counter()
+            chat_class = getattr(importlib.import_module(module_name), class_name)
+            _load_report[provider] = {
+                "import_ms": round((time.perf_counter() - started) * 1000, 1),
+                "rss_bytes": max(rss_bytes() - rss_before, 0),
+            }
+            _chat_classes[provider] = chat_class
+    return _chat_classes[provider]
+
+
+def preload_providers():
+    """
+    Import the SDK of every enabled provider that doesn't use the fast path.
+    """
+    for provider in ENABLED_PROVIDERS:
+        if not fast_path_enabled(provider):
+            load_provider(provider)
+
+
+def provider_report() -> dict:
+    """
+    Return, per provider, whether it is enabled, served by the fast path, and the
+    import time and memory of its SDK once loaded.
+    """
+    return {
+        provider: {
+            "enabled": provider in ENABLED_PROVIDERS,
+            "fast_path": fast_path_enabled(provider),
+            "loaded": provider in _load_report,
+            **_load_report.get(provider, {}),
+        }
+        for provider in PROVIDERS
+    }
+
+
+def build_chat(provider: str, api_key: Any, model_name: Optional[str] = None, temperature: float = 0):
+    """
+    Build the chat utility for a provider.
+
+    Providers listed in LLM_FAST_PATH get their direct HTTP driver instead of the
+    LangChain utility; both expose the same agenerate/astream interface. The
+    LangChain utility (and its SDK) is imported the first time it is needed.
+
+    Args:
+        provider (str): "openai", "azure" or "gemini".
+        api_key (str or dict): The API key, or the Azure credential dictionary.
+        model_name (str): The model name (ignored for Azure, which uses its deployment).
+        temperature (float): The temperature setting (Azure always uses 0).
+
+    Returns:
+        OpenAIChat, AzureChatOpenAIService or GeminiChat (or their Fast* driver).
+
+    Raises:
+        ProviderDisabled: When the provider is not in LLM_PROVIDERS.
+    """
+    if provider not in PROVIDERS:
+        raise ValueError(f"Unknown provider: {provider}")
+    if provider not in ENABLED_PROVIDERS:
+        raise ProviderDisabled(f"Provider is not enabled: {provider}")
+    if fast_path_enabled(provider):
+        if provider == "openai":
+            return FastOpenAIChat(api_key=api_key, model_name=model_name, temperature=temperature)
+        if provider == "azure":
+            return FastAzureChatOpenAIService(api_key=api_key)
+        if provider == "gemini":
+            return FastGeminiChat(api_key=api_key, model_name=model_name, temperature=temperature)
+    chat_class = load_provider(provider)
+    if provider == "azure":
+        return chat_class(api_key=api_key)
+    return chat_class(api_key=api_key, model_name=model_name, temperature=temperature)
+
+
+def resolve_model(provider: str, api_key: Any, model_name: Optional[str], temperature: float):
+    """
+    Return the (model_name, temperature) a provider will actually use.
+
+    Args:
+        provider (str): "openai", "azure" or "gemini".
+        api_key (str or dict): The API key, or the Azure credential dictionary.
+        model_name (str): The requested model name.
+        temperature (float): The requested temperature.
+
+    Returns:
+        tuple: The effective model name and temperature.
+    """
+    if provider == "azure":
+        return api_key.get("azure_deployment"), 0
+    return model_name, temperature
+
+
+class ProviderTarget(BaseModel):
+    """
+    One provider, credentials and model to send a generate request to.
+    """
+    provider: str
+    api_key: Union[str, dict]
+    model_name: Optional[str] = None
+    temperature: float = 0
+
+    def build_chat(self):
+        return build_chat(self.provider, self.api_key, self.model_name, self.temperature)
+
+    def generation_request(self, prompt: str, query: str, context: str, use_cache: bool = True, priority: int = 0,
+                           context_id: Optional[str] = None, context_budget: Optional[int] = None) -> GenerationRequest:
+        model_name, temperature = resolve_model(self.provider, self.api_key, self.model_name, self.temperature)
+        return GenerationRequest(self.provider, model_name, temperature, self.api_key,
+                                 prompt, query, context, use_cache=use_cache, priority=priority,
+                                 context_id=context_id, context_budget=context_budget)
@@ -0,0 +1,160 @@
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+from utils.client_pool import credential_hash
+from utils.executor import run_sync
+from utils.shared_store import SHARED_STORE_PATH, SharedStore
+
+
+def response_cache_key(provider: str, model_name: str, temperature: Any, prompt: str, query: str, context: str, credentials: Any = None) -> str:
+    """
+    Build the canonical cache key of a generate request.
+
+    The credential hash is part of the key so a cached answer is never served to a
+    caller whose key was not accepted by the provider.
+
+    Args:
+        provider (str): The provider name.
+        model_name (str): The model (or Azure deployment) name.
+        temperature (float): The temperature setting.
+        prompt (str): The system prompt.
+        query (str): The user's query.
+        context (str): The additional context.
+        credentials (str or dict): The credentials of the caller.
+
+    Returns:
+        str: A hex SHA-256 digest.
+    """
+    payload = json.dumps(
+        [provider, model_name, float(temperature or 0), prompt, query, context,
+         credential_hash(credentials) if credentials is not None else None],
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, ttl: float = 3600.0, disk_path: Optional[str] = None):
+        """
+        Two-tier cache of generated responses.
+
+        The memory tier is an LRU bounded by the total UTF-8 size of the cached
+        responses. The optional disk tier is a SQLite file that survives restarts
+        and is shared by every worker process; disk hits are promoted back into memory.
+
+        Args:
+            max_bytes (int): Byte budget of the memory tier.
+            ttl (float): Seconds an entry stays valid, 0 to never expire.
+            disk_path (str): SQLite file for the disk tier, None to disable it.
+        """
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._memory = OrderedDict()
+        self._bytes = 0
+        self._disk = SharedStore(disk_path, "response_cache") if disk_path else None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _memory_get(self, key: str) -> Optional[str]:
+        entry = self._memory.get(key)
+        if entry is None:
+            return None
+        value, created_at, size = entry
+        if self.ttl and created_at + self.ttl < time.time():
+            self._memory_pop(key)
+            return None
+        self._memory.move_to_end(key)
+        return value
+
+    def _memory_pop(self, key: str):
+        entry = self._memory.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+
+    def _memory_set(self, key: str, value: str):
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        self._memory_pop(key)
+        self._memory[key] = (value, time.time(), size)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            _, (_, _, evicted_size) = self._memory.popitem(last=False)
+            self._bytes -= evicted_size
+
+    async def aget(self, key: str) -> Optional[str]:
+        """
+        Look a response up in memory, then on disk.
+
+        Args:
+            key (str): The key from `response_cache_key`.
+
+        Returns:
+            str or None: The cached response.
+        """
+        value = self._memory_get(key)
+        if value is not None:
+            self.memory_hits += 1
+            return value
+        if self._disk is not None:
+            value = await run_sync(self._disk.get, key)
+            if value is not None:
+                self.disk_hits += 1
+                self._memory_set(key, value)
+                return value
+        self.misses += 1
+        return None
+
+    async def aset(self, key: str, value: str):
+        """
+        Store a response in every tier.
+
+        Args:
+            key (str): The key from `response_cache_key`.
+            value (str): The full generated response.
+        """
+        self._memory_set(key, value)
+        if self._disk is not None:
+            await run_sync(self._disk.set, key, value, self.ttl)
+
+    def clear(self):
+        """
+        Drop every cached response.
+        """
+        self._memory.clear()
+        self._bytes = 0
+        if self._disk is not None:
+            self._disk.clear()
+
+    def stats(self) -> dict:
+        """
+        Return cache counters.
+        """
+        return {
+            "entries": len(self._memory),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+        }
+
+
+_response_cache = ResponseCache(
+    max_bytes=int(os.getenv("LLM_RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+    ttl=float(os.getenv("LLM_RESPONSE_CACHE_TTL", "3600")),
+    disk_path=os.getenv("LLM_RESPONSE_CACHE_PATH") or SHARED_STORE_PATH,
+)
+
+
+def get_response_cache() -> ResponseCache:
+    """
+    Return the process-wide response cache.
+    """
+    return _response_cache
@@ -0,0 +1,88 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Optional, Tuple
+
+# SQLite file shared by the worker processes (responses, credential validations)
+SHARED_STORE_PATH = os.getenv("LLM_SHARED_STORE_PATH") or None
+
+
+def private_store_path() -> str:
+    """
+    Return a shared store file in a new directory only this user can read (0700),
+    for one run of the server: cached responses and credential validations are
+    never visible to other local users, other deployments or the next run.
+    """
+    return os.path.join(tempfile.mkdtemp(prefix="llm-shared-store-"), "store.sqlite3")
+
+
+class SharedStore:
+    def __init__(self, path: str, table: str, busy_timeout: float = 5.0):
+        """
+        Key/value table in a SQLite file in WAL mode.
+
+        Every worker process opens the same file, so an entry written by one worker
+        is visible to the others; WAL lets them read while another one writes.
+        Entries expire individually. Calls block, so run them through `run_sync`.
+
+        Args:
+            path (str): The SQLite file.
+            table (str): Table holding this store's entries.
+            busy_timeout (float): Seconds to wait for another process's write lock.
+        """
+        self.table = table
+        # One connection shared by the pool threads, serialised by a lock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=busy_timeout, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._writes = 0
+
+    def get_entry(self, key: str) -> Optional[Tuple[str, float]]:
+        """
+        Return the value and expiry time (epoch seconds, 0 for never) of a live entry.
+        """
+        with self._lock:
+            row = self._conn.execute(f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)).fetchone()
+        if row is None or (row[1] and row[1] < time.time()):
+            return None
+        return row[0], row[1]
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self.get_entry(key)
+        return entry[0] if entry is not None else None
+
+    def set(self, key: str, value: str, ttl: float = 0):
+        """
+        Store a value for `ttl` seconds (0 to keep it until it is overwritten).
+        """
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, time.time() + ttl if ttl else 0),
+            )
+            self._writes += 1
+            # Prune expired rows every so often so the file doesn't grow forever
+            if self._writes % 1000 == 0:
+                self._conn.execute(f"DELETE FROM {self.table} WHERE expires_at > 0 AND expires_at < ?", (time.time(),))
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table}")
+
+
+def open_shared_store(table: str, path: Optional[str] = None) -> Optional[SharedStore]:
+    """
+    Open a table of the shared store, or return None when no store is configured.
+
+    Args:
+        table (str): Table holding the entries.
+        path (str): SQLite file, LLM_SHARED_STORE_PATH by default.
+    """
+    path = path or SHARED_STORE_PATH
+    return SharedStore(path, table) if path else None
@@ -0,0 +1,206 @@
+import asyncio
+import os
+from typing import Any, AsyncIterator, Awaitable, Callable, Hashable
+
+# How many chunks a shared stream may run ahead of its slowest subscriber
+STREAM_MAX_LAG = int(os.getenv("LLM_STREAM_MAX_LAG", "64"))
+
+
+class SingleFlight:
+    def __init__(self):
+        """
+        Collapse concurrent calls that share a key into a single execution.
+
+        The first caller for a key starts the call; everyone arriving while it is
+        still running awaits the same result (or exception).
+        """
+        self._calls = {}
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run `func` once for all concurrent callers using `key`.
+
+        Args:
+            key (hashable): Identifies calls that can share a result.
+            func (callable): Coroutine function producing the result.
+
+        Returns:
+            The result of the shared call.
+        """
+        future = self._calls.get(key)
+        if future is None:
+            future = asyncio.ensure_future(func())
+            self._calls[key] = future
+            future.add_done_callback(lambda _: self._calls.pop(key, None))
+        # Shield so one cancelled caller doesn't cancel the call for the others
+        return await asyncio.shield(future)
+
+    def in_flight(self) -> int:
+        """
+        Return the number of calls currently running.
+        """
+        return len(self._calls)
+
+
+class SharedStream:
+    def __init__(self, source: AsyncIterator[str], max_lag: int = STREAM_MAX_LAG):
+        """
+        Fan one upstream stream out to any number of subscribers.
+
+        Chunks are kept in a shared history and every subscriber reads it through
+        its own cursor, so a subscriber that joins late first receives the chunks it
+        missed. The upstream is read no further than `max_lag` chunks ahead of the
+        slowest subscriber, so slow readers push back on the upstream instead of
+        letting it run ahead. The upstream is cancelled once the last subscriber
+        goes away.
+
+        Args:
+            source (AsyncIterator[str]): The upstream chunk iterator.
+            max_lag (int): Maximum number of chunks read ahead of the slowest subscriber.
+        """
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.max_lag = max_lag
+        self._cursors = {}
+        self._source = source
+        self._updated = asyncio.Event()
+        self._advanced = None
+        self._task = asyncio.ensure_future(self._pump())
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._cursors)
+
+    def _notify(self):
+        event, self._updated = self._updated, asyncio.Event()
+        event.set()
+
+    def _lagging(self) -> bool:
+        return bool(self._cursors) and len(self.chunks) - min(self._cursors.values()) >= self.max_lag
+
+    async def _pump(self):
+        try:
+            async for chunk in self._source:
+                self.chunks.append(chunk)
+                self._notify()
+                while self._lagging():
+                    # Backpressure: wait for the slowest subscriber to catch up
+                    self._advanced = asyncio.Event()
+                    await self._advanced.wait()
+        except asyncio.CancelledError:
+            self.error = RuntimeError("Shared stream was cancelled")
+            await self._source.aclose()
+            raise
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            self._notify()
+
+    def subscribe(self) -> AsyncIterator[str]:
+        """
+        Iterate over the stream from its first chunk.
+
+        Returns:
+            AsyncIterator[str]: Each chunk of the shared stream.
+        """
+        # Registered here rather than on first iteration so a subscriber that hasn't
+        # started reading yet keeps the upstream alive
+        token = object()
+        self._cursors[token] = 0
+        return _Subscription(self, token)
+
+    def _advance(self, token, index: int):
+        self._cursors[token] = index
+        if self._advanced is not None and not self._lagging():
+            self._advanced.set()
+            self._advanced = None
+
+    async def _iterate(self, token) -> AsyncIterator[str]:
+        index = 0
+        try:
+            while True:
+                if index < len(self.chunks):
+                    chunk = self.chunks[index]
+                    index += 1
+                    self._advance(token, index)
+                    yield chunk
+                elif self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                else:
+                    await self._updated.wait()
+        finally:
+            self._leave(token)
+
+    def _leave(self, token):
+        if self._cursors.pop(token, None) is None:
+            return
+        if not self._cursors and not self.done:
+            self._task.cancel()
+        elif self._advanced is not None and not self._lagging():
+            # The slowest subscriber may just have left
+            self._advanced.set()
+            self._advanced = None
+
+
+class _Subscription:
+    """
+    One subscriber's iterator over a SharedStream.
+
+    Unlike a bare async generator, closing it before the first chunk still
+    unregisters the subscriber.
+    """
+
+    def __init__(self, stream: SharedStream, token):
+        self._stream = stream
+        self._token = token
+        self._chunks = stream._iterate(token)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> str:
+        return await self._chunks.__anext__()
+
+    async def aclose(self):
+        await self._chunks.aclose()
+        self._stream._leave(self._token)
+
+
+class StreamFlight:
+    def __init__(self):
+        """
+        Share one upstream stream between concurrent identical streaming requests.
+        """
+        self._streams = {}
+
+    def subscribe(self, key: Hashable, factory: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        """
+        Subscribe to the running stream for `key`, starting it with `factory` if needed.
+
+        Args:
+            key (hashable): Identifies streams that can be shared.
+            factory (callable): Returns the upstream chunk iterator.
+
+        Returns:
+            AsyncIterator[str]: This subscriber's view of the stream.
+        """
+        stream = self._streams.get(key)
+        if stream is None or stream.done:
+            stream = SharedStream(factory())
+            self._streams[key] = stream
+            stream._task.add_done_callback(lambda _: self._release(key, stream))
+        return stream.subscribe()
+
+    def _release(self, key: Hashable, stream: SharedStream):
+        if self._streams.get(key) is stream:
+            del self._streams[key]
+
+    def in_flight(self) -> int:
+        """
+        Return the number of streams currently running.
+        """
+        return len(self._streams)
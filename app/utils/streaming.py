@@ -0,0 +1,293 @@
+import asyncio
+import json
+import os
+import time
+from contextlib import aclosing
+from typing import AsyncIterator, Callable, Dict, Optional, Tuple
+
+from fastapi.responses import StreamingResponse
+from utils.admission import status_code_for
+from utils.tracing import current_trace
+
+STREAM_FORMATS = ("text", "sse", "ndjson")
+MEDIA_TYPES = {
+    "text": "text/plain",
+    "sse": "text/event-stream",
+    "ndjson": "application/x-ndjson",
+}
+
+# A coalesced write is flushed once it holds this many characters...
+FLUSH_CHARS = int(os.getenv("LLM_STREAM_FLUSH_CHARS", "64"))
+# ...or once its oldest chunk has waited this long (0 disables coalescing)
+FLUSH_MS = float(os.getenv("LLM_STREAM_FLUSH_MS", "25"))
+
+
+async def coalesce(chunks: AsyncIterator[str], flush_chars: int = FLUSH_CHARS,
+                   flush_ms: float = FLUSH_MS) -> AsyncIterator[str]:
+    """
+    Merge small chunks into fewer, larger writes.
+
+    Buffered text is flushed when it reaches `flush_chars` characters or when the
+    oldest buffered chunk has waited `flush_ms`, whichever comes first, so a slow
+    upstream never holds text back for longer than `flush_ms`. The first chunk is
+    never held, so coalescing doesn't delay the time to first byte.
+
+    Args:
+        chunks (AsyncIterator[str]): The upstream chunks.
+        flush_chars (int): Size threshold of a write, in characters.
+        flush_ms (float): Maximum delay of a buffered chunk, in milliseconds.
+
+    Yields:
+        str: The coalesced chunks.
+    """
+    if flush_ms <= 0:
+        async with aclosing(chunks):
+            async for chunk in chunks:
+                yield chunk
+        return
+
+    iterator = chunks.__aiter__()
+    max_delay = flush_ms / 1000
+    buffer = []
+    buffered = 0
+    deadline = 0.0
+    pending = None
+    first = True
+    try:
+        while True:
+            if not buffer:
+                # Nothing to flush, wait for the upstream without a timer
+                try:
+                    if pending is not None:
+                        task, pending = pending, None
+                        chunk = await task
+                    else:
+                        chunk = await iterator.__anext__()
+                except StopAsyncIteration:
+                    return
+                if first:
+                    first = False
+                    yield chunk
+                    continue
+                deadline = time.monotonic() + max_delay
+            else:
+                if pending is None:
+                    pending = asyncio.ensure_future(iterator.__anext__())
+                done, _ = await asyncio.wait((pending,), timeout=max(deadline - time.monotonic(), 0))
+                if not done:
+                    yield "".join(buffer)
+                    buffer, buffered = [], 0
+                    continue
+                task, pending = pending, None
+                try:
+                    chunk = task.result()
+                except StopAsyncIteration:
+                    yield "".join(buffer)
+                    return
+
+            buffer.append(chunk)
+            buffered += len(chunk)
+            if buffered >= flush_chars or time.monotonic() >= deadline:
+                yield "".join(buffer)
+                buffer, buffered = [], 0
+    finally:
+        if pending is not None:
+            # The source cannot be closed while it is still running __anext__
+            pending.cancel()
+            await asyncio.wait((pending,))
+        aclose = getattr(iterator, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+
+def _sse(data: dict, event: Optional[str] = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+
+def _ndjson(data: dict) -> str:
+    return json.dumps(data) + "\n"
+
+
+def _frame(stream_format: str, kind: str, data: dict) -> str:
+    if stream_format == "sse":
+        # Text frames use the default `message` event so EventSource.onmessage sees them
+        return _sse(data, None if kind == "chunk" else kind)
+    return _ndjson({"type": kind, **data})
+
+
+def trace_frame() -> Optional[Tuple[str, dict]]:
+    """
+    Return the `server-timing` frame of the current request, or None when it isn't traced.
+
+    It carries the Server-Timing value as of the end of the stream, which the header
+    sent up front can't include.
+    """
+    trace = current_trace.get()
+    if trace is None:
+        return None
+    return "server-timing", {
+        "trace_id": trace.trace_id,
+        "server_timing": trace.server_timing(),
+        "spans": trace.span_dicts(),
+    }
+
+
+async def stream_frames(chunks: AsyncIterator[str], prompt_tokens: int = 0, started: Optional[float] = None,
+                        cached: bool = False, extra: Optional[Dict] = None) -> AsyncIterator[Tuple[str, dict]]:
+    """
+    Coalesce a chunk stream into (kind, data) frames, independent of the wire format.
+
+    One `chunk` frame per coalesced write, then a `done` frame with usage and timing,
+    or an `error` frame if the upstream failed after the stream started. A traced
+    request ends with a `server-timing` frame, the trailer counterpart of the
+    Server-Timing header, covering the whole stream.
+
+    Args:
+        chunks (AsyncIterator[str]): The upstream chunks.
+        prompt_tokens (int): Estimated prompt tokens, reported in the final frame.
+        started (float): perf_counter() at the start of the request.
+        cached (bool): Whether the stream is replayed from the cache.
+        extra (dict): Additional fields of the final frame.
+
+    Yields:
+        tuple: The frame kind and its fields.
+    """
+    started = time.perf_counter() if started is None else started
+    coalesced = coalesce(chunks)
+    characters = 0
+    frames = 0
+    first_chunk_at = None
+    try:
+        async with aclosing(coalesced):
+            async for text in coalesced:
+                if first_chunk_at is None:
+                    first_chunk_at = time.perf_counter()
+                characters += len(text)
+                frames += 1
+                yield "chunk", {"text": text}
+    except Exception as e:
+        yield "error", {"statusCode": status_code_for(e), "message": str(e)}
+        trailer = trace_frame()
+        if trailer:
+            yield trailer
+        return
+
+    finished_at = time.perf_counter()
+    # Estimated like the admission token budget (about four characters per token)
+    completion_tokens = characters // 4
+    done = {
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "estimated": True,
+        },
+        "timing": {
+            "ttft_ms": round((first_chunk_at - started) * 1000, 3) if first_chunk_at is not None else None,
+            "duration_ms": round((finished_at - started) * 1000, 3),
+            "frames": frames,
+        },
+        "cached": cached,
+    }
+    if extra:
+        done.update(extra)
+    yield "done", done
+    trailer = trace_frame()
+    if trailer:
+        yield trailer
+
+
+async def frame_stream(chunks: AsyncIterator[str], stream_format: str, prompt_tokens: int = 0,
+                       started: Optional[float] = None, cached: bool = False,
+                       format_chunk: Optional[Callable[[str], str]] = None,
+                       extra: Optional[Dict] = None) -> AsyncIterator[str]:
+    """
+    Coalesce a chunk stream and frame it in the requested wire format.
+
+    `text` writes the raw text (or `format_chunk(text)` for providers with a legacy
+    format). `sse` and `ndjson` write the frames of `stream_frames`.
+
+    Args:
+        chunks (AsyncIterator[str]): The upstream chunks.
+        stream_format (str): One of STREAM_FORMATS.
+        prompt_tokens (int): Estimated prompt tokens, reported in the final frame.
+        started (float): perf_counter() at the start of the request.
+        cached (bool): Whether the stream is replayed from the cache.
+        format_chunk (callable): Shapes each write in the `text` format.
+        extra (dict): Additional fields of the final frame.
+
+    Yields:
+        str: The framed stream.
+    """
+    if stream_format == "text":
+        coalesced = coalesce(chunks)
+        async with aclosing(coalesced):
+            async for text in coalesced:
+                yield format_chunk(text) if format_chunk is not None else text
+        return
+
+    frames = stream_frames(chunks, prompt_tokens, started, cached, extra)
+    async with aclosing(frames):
+        async for kind, data in frames:
+            yield _frame(stream_format, kind, data)
+
+
+class CancellableStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse that stops its body iterator as soon as the client disconnects.
+
+    Starlette cancels a disconnected response through an anyio cancel scope, which
+    also cancels every await in the generators' cleanup, so the upstream HTTP
+    response is never closed and keeps generating until it is garbage collected.
+    Here the body runs in a plain task that is cancelled once, its cleanup runs to
+    completion and the body iterator is closed right away, releasing the upstream
+    connection and admission slot.
+    """
+
+    async def stream_response(self, send) -> None:
+        try:
+            await super().stream_response(send)
+        finally:
+            await self.body_iterator.aclose()
+
+    async def __call__(self, scope, receive, send) -> None:
+        streaming = asyncio.ensure_future(self.stream_response(send))
+        disconnected = asyncio.ensure_future(self.listen_for_disconnect(receive))
+        try:
+            await asyncio.wait((streaming, disconnected), return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            streaming.cancel()
+            disconnected.cancel()
+            await asyncio.wait((streaming, disconnected))
+        if not streaming.cancelled():
+            # Raise errors of the body iterator like StreamingResponse does
+            streaming.result()
+        if self.background is not None:
+            await self.background()
+
+
+def streaming_response(chunks: AsyncIterator[str], stream_format: str, headers: Optional[Dict[str, str]] = None,
+                       **frame_options) -> StreamingResponse:
+    """
+    Return a StreamingResponse framing `chunks` in the requested format.
+
+    Args:
+        chunks (AsyncIterator[str]): The upstream chunks.
+        stream_format (str): One of STREAM_FORMATS.
+        headers (dict): Additional response headers.
+        **frame_options: Passed on to frame_stream.
+
+    Returns:
+        CancellableStreamingResponse: The framed response.
+    """
+    headers = dict(headers or {})
+    if stream_format == "sse":
+        # Keep proxies from buffering the event stream
+        headers.setdefault("Cache-Control", "no-cache")
+        headers.setdefault("X-Accel-Buffering", "no")
+    return CancellableStreamingResponse(
+        frame_stream(chunks, stream_format, **frame_options),
+        media_type=MEDIA_TYPES[stream_format],
+        headers=headers,
+    )
@@ -0,0 +1,428 @@
+import asyncio
+import heapq
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import time
+import weakref
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Optional
+
+TRACING = os.getenv("LLM_TRACING", "1") == "1"
+# Rotating JSONL file receiving sampled traces ("{pid}" is replaced by the worker's PID)
+TRACE_LOG = os.getenv("LLM_TRACE_LOG", "")
+TRACE_SAMPLE_RATE = float(os.getenv("LLM_TRACE_SAMPLE_RATE", "0.01"))
+# Requests slower than this are always logged (0 disables)
+TRACE_SLOW_MS = float(os.getenv("LLM_TRACE_SLOW_MS", "0"))
+TRACE_LOG_MAX_BYTES = int(os.getenv("LLM_TRACE_LOG_MAX_BYTES", str(50 * 2**20)))
+TRACE_LOG_BACKUPS = int(os.getenv("LLM_TRACE_LOG_BACKUPS", "5"))
+# Keep the sampled stacks of the N slowest requests (0 disables the profiler)
+PROFILE_SLOWEST = int(os.getenv("LLM_PROFILE_SLOWEST", "0"))
+PROFILE_INTERVAL_MS = float(os.getenv("LLM_PROFILE_INTERVAL_MS", "5"))
+
+# Bounds the memory of long requests (batches record spans for every item)
+MAX_SPANS = 512
+MAX_STACK_DEPTH = 64
+
+# Trace of the request being served
+current_trace = ContextVar("llm_trace", default=None)
+
+# httpcore trace events recorded as spans on the fast path
+_HTTP_SPANS = {
+    "connection.connect_tcp": "connect",
+    "connection.start_tls": "tls",
+    "http11.receive_response_headers": "upstream_headers",
+    "http2.receive_response_headers": "upstream_headers",
+}
+
+
+class Trace:
+    def __init__(self, method: str, endpoint: str):
+        """
+        Timing spans of one HTTP request.
+
+        Spans are kept flat, as (name, start, end, attributes) with perf_counter()
+        times; nesting is implied by the times.
+
+        Args:
+            method (str): HTTP method.
+            endpoint (str): Request path.
+        """
+        self.trace_id = os.urandom(8).hex()
+        self.method = method
+        self.endpoint = endpoint
+        self.timestamp = time.time()
+        self.started = time.perf_counter()
+        self.duration = None
+        self.status = None
+        self.attributes = {}
+        self.spans = []
+        self.dropped_spans = 0
+        self.parsed = False
+        # Stack sample counts, when the profiler watches this request
+        self.samples = None
+
+    def add_span(self, name: str, start: float, end: float, attributes: Optional[dict] = None):
+        if len(self.spans) >= MAX_SPANS:
+            self.dropped_spans += 1
+            return
+        self.spans.append((name, start, end, attributes))
+
+    def server_timing(self) -> str:
+        """
+        Return the Server-Timing header value: the time of each span name (summed
+        when a stage ran several times) and the total so far.
+        """
+        totals = {}
+        for name, start, end, _ in self.spans:
+            totals[name] = totals.get(name, 0.0) + end - start
+        elapsed = self.duration if self.duration is not None else time.perf_counter() - self.started
+        totals["total"] = elapsed
+        return ", ".join(f"{name};dur={seconds * 1000:.3f}" for name, seconds in totals.items())
+
+    def span_dicts(self) -> list:
+        return [
+            {
+                "name": name,
+                "start_ms": round((start - self.started) * 1000, 3),
+                "duration_ms": round((end - start) * 1000, 3),
+                **(attributes or {}),
+            }
+            for name, start, end, attributes in self.spans
+        ]
+
+    def as_dict(self) -> dict:
+        record = {
+            "timestamp": datetime.fromtimestamp(self.timestamp, timezone.utc).isoformat(),
+            "trace_id": self.trace_id,
+            "method": self.method,
+            "endpoint": self.endpoint,
+            "status": self.status,
+            "duration_ms": round(self.duration * 1000, 3) if self.duration is not None else None,
+            "attributes": self.attributes,
+            "spans": self.span_dicts(),
+        }
+        if self.dropped_spans:
+            record["dropped_spans"] = self.dropped_spans
+        return record
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Time the enclosed block as a span of the current request (a no-op outside one).
+
+    Args:
+        name (str): Span name, also its Server-Timing metric name.
+        **attributes: Extra fields of the span in the trace log.
+    """
+    trace = current_trace.get()
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add_span(name, start, time.perf_counter(), attributes or None)
+
+
+def record_span(name: str, start: float, end: Optional[float] = None, **attributes):
+    """
+    Record a span measured by the caller (perf_counter() times).
+    """
+    trace = current_trace.get()
+    if trace is not None:
+        trace.add_span(name, start, time.perf_counter() if end is None else end, attributes or None)
+
+
+def set_attributes(**attributes):
+    """
+    Set fields of the current request's trace log record.
+    """
+    trace = current_trace.get()
+    if trace is not None:
+        trace.attributes.update(attributes)
+
+
+def mark_parsed():
+    """
+    Record the `parse` span of the current request: routing, reading the body and
+    validating the parameters, up to the start of the endpoint function.
+    """
+    trace = current_trace.get()
+    if trace is not None and not trace.parsed:
+        trace.parsed = True
+        trace.add_span("parse", trace.started, time.perf_counter())
+
+
+def http_trace_extensions() -> Optional[dict]:
+    """
+    Return httpx `extensions` recording the connection setup and the wait for the
+    response headers as spans of the current request, or None outside one.
+    """
+    trace = current_trace.get()
+    if trace is None:
+        return None
+    started = {}
+
+    async def callback(event: str, info: dict):
+        name, _, phase = event.rpartition(".")
+        if name not in _HTTP_SPANS:
+            return
+        if phase == "started":
+            started[name] = time.perf_counter()
+        elif name in started:
+            trace.add_span(_HTTP_SPANS[name], started.pop(name), time.perf_counter())
+
+    return {"trace": callback}
+
+
+class TraceLog:
+    def __init__(self, path: str, sample_rate: float, slow_ms: float = 0, max_bytes: int = 50 * 2**20,
+                 backups: int = 5):
+        """
+        Writes sampled traces as JSON lines to a size-rotated file.
+
+        A request is logged with probability `sample_rate`, and always when it took
+        at least `slow_ms`. Lines are written by a background thread, so the event
+        loop only serialises the record.
+
+        Args:
+            path (str): The log file; "{pid}" is replaced by the process ID so
+                several workers don't rotate the same file.
+            sample_rate (float): Fraction of requests logged.
+            slow_ms (float): Latency above which every request is logged (0 disables).
+            max_bytes (int): Size at which the file is rotated.
+            backups (int): Rotated files kept.
+        """
+        self.path = path.replace("{pid}", str(os.getpid()))
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.written = 0
+        handler = logging.handlers.RotatingFileHandler(self.path, maxBytes=max_bytes, backupCount=backups,
+                                                       delay=True, encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        self._queue = queue.SimpleQueue()
+        self._listener = logging.handlers.QueueListener(self._queue, handler)
+        self._listener.start()
+        self._logger = logging.getLogger(f"llm.traces.{id(self)}")
+        self._logger.propagate = False
+        self._logger.setLevel(logging.INFO)
+        self._logger.addHandler(logging.handlers.QueueHandler(self._queue))
+
+    def sampled(self, trace: Trace) -> bool:
+        if self.slow_ms and trace.duration * 1000 >= self.slow_ms:
+            return True
+        return random.random() < self.sample_rate
+
+    def write(self, trace: Trace):
+        if self.sampled(trace):
+            self.written += 1
+            self._logger.info(json.dumps(trace.as_dict(), ensure_ascii=False, default=str))
+
+    def close(self):
+        """
+        Flush the queued lines and stop the writer thread.
+        """
+        self._listener.stop()
+
+
+class SamplingProfiler:
+    def __init__(self, slowest: int, interval_ms: float = 5.0):
+        """
+        Samples the event loop thread's stack and keeps the hot stacks of the
+        `slowest` requests.
+
+        A background thread looks at the loop every `interval_ms` and charges the
+        stack to the request whose task is running. Tasks inherit the request of
+        the task that created them, through a task factory installed by `start`.
+        Work handed to the thread pool is not sampled.
+
+        Args:
+            slowest (int): Number of profiled requests kept.
+            interval_ms (float): Sampling interval in milliseconds.
+        """
+        self.slowest = slowest
+        self.interval = interval_ms / 1000
+        self._tasks = weakref.WeakKeyDictionary()
+        self._profiles = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._loop = None
+        self._loop_thread = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.slowest > 0
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        """
+        Start sampling `loop`, which must be running in the calling thread.
+        """
+        if not self.enabled or self._thread is not None:
+            return
+        self._loop = loop
+        self._loop_thread = threading.get_ident()
+        previous = loop.get_task_factory()
+        tasks = self._tasks
+
+        def task_factory(loop, coro, context=None):
+            if previous is not None:
+                task = previous(loop, coro) if context is None else previous(loop, coro, context=context)
+            else:
+                task = asyncio.Task(coro, loop=loop, context=context)
+            trace = current_trace.get() if context is None else context.get(current_trace)
+            if trace is not None and trace.samples is not None:
+                tasks[task] = trace
+            return task
+
+        loop.set_task_factory(task_factory)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="llm-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def watch(self, trace: Trace):
+        """
+        Profile `trace`, served by the current task.
+        """
+        trace.samples = Counter()
+        self._tasks[asyncio.current_task()] = trace
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            task = asyncio.current_task(self._loop)
+            trace = self._tasks.get(task) if task is not None else None
+            samples = trace.samples if trace is not None else None
+            if samples is None:
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            stack = []
+            while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            # The loop may have switched tasks in between; a rare misattributed sample is acceptable
+            if stack:
+                samples[";".join(reversed(stack))] += 1
+
+    def record(self, trace: Trace):
+        """
+        Keep the profile of a finished request if it is among the slowest.
+        """
+        # Tasks of the request may outlive it (a shared upstream stream), stop charging them
+        samples, trace.samples = trace.samples, None
+        if not samples:
+            return
+        entry = (trace.duration, trace.trace_id, trace, Counter(samples))
+        with self._lock:
+            if len(self._profiles) < self.slowest:
+                heapq.heappush(self._profiles, entry)
+            elif entry[0] > self._profiles[0][0]:
+                heapq.heapreplace(self._profiles, entry)
+
+    def profiles(self, top: int = 30) -> list:
+        """
+        Return the kept profiles, slowest first, with their `top` hottest stacks in
+        the folded format (root first, frames separated by ';').
+        """
+        with self._lock:
+            entries = sorted(self._profiles, reverse=True)
+        profiles = []
+        for _, _, trace, samples in entries:
+            profiles.append({
+                **trace.as_dict(),
+                "interval_ms": self.interval * 1000,
+                "samples": sum(samples.values()),
+                "stacks": [{"stack": stack, "samples": count} for stack, count in samples.most_common(top)],
+            })
+        return profiles
+
+    def clear(self):
+        with self._lock:
+            self._profiles = []
+
+
+trace_log = TraceLog(TRACE_LOG, TRACE_SAMPLE_RATE, TRACE_SLOW_MS, TRACE_LOG_MAX_BYTES,
+                     TRACE_LOG_BACKUPS) if TRACE_LOG else None
+profiler = SamplingProfiler(PROFILE_SLOWEST, PROFILE_INTERVAL_MS)
+
+
+def finish_trace(trace: Trace):
+    trace.duration = time.perf_counter() - trace.started
+    if trace.samples is not None:
+        profiler.record(trace)
+    if trace_log is not None:
+        trace_log.write(trace)
+
+
+@contextmanager
+def request_trace(method: str, endpoint: str):
+    """
+    Trace the enclosed block as one request, for work that doesn't go through
+    TracingMiddleware (the messages of a WebSocket). Yields None when tracing is off.
+
+    Args:
+        method (str): Method recorded in the trace log.
+        endpoint (str): Path recorded in the trace log.
+    """
+    if not TRACING:
+        yield None
+        return
+    trace = Trace(method, endpoint)
+    if profiler.enabled:
+        profiler.watch(trace)
+    token = current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        current_trace.reset(token)
+        finish_trace(trace)
+
+
+class TracingMiddleware:
+    def __init__(self, app):
+        """
+        ASGI middleware tracing every HTTP request.
+
+        Adds `Server-Timing` (the spans recorded before the response started) and
+        `X-Trace-Id` headers, and hands the finished trace to the trace log and the
+        profiler.
+        """
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not TRACING:
+            return await self.app(scope, receive, send)
+        with request_trace(scope["method"], scope["path"]) as trace:
+            async def send_with_timing(message):
+                if message["type"] == "http.response.start":
+                    trace.status = message["status"]
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", trace.server_timing().encode("latin-1")))
+                    headers.append((b"x-trace-id", trace.trace_id.encode("latin-1")))
+                    message = {**message, "headers": headers}
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_timing)
+            except BaseException:
+                if trace.status is None:
+                    trace.status = 500
+                raise
@@ -0,0 +1,142 @@
+"""
+Per-request overhead of the LangChain utilities versus the direct fast-path drivers.
+
+Starts `mock_provider.py` with no artificial delays, then calls `agenerate` and
+`astream` of both implementations in this process, so the measured latency and CPU
+time are almost entirely client-side overhead (message building, the LangChain
+wrappers, SDK request construction and response parsing).
+
+Usage:
+    python benchmarks/driver_overhead.py --requests 500 --concurrency 16 --output driver_overhead.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import time
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+from load_test import MOCK, PROVIDERS, start_process, summarize, wait_ready  # noqa: E402
+
+CONTEXT = "Chess is the best sport in the world. " * 50
+
+
+def build_drivers(provider: str, mock_url: str) -> dict:
+    # Imported late: the utilities read the mock endpoints from the environment on import
+    from utils.azure_utils import AzureChatOpenAIService
+    from utils.fast_drivers import FastAzureChatOpenAIService, FastGeminiChat, FastOpenAIChat
+    from utils.gemini_utils import GeminiChat
+    from utils.openai_utils import OpenAIChat
+
+    if provider == "azure":
+        credentials = {
+            "azure_endpoint": mock_url,
+            "api_key": "mock-key",
+            "api_version": "2024-02-01",
+            "azure_deployment": "mock-deployment",
+        }
+        return {"langchain": AzureChatOpenAIService(credentials), "fast": FastAzureChatOpenAIService(credentials)}
+    if provider == "gemini":
+        return {"langchain": GeminiChat("mock-key", "mock-model", 0), "fast": FastGeminiChat("mock-key", "mock-model", 0)}
+    return {"langchain": OpenAIChat("mock-key", "mock-model", 0), "fast": FastOpenAIChat("mock-key", "mock-model", 0)}
+
+
+async def call(chat, streaming: bool) -> str:
+    if not streaming:
+        return await chat.agenerate("You are a benchmark.", "Say something.", CONTEXT)
+    chunks = []
+    async for chunk in chat.astream("You are a benchmark.", "Say something.", CONTEXT):
+        chunks.append(chunk)
+    return "".join(chunks)
+
+
+async def measure(chat, streaming: bool, concurrency: int, total: int) -> dict:
+    latencies = []
+    counter = iter(range(total))
+
+    async def worker():
+        for _ in counter:
+            start = time.perf_counter()
+            await call(chat, streaming)
+            latencies.append(time.perf_counter() - start)
+
+    cpu_start = time.process_time()
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu_start
+    return {
+        "requests_per_second": round(total / elapsed, 3),
+        "latency_ms": summarize(latencies),
+        "cpu_ms_per_request": round(cpu * 1000 / total, 3),
+    }
+
+
+async def main(args):
+    mock_url = f"http://127.0.0.1:{args.mock_port}"
+    os.environ["OPENAI_BASE_URL"] = f"{mock_url}/v1"
+    os.environ["GEMINI_API_ENDPOINT"] = mock_url
+    sys.path.insert(0, os.path.join(ROOT, "app"))
+
+    mock = start_process([
+        MOCK, "--port", str(args.mock_port), "--ttft-ms", "0", "--inter-token-ms", "0", "--tokens", str(args.tokens),
+    ], ROOT, dict(os.environ))
+    scenarios = []
+    try:
+        await wait_ready(f"{mock_url}/v1/models", mock)
+        for provider in args.providers:
+            drivers = build_drivers(provider, mock_url)
+            for streaming in (False, True):
+                for concurrency in (1, args.concurrency):
+                    row = {"provider": provider, "streaming": streaming, "concurrency": concurrency}
+                    for name, chat in drivers.items():
+                        # Warm up connections and pooled clients before measuring
+                        await measure(chat, streaming, 1, args.warmup)
+                        row[name] = await measure(chat, streaming, concurrency, args.requests)
+                    row["cpu_ms_saved_per_request"] = round(
+                        row["langchain"]["cpu_ms_per_request"] - row["fast"]["cpu_ms_per_request"], 3)
+                    row["p50_ms_saved"] = round(
+                        row["langchain"]["latency_ms"]["p50"] - row["fast"]["latency_ms"]["p50"], 3)
+                    scenarios.append(row)
+                    print(f"{provider:7} {'stream' if streaming else 'full':6} c={concurrency:<3} "
+                          f"langchain {row['langchain']['cpu_ms_per_request']:6.2f} cpu-ms/req "
+                          f"p50={row['langchain']['latency_ms']['p50']:6.2f}ms  |  "
+                          f"fast {row['fast']['cpu_ms_per_request']:6.2f} cpu-ms/req "
+                          f"p50={row['fast']['latency_ms']['p50']:6.2f}ms  |  "
+                          f"saved {row['cpu_ms_saved_per_request']:.2f} cpu-ms/req")
+    finally:
+        mock.terminate()
+        mock.wait(timeout=10)
+
+    from utils.fast_drivers import HTTP2
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "http2": HTTP2,
+        "tokens": args.tokens,
+        "scenarios": scenarios,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the per-request overhead of the LangChain and fast-path drivers.")
+    parser.add_argument("--providers", nargs="+", choices=PROVIDERS, default=list(PROVIDERS))
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrency of the second run of each scenario.")
+    parser.add_argument("--requests", type=int, default=300, help="Requests per driver and scenario.")
+    parser.add_argument("--warmup", type=int, default=10, help="Unmeasured requests before each measurement.")
+    parser.add_argument("--tokens", type=int, default=50)
+    parser.add_argument("--mock-port", type=int, default=9101)
+    parser.add_argument("--output", default="driver_overhead.json", help="JSON file receiving the results.")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
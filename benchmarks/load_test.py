@@ -0,0 +1,274 @@
+"""
+Load test of the generate endpoints against the local mock provider.
+
+Starts `mock_provider.py` and the service (`uvicorn main:app` from `app/`), points the
+providers at the mock, then drives `/openai/generate`, `/azure/generate` and
+`/gemini/generate` in streaming and non-streaming modes at each concurrency level.
+The results are written as JSON so runs can be compared over time.
+
+Usage:
+    python benchmarks/load_test.py --concurrency 1 8 32 --requests 200 --output results.json
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_DIR = os.path.join(ROOT, "app")
+MOCK = os.path.join(ROOT, "benchmarks", "mock_provider.py")
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+PROVIDERS = ("openai", "azure", "gemini")
+
+
+def percentile(values: list, pct: float) -> float:
+    """
+    Return the pct-th percentile of values, with linear interpolation.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100
+    low, high = math.floor(rank), math.ceil(rank)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def summarize(values: list) -> dict:
+    """
+    Return the mean and p50/p95/p99 of values, in milliseconds.
+    """
+    ms = [value * 1000 for value in values]
+    return {
+        "mean": round(sum(ms) / len(ms), 3) if ms else 0.0,
+        "p50": round(percentile(ms, 50), 3),
+        "p95": round(percentile(ms, 95), 3),
+        "p99": round(percentile(ms, 99), 3),
+    }
+
+
+def process_usage(pid: int) -> dict:
+    """
+    Return the CPU seconds and resident memory of a process, read from /proc.
+    """
+    with open(f"/proc/{pid}/stat") as f:
+        # The command name may contain spaces, the fields start after its closing parenthesis
+        fields = f.read().rsplit(")", 1)[1].split()
+    with open(f"/proc/{pid}/statm") as f:
+        rss_pages = int(f.read().split()[1])
+    return {
+        "cpu_seconds": (int(fields[11]) + int(fields[12])) / CLOCK_TICKS,
+        "rss_bytes": rss_pages * PAGE_SIZE,
+    }
+
+
+def request_body(provider: str, mock_url: str, streaming: bool) -> dict:
+    body = {
+        "prompt": "You are a benchmark.",
+        "query": "Say something.",
+        "context": "Load test context.",
+        "streaming": streaming,
+        # The cache would short-circuit the upstream call we want to measure
+        "cache": False,
+    }
+    if provider == "azure":
+        body["api_key"] = {
+            "azure_endpoint": mock_url,
+            "api_key": "mock-key",
+            "api_version": "2024-02-01",
+            "azure_deployment": "mock-deployment",
+        }
+    else:
+        body["api_key"] = "mock-key"
+        body["model_name"] = "mock-model"
+        # The Gemini route declares the temperature as a string
+        body["temperature"] = "0" if provider == "gemini" else 0
+    return body
+
+
+async def one_request(client: httpx.AsyncClient, url: str, body: dict) -> dict:
+    start = time.perf_counter()
+    ttft = None
+    payload = b""
+    async with client.stream("POST", url, json=body) as response:
+        async for chunk in response.aiter_bytes():
+            if ttft is None and chunk:
+                ttft = time.perf_counter() - start
+            payload += chunk
+    elapsed = time.perf_counter() - start
+
+    ok = response.status_code == 200
+    if ok and not body["streaming"]:
+        # The provider routers report upstream failures in the body
+        try:
+            result = json.loads(payload)
+            ok = not (isinstance(result, dict) and result.get("statusCode", 200) != 200)
+        except ValueError:
+            ok = False
+    return {"ok": ok, "latency": elapsed, "ttft": ttft if ttft is not None else elapsed}
+
+
+async def run_scenario(client: httpx.AsyncClient, service_url: str, mock_url: str, service_pid: int,
+                       provider: str, streaming: bool, concurrency: int, total: int) -> dict:
+    url = f"{service_url}/{provider}/generate"
+    body = request_body(provider, mock_url, streaming)
+    results = []
+    counter = iter(range(total))
+
+    async def worker():
+        for _ in counter:
+            try:
+                results.append(await one_request(client, url, body))
+            except httpx.HTTPError:
+                results.append({"ok": False, "latency": 0.0, "ttft": 0.0})
+
+    before = process_usage(service_pid)
+    peak_rss = before["rss_bytes"]
+    start = time.perf_counter()
+    workers = [asyncio.ensure_future(worker()) for _ in range(concurrency)]
+    while not all(task.done() for task in workers):
+        await asyncio.wait(workers, timeout=0.1)
+        peak_rss = max(peak_rss, process_usage(service_pid)["rss_bytes"])
+    elapsed = time.perf_counter() - start
+    after = process_usage(service_pid)
+
+    succeeded = [result for result in results if result["ok"]]
+    return {
+        "provider": provider,
+        "streaming": streaming,
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": total - len(succeeded),
+        "duration_seconds": round(elapsed, 3),
+        "requests_per_second": round(total / elapsed, 3) if elapsed else 0.0,
+        "latency_ms": summarize([result["latency"] for result in succeeded]),
+        "ttft_ms": summarize([result["ttft"] for result in succeeded]),
+        "cpu_ms_per_request": round((after["cpu_seconds"] - before["cpu_seconds"]) * 1000 / total, 3),
+        "rss_bytes_start": before["rss_bytes"],
+        "rss_bytes_peak": peak_rss,
+        "rss_bytes_per_request": round((peak_rss - before["rss_bytes"]) / total, 1),
+    }
+
+
+def start_process(args: list, cwd: str, env: dict) -> subprocess.Popen:
+    return subprocess.Popen([sys.executable] + args, cwd=cwd, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+async def wait_ready(url: str, process: subprocess.Popen, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"Process exited with code {process.returncode} before {url} was ready")
+            try:
+                await client.get(url)
+                return
+            except httpx.HTTPError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError(f"Timed out waiting for {url}")
+
+
+async def main(args):
+    mock_url = f"http://127.0.0.1:{args.mock_port}"
+    service_url = f"http://127.0.0.1:{args.service_port}"
+
+    mock = start_process([
+        MOCK, "--port", str(args.mock_port),
+        "--ttft-ms", str(args.ttft_ms), "--inter-token-ms", str(args.inter_token_ms),
+        "--tokens", str(args.tokens), "--error-rate", str(args.error_rate),
+        "--rate-limit-rate", str(args.rate_limit_rate),
+    ], ROOT, dict(os.environ))
+
+    env = dict(os.environ)
+    env.update({
+        "OPENAI_BASE_URL": f"{mock_url}/v1",
+        "GEMINI_API_ENDPOINT": mock_url,
+        # Keep the service's own limits out of the way of the load we generate
+        "LLM_CONCURRENCY_INITIAL": str(max(args.concurrency)),
+        "LLM_CONCURRENCY_MAX": str(max(max(args.concurrency), 256)),
+    })
+    if args.fast_path:
+        env["LLM_FAST_PATH"] = "all"
+    service = start_process([
+        "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(args.service_port),
+        "--log-level", "warning",
+    ], APP_DIR, env)
+
+    try:
+        await wait_ready(f"{mock_url}/v1/models", mock)
+        await wait_ready(f"{service_url}/docs", service)
+
+        limits = httpx.Limits(max_connections=max(args.concurrency), max_keepalive_connections=max(args.concurrency))
+        scenarios = []
+        async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+            for provider in args.providers:
+                for streaming in (False, True):
+                    # Warm up pooled clients and connections before measuring
+                    await run_scenario(client, service_url, mock_url, service.pid, provider, streaming, 1, args.warmup)
+                    for concurrency in args.concurrency:
+                        result = await run_scenario(client, service_url, mock_url, service.pid,
+                                                    provider, streaming, concurrency, args.requests)
+                        scenarios.append(result)
+                        print(f"{provider:7} {'stream' if streaming else 'full':6} c={concurrency:<4} "
+                              f"{result['requests_per_second']:8.1f} req/s  "
+                              f"p50={result['latency_ms']['p50']:.1f}ms p99={result['latency_ms']['p99']:.1f}ms  "
+                              f"ttft p50={result['ttft_ms']['p50']:.1f}ms  "
+                              f"cpu={result['cpu_ms_per_request']:.2f}ms/req  errors={result['errors']}")
+    finally:
+        for process in (service, mock):
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "fast_path": args.fast_path,
+        "mock": {
+            "ttft_ms": args.ttft_ms,
+            "inter_token_ms": args.inter_token_ms,
+            "tokens": args.tokens,
+            "error_rate": args.error_rate,
+            "rate_limit_rate": args.rate_limit_rate,
+        },
+        "scenarios": scenarios,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the generate endpoints against a local mock provider.")
+    parser.add_argument("--providers", nargs="+", choices=PROVIDERS, default=list(PROVIDERS))
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 8, 32], help="Concurrency levels to test.")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per scenario.")
+    parser.add_argument("--warmup", type=int, default=5, help="Unmeasured requests before each provider/mode.")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Per-request timeout in seconds.")
+    parser.add_argument("--ttft-ms", type=float, default=200.0)
+    parser.add_argument("--inter-token-ms", type=float, default=20.0)
+    parser.add_argument("--tokens", type=int, default=50)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--fast-path", action="store_true", help="Serve every provider with its direct driver (LLM_FAST_PATH=all).")
+    parser.add_argument("--mock-port", type=int, default=9100)
+    parser.add_argument("--service-port", type=int, default=9000)
+    parser.add_argument("--output", default="benchmark_results.json", help="JSON file receiving the results.")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
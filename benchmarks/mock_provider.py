@@ -0,0 +1,211 @@
+"""
+Local mock of the OpenAI, Azure OpenAI and Gemini HTTP APIs for benchmarking.
+
+Responses are synthetic words emitted with a configurable time to first token and
+inter-token delay. A share of requests can fail with 500 or 429 to exercise the
+error and rate-limit paths.
+
+Usage:
+    python mock_provider.py --port 9100 --ttft-ms 200 --inter-token-ms 20 --tokens 50
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+app = FastAPI(title="Mock LLM provider")
+
+settings = {
+    "ttft_ms": 200.0,
+    "inter_token_ms": 20.0,
+    "tokens": 50,
+    "error_rate": 0.0,
+    "rate_limit_rate": 0.0,
+}
+
+
+# Streams served, to check that clients that go away cancel the upstream
+stats = {"streams_started": 0, "streams_completed": 0, "streams_cancelled": 0, "tokens_sent": 0}
+
+
+def _words():
+    return [f"tok{i} " for i in range(settings["tokens"])]
+
+
+def _injected_error():
+    roll = random.random()
+    if roll < settings["rate_limit_rate"]:
+        return JSONResponse(
+            status_code=429,
+            content={"error": {"message": "Rate limit reached (mock)", "code": 429, "status": "RESOURCE_EXHAUSTED"}},
+            headers={"retry-after": "1"},
+        )
+    if roll < settings["rate_limit_rate"] + settings["error_rate"]:
+        return JSONResponse(status_code=500, content={"error": {"message": "Injected error (mock)", "code": 500}})
+    return None
+
+
+async def _tokens():
+    stats["streams_started"] += 1
+    completed = False
+    try:
+        await asyncio.sleep(settings["ttft_ms"] / 1000)
+        words = _words()
+        for index, word in enumerate(words):
+            if index:
+                await asyncio.sleep(settings["inter_token_ms"] / 1000)
+            stats["tokens_sent"] += 1
+            yield word
+        completed = True
+    finally:
+        stats["streams_completed" if completed else "streams_cancelled"] += 1
+
+
+async def _full_text() -> str:
+    # Same total latency as a stream of the same length
+    await asyncio.sleep((settings["ttft_ms"] + settings["inter_token_ms"] * max(settings["tokens"] - 1, 0)) / 1000)
+    return "".join(_words())
+
+
+def _usage(prompt_tokens: int = 20) -> dict:
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": settings["tokens"],
+        "total_tokens": prompt_tokens + settings["tokens"],
+    }
+
+
+async def _openai_completion(request: Request, model: str):
+    error = _injected_error()
+    if error is not None:
+        return error
+    body = await request.json()
+    model = body.get("model") or model
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    created = int(time.time())
+
+    if not body.get("stream"):
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": await _full_text()}, "finish_reason": "stop"}],
+            "usage": _usage(),
+        }
+
+    async def events():
+        def chunk(delta, finish_reason=None):
+            return "data: " + json.dumps({
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }) + "\n\n"
+
+        first = True
+        async for word in _tokens():
+            yield chunk({"role": "assistant", "content": word} if first else {"content": word})
+            first = False
+        yield chunk({}, "stop")
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.post("/v1/chat/completions")
+async def openai_chat_completions(request: Request):
+    return await _openai_completion(request, "mock-model")
+
+
+@app.post("/openai/deployments/{deployment}/chat/completions")
+async def azure_chat_completions(deployment: str, request: Request):
+    return await _openai_completion(request, deployment)
+
+
+@app.get("/v1/models")
+@app.get("/openai/models")
+async def list_models():
+    return {"object": "list", "data": [{"id": "mock-model", "object": "model"}]}
+
+
+@app.get("/stats")
+async def get_stats():
+    return stats
+
+
+@app.get("/v1beta/models")
+async def gemini_list_models():
+    return {"models": [{"name": "models/mock-model"}]}
+
+
+def _gemini_candidate(text: str, finish_reason):
+    return {
+        "candidates": [{
+            "content": {"parts": [{"text": text}], "role": "model"},
+            "finishReason": finish_reason,
+            "index": 0,
+        }],
+        "usageMetadata": {"promptTokenCount": 20, "candidatesTokenCount": settings["tokens"], "totalTokenCount": 20 + settings["tokens"]},
+    }
+
+
+@app.post("/v1beta/models/{model_action}")
+async def gemini_generate(model_action: str, request: Request):
+    error = _injected_error()
+    if error is not None:
+        return error
+    _, _, action = model_action.partition(":")
+    # The google client asks for integer enums over REST; the SSE API uses names
+    int_enums = "enum-encoding=int" in str(request.url)
+    stop = 1 if int_enums else "STOP"
+
+    if action == "generateContent":
+        return _gemini_candidate(await _full_text(), stop)
+
+    if request.query_params.get("alt") == "sse":
+        async def events():
+            async for word in _tokens():
+                yield "data: " + json.dumps(_gemini_candidate(word, None)) + "\r\n\r\n"
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    async def json_array():
+        # The REST transport streams one JSON array of candidates
+        first = True
+        async for word in _tokens():
+            yield ("[" if first else ",\r\n") + json.dumps(_gemini_candidate(word, None))
+            first = False
+        yield ("[" if first else ",\r\n") + json.dumps(_gemini_candidate("", stop)) + "]"
+
+    return StreamingResponse(json_array(), media_type="application/json")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Mock OpenAI/Azure/Gemini server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--ttft-ms", type=float, default=settings["ttft_ms"], help="Delay before the first token.")
+    parser.add_argument("--inter-token-ms", type=float, default=settings["inter_token_ms"], help="Delay between tokens.")
+    parser.add_argument("--tokens", type=int, default=settings["tokens"], help="Tokens per response.")
+    parser.add_argument("--error-rate", type=float, default=settings["error_rate"], help="Share of requests failing with 500.")
+    parser.add_argument("--rate-limit-rate", type=float, default=settings["rate_limit_rate"], help="Share of requests failing with 429.")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    settings.update(
+        ttft_ms=args.ttft_ms,
+        inter_token_ms=args.inter_token_ms,
+        tokens=args.tokens,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,62 @@
+import os
+import socket
+import sys
+import threading
+import time
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The app imports its modules as `utils.x`/`router.x`, like when it runs from app/
+sys.path.insert(0, os.path.join(ROOT, "app"))
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+MOCK_PORT = _free_port()
+# Read when the app modules are imported, so they are set before any test imports one
+os.environ["LLM_FAST_PATH"] = "all"
+os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{MOCK_PORT}/v1"
+os.environ["GEMINI_API_ENDPOINT"] = f"http://127.0.0.1:{MOCK_PORT}"
+
+# Fast responses unless a test asks for something else
+MOCK_SETTINGS = {"ttft_ms": 0.0, "inter_token_ms": 0.0, "tokens": 5, "error_rate": 0.0, "rate_limit_rate": 0.0}
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture(scope="session")
+def _mock_server():
+    import uvicorn
+    import mock_provider
+
+    server = uvicorn.Server(uvicorn.Config(mock_provider.app, host="127.0.0.1", port=MOCK_PORT, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 10
+    while not server.started:
+        if time.monotonic() > deadline:
+            raise RuntimeError("The mock provider did not start")
+        time.sleep(0.01)
+    yield mock_provider
+    server.should_exit = True
+    thread.join(5)
+
+
+@pytest.fixture
+def mock_provider(_mock_server):
+    """
+    The mock provider of benchmarks/ serving the fast-path drivers. Tests may change
+    its `settings` (latency, injected errors); they are reset after each test.
+    """
+    _mock_server.settings.update(MOCK_SETTINGS)
+    yield _mock_server
+    _mock_server.settings.update(MOCK_SETTINGS)
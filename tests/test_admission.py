@@ -0,0 +1,236 @@
+import asyncio
+import time
+
+import pytest
+
+from utils.admission import AdaptiveLimiter, AdmissionController, status_code_for
+from utils.deadlines import Overloaded, deadline_scope
+from utils.fast_drivers import FastOpenAIChat, aclose_http_clients
+
+
+class RateLimited(Exception):
+    status_code = 429
+
+
+def test_limit_grows_by_about_one_slot_per_limit_of_successes():
+    limiter = AdaptiveLimiter(initial=4, minimum=1, maximum=8)
+    for _ in range(4):
+        limiter.on_success()
+    assert 4.5 < limiter.limit < 5
+
+
+def test_limit_never_grows_past_maximum():
+    limiter = AdaptiveLimiter(initial=4, minimum=1, maximum=6)
+    for _ in range(100):
+        limiter.on_success()
+    assert limiter.limit == 6
+
+
+def test_overload_backs_off_down_to_minimum():
+    limiter = AdaptiveLimiter(initial=16, minimum=2, maximum=32)
+    limiter.on_overload()
+    assert limiter.limit == 8
+    for _ in range(10):
+        limiter.on_overload()
+    assert limiter.limit == 2
+
+
+def test_a_fractional_limit_still_admits_one_request():
+    limiter = AdaptiveLimiter(initial=0.5, minimum=0.5, maximum=4)
+    assert limiter.has_capacity()
+    limiter.in_flight = 1
+    assert not limiter.has_capacity()
+
+
+@pytest.mark.anyio
+async def test_successes_raise_and_rate_limits_lower_the_key_limit(monkeypatch):
+    monkeypatch.setenv("LLM_CONCURRENCY_INITIAL", "4")
+    controller = AdmissionController(retries=0)
+
+    async def ok():
+        return "ok"
+
+    async def limited():
+        raise RateLimited("Error code: 429")
+
+    assert await controller.run("openai", "key", ok) == "ok"
+    state = controller._state("openai", "key")
+    assert state.limiter.limit == pytest.approx(4.25)
+
+    with pytest.raises(RateLimited):
+        await controller.run("openai", "key", limited)
+    assert state.limiter.limit == pytest.approx(2.125)
+    assert state.limiter.in_flight == 0
+
+
+@pytest.mark.anyio
+async def test_concurrency_is_held_to_the_limit(monkeypatch):
+    monkeypatch.setenv("LLM_CONCURRENCY_INITIAL", "2")
+    monkeypatch.setenv("LLM_CONCURRENCY_MAX", "2")
+    controller = AdmissionController()
+    running = 0
+    peak = 0
+
+    async def call():
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+
+    await asyncio.gather(*[controller.run("openai", "key", call) for _ in range(8)])
+    assert peak == 2
+
+
+@pytest.mark.anyio
+async def test_higher_priorities_leave_the_queue_first(monkeypatch):
+    monkeypatch.setenv("LLM_CONCURRENCY_INITIAL", "1")
+    monkeypatch.setenv("LLM_CONCURRENCY_MAX", "1")
+    controller = AdmissionController()
+    release = asyncio.Event()
+    order = []
+
+    async def hold():
+        await release.wait()
+
+    def call(name):
+        async def run():
+            order.append(name)
+        return run
+
+    first = asyncio.ensure_future(controller.run("openai", "key", hold))
+    await asyncio.sleep(0)
+    queued = [
+        asyncio.ensure_future(controller.run("openai", "key", call("low"), priority=0)),
+        asyncio.ensure_future(controller.run("openai", "key", call("high"), priority=5)),
+    ]
+    await asyncio.sleep(0)
+    release.set()
+    await asyncio.gather(first, *queued)
+    assert order == ["high", "low"]
+
+
+@pytest.mark.anyio
+async def test_rate_limited_call_is_retried_after_retry_after(mock_provider):
+    # The mock answers 429 with `Retry-After: 1`, far above the jittered base delay
+    controller = AdmissionController(retries=1, retry_base_delay=0.01)
+    chat = FastOpenAIChat(api_key="key", model_name="mock-model", temperature=0)
+    attempts = []
+
+    async def call():
+        attempts.append(time.monotonic())
+        mock_provider.settings["rate_limit_rate"] = 1.0 if len(attempts) == 1 else 0.0
+        return await chat.agenerate("prompt", "query", "context")
+
+    try:
+        result = await controller.run("openai", "key", call)
+    finally:
+        await aclose_http_clients()
+    assert result.startswith("tok0")
+    assert len(attempts) == 2
+    assert 1.0 <= attempts[1] - attempts[0] < 2.0
+
+
+@pytest.mark.anyio
+async def test_retry_after_is_capped_by_the_max_delay(mock_provider):
+    controller = AdmissionController(retries=2, retry_base_delay=0.01, retry_max_delay=0.05)
+    chat = FastOpenAIChat(api_key="key", model_name="mock-model", temperature=0)
+    mock_provider.settings["rate_limit_rate"] = 1.0
+
+    started = time.monotonic()
+    try:
+        with pytest.raises(Exception) as raised:
+            await controller.run("openai", "key", lambda: chat.agenerate("prompt", "query", "context"))
+    finally:
+        await aclose_http_clients()
+    assert status_code_for(raised.value) == 429
+    assert time.monotonic() - started < 0.5
+    assert controller._state("openai", "key").limiter.limit < 16
+
+
+async def saturate(controller: AdmissionController, release: asyncio.Event, count: int) -> list:
+    # One request holding the only slot and `count - 1` queued behind it
+    async def hold():
+        await release.wait()
+
+    tasks = [asyncio.ensure_future(controller.run("openai", "key", hold)) for _ in range(count)]
+    await asyncio.sleep(0)
+    return tasks
+
+
+@pytest.mark.anyio
+async def test_queue_depth_sheds_low_priorities_first(monkeypatch):
+    monkeypatch.setenv("LLM_CONCURRENCY_INITIAL", "1")
+    monkeypatch.setenv("LLM_CONCURRENCY_MAX", "1")
+    monkeypatch.setenv("LLM_SHED_QUEUE_DEPTH", "2")
+    controller = AdmissionController()
+    release = asyncio.Event()
+    tasks = await saturate(controller, release, 3)
+
+    with pytest.raises(Overloaded) as raised:
+        await controller.run("openai", "key", lambda: asyncio.sleep(0))
+    assert status_code_for(raised.value) == 503
+    # Requests of a higher priority don't count the lower ones queued ahead of them
+    high = asyncio.ensure_future(controller.run("openai", "key", lambda: asyncio.sleep(0), priority=2))
+    await asyncio.sleep(0)
+    assert not high.done()
+
+    release.set()
+    await asyncio.gather(*tasks, high)
+
+
+@pytest.mark.anyio
+async def test_request_that_cannot_start_before_its_deadline_is_shed(monkeypatch):
+    monkeypatch.setenv("LLM_CONCURRENCY_INITIAL", "1")
+    monkeypatch.setenv("LLM_CONCURRENCY_MAX", "1")
+    controller = AdmissionController()
+    release = asyncio.Event()
+    tasks = await saturate(controller, release, 1)
+    controller._state("openai", "key").service_time = 1.0
+
+    started = time.monotonic()
+    with deadline_scope(0.5):
+        with pytest.raises(Overloaded, match="before the deadline") as raised:
+            await controller.run("openai", "key", lambda: asyncio.sleep(0))
+    # Turned away at once instead of waiting out its deadline in the queue
+    assert time.monotonic() - started < 0.1
+    assert raised.value.retry_after == pytest.approx(1.0)
+
+    release.set()
+    await asyncio.gather(*tasks)
+
+
+@pytest.mark.anyio
+async def test_nothing_is_shed_by_default(monkeypatch):
+    monkeypatch.setenv("LLM_CONCURRENCY_INITIAL", "1")
+    monkeypatch.setenv("LLM_CONCURRENCY_MAX", "1")
+    controller = AdmissionController()
+    release = asyncio.Event()
+    tasks = await saturate(controller, release, 50)
+    state = controller._state("openai", "key")
+    state.service_time = 1.0
+    assert len(state.waiters) == 49
+
+    late = asyncio.ensure_future(controller.run("openai", "key", lambda: asyncio.sleep(0)))
+    await asyncio.sleep(0)
+    assert not late.done()
+    release.set()
+    await asyncio.gather(*tasks, late)
+
+
+@pytest.mark.anyio
+async def test_retry_that_cannot_finish_before_the_deadline_is_skipped(mock_provider):
+    controller = AdmissionController(retries=3, retry_base_delay=0.01)
+    chat = FastOpenAIChat(api_key="key", model_name="mock-model", temperature=0)
+    mock_provider.settings["rate_limit_rate"] = 1.0
+
+    started = time.monotonic()
+    try:
+        with deadline_scope(0.5):
+            with pytest.raises(Exception) as raised:
+                await controller.run("openai", "key", lambda: chat.agenerate("prompt", "query", "context"))
+    finally:
+        await aclose_http_clients()
+    # Retry-After: 1 doesn't fit in the 0.5s budget, so the 429 is returned right away
+    assert status_code_for(raised.value) == 429
+    assert time.monotonic() - started < 0.4
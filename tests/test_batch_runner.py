@@ -0,0 +1,113 @@
+import json
+from collections import Counter
+
+import pytest
+
+from batch_runner import Checkpoint, parse_args, run
+from utils.admission import admission_controller
+
+
+@pytest.fixture(autouse=True)
+def no_retries(monkeypatch):
+    # Rate limited lines are left to the next run instead of being retried in place
+    monkeypatch.setattr(admission_controller, "retries", 0)
+
+
+def write_input(path, count: int) -> list:
+    lines = [json.dumps({"id": f"item-{index}", "query": f"query {index}", "context": "context"}) + "\n"
+             for index in range(count)]
+    path.write_text("".join(lines))
+    return lines
+
+
+def read_output(path) -> list:
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def batch_args(tmp_path, *extra):
+    return parse_args([str(tmp_path / "input.jsonl"), "--output", str(tmp_path / "output.jsonl"),
+                       "--provider", "openai", "--api-key", "key", "--model-name", "mock-model",
+                       "--no-cache", "--concurrency", "3", "--checkpoint-every", "1", *extra])
+
+
+def test_checkpoint_watermark_slides_over_finished_lines(tmp_path):
+    checkpoint = Checkpoint(str(tmp_path / "checkpoint"))
+    for line in range(4):
+        checkpoint.started(line, (line + 1) * 10)
+    checkpoint.finished(1)
+    checkpoint.finished(3)
+    assert (checkpoint.line, checkpoint.offset, checkpoint.done) == (0, 0, {1, 3})
+    checkpoint.finished(0)
+    assert (checkpoint.line, checkpoint.offset, checkpoint.done) == (2, 20, {3})
+
+    checkpoint.save(123)
+    restored = Checkpoint(str(tmp_path / "checkpoint"))
+    assert (restored.line, restored.offset, restored.done, restored.output_offset) == (2, 20, {3}, 123)
+
+
+@pytest.mark.anyio
+async def test_every_line_is_written_once(tmp_path, mock_provider):
+    write_input(tmp_path / "input.jsonl", 20)
+    assert await run(batch_args(tmp_path)) == 0
+
+    records = read_output(tmp_path / "output.jsonl")
+    assert sorted(record["line"] for record in records) == list(range(20))
+    assert all(record["response"].startswith("tok0") for record in records)
+    checkpoint = Checkpoint(str(tmp_path / "output.jsonl.checkpoint"))
+    assert (checkpoint.line, checkpoint.done) == (20, set())
+
+
+@pytest.mark.anyio
+async def test_resume_drops_results_written_after_the_checkpoint(tmp_path, mock_provider):
+    lines = write_input(tmp_path / "input.jsonl", 6)
+    # A run that crashed: lines 0, 1 and 3 were checkpointed, line 4 was written
+    # (partly) after the last checkpoint and line 2 was still running
+    saved = "".join(json.dumps({"line": line, "id": f"item-{line}", "response": "saved"}) + "\n" for line in (0, 1, 3))
+    (tmp_path / "output.jsonl").write_text(saved + '{"line": 4, "id": "item-4", "resp')
+    (tmp_path / "output.jsonl.checkpoint").write_text(json.dumps({
+        "line": 2, "offset": len(lines[0]) + len(lines[1]), "done": [3], "output_offset": len(saved),
+    }))
+
+    assert await run(batch_args(tmp_path)) == 0
+
+    records = read_output(tmp_path / "output.jsonl")
+    assert Counter(record["line"] for record in records) == Counter(range(6))
+    assert [record["response"] for record in records[:3]] == ["saved"] * 3
+    assert all(record["response"].startswith("tok0") for record in records[3:])
+
+
+@pytest.mark.anyio
+async def test_retryable_failures_run_again_on_resume(tmp_path, mock_provider):
+    write_input(tmp_path / "input.jsonl", 5)
+    mock_provider.settings["rate_limit_rate"] = 1.0
+    assert await run(batch_args(tmp_path)) == 1
+    assert {record["statusCode"] for record in read_output(tmp_path / "output.jsonl")} == {429}
+    assert Checkpoint(str(tmp_path / "output.jsonl.checkpoint")).line == 0
+
+    mock_provider.settings["rate_limit_rate"] = 0.0
+    assert await run(batch_args(tmp_path)) == 0
+    answered = [record["line"] for record in read_output(tmp_path / "output.jsonl") if "response" in record]
+    assert sorted(answered) == list(range(5))
+    assert Checkpoint(str(tmp_path / "output.jsonl.checkpoint")).line == 5
+
+
+@pytest.mark.anyio
+async def test_invalid_lines_are_not_retried(tmp_path, mock_provider):
+    lines = write_input(tmp_path / "input.jsonl", 3)
+    (tmp_path / "input.jsonl").write_text(lines[0] + "{not json\n" + "\n" + lines[2])
+    assert await run(batch_args(tmp_path)) == 1
+    records = read_output(tmp_path / "output.jsonl")
+    assert [record.get("statusCode") for record in sorted(records, key=lambda record: record["line"])] == [None, 400, None]
+
+    # Nothing is left to do: the broken line failed for good and the blank one is skipped
+    assert await run(batch_args(tmp_path)) == 0
+    assert read_output(tmp_path / "output.jsonl") == records
+
+
+@pytest.mark.anyio
+async def test_line_past_its_timeout_is_retryable(tmp_path, mock_provider):
+    write_input(tmp_path / "input.jsonl", 2)
+    mock_provider.settings["ttft_ms"] = 2000
+    assert await run(batch_args(tmp_path, "--timeout", "0.2")) == 1
+    assert {record["statusCode"] for record in read_output(tmp_path / "output.jsonl")} == {504}
+    assert Checkpoint(str(tmp_path / "output.jsonl.checkpoint")).line == 0
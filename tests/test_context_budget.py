@@ -0,0 +1,98 @@
+import random
+
+import pytest
+
+from utils.context_budget import ApproximateTokenizer, ContextFitter, get_tokenizer, register_tokenizer
+
+tokenizer = ApproximateTokenizer()
+
+PARAGRAPHS = [
+    "Chess is a board game for two players, played on a board of sixty-four squares.",
+    "Magnus Carlsen is a Norwegian chess grandmaster and a five-time World Chess Champion.",
+    "The weather in Oslo is often cold and wet in the autumn months.",
+    "Football is the most popular sport in the world by number of players and spectators.",
+    "Bread is made from flour, water, salt and yeast, and is baked in an oven.",
+]
+
+
+def random_context(seed: int) -> str:
+    generator = random.Random(seed)
+    words = ["alpha", "beta", "chess", "magnus", "carlsen", "the", "of", "board", "x" * 40]
+    paragraphs = []
+    for _ in range(generator.randint(1, 30)):
+        sentence = " ".join(generator.choice(words) for _ in range(generator.randint(1, 150)))
+        paragraphs.append(sentence + generator.choice([".", "!", "", "?"]))
+    return "".join(paragraph + generator.choice(["\n\n", "\n", " ", " \n \n"]) for paragraph in paragraphs)
+
+
+def test_context_within_budget_is_unchanged():
+    text = "\n\n".join(PARAGRAPHS)
+    fitted, fit = ContextFitter().fit(text, "Who is Magnus Carlsen?", 10_000, tokenizer)
+    assert fitted == text
+    assert fit.tokens_removed == 0
+    assert fit.tokens == fit.original_tokens == tokenizer.count(text)
+
+
+@pytest.mark.parametrize("seed", range(40))
+@pytest.mark.parametrize("budget", [0, 1, 7, 32, 100, 500])
+def test_fitted_context_never_exceeds_the_budget(seed, budget):
+    text = random_context(seed)
+    fitter = ContextFitter(chunk_tokens=random.Random(seed).choice([8, 32, 256]))
+    fitted, fit = fitter.fit(text, "magnus carlsen chess", budget, tokenizer)
+
+    assert tokenizer.count(fitted) <= fit.tokens <= budget
+    assert fit.tokens + fit.tokens_removed == fit.original_tokens == tokenizer.count(text)
+    assert fit.chunks_kept <= fit.chunks_total
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_kept_chunks_stay_in_document_order(seed):
+    text = random_context(seed)
+    fitted, fit = ContextFitter(chunk_tokens=16).fit(text, "magnus", 60, tokenizer)
+    position = 0
+    for part in fitted.split("\n\n"):
+        part = part.strip()
+        if part:
+            found = text.find(part, position)
+            assert found >= 0
+            position = found + len(part)
+
+
+def test_most_relevant_paragraph_is_kept():
+    text = "\n\n".join(PARAGRAPHS * 4)
+    budget = tokenizer.count(PARAGRAPHS[1]) + 5
+    fitted, fit = ContextFitter(chunk_tokens=64).fit(text, "Who is Magnus Carlsen?", budget, tokenizer)
+    assert "Magnus Carlsen" in fitted
+    assert "Bread" not in fitted
+    assert fit.tokens <= budget
+
+
+def test_repeated_fits_of_a_context_reuse_its_counts():
+    counts = []
+
+    class CountingTokenizer(ApproximateTokenizer):
+        name = "counting"
+
+        def count(self, text):
+            counts.append(len(text))
+            return super().count(text)
+
+    text = "\n\n".join(PARAGRAPHS * 20)
+    fitter = ContextFitter(chunk_tokens=32)
+    first = fitter.fit(text, "chess", 100, CountingTokenizer())
+    calls = len(counts)
+    assert fitter.fit(text, "chess", 100, CountingTokenizer()) == first
+    # Only the gap separator is counted again, never the context or its chunks
+    assert all(length == 2 for length in counts[calls:])
+
+
+def test_registering_a_tokenizer_replaces_the_cached_one():
+    class WordTokenizer:
+        name = "words"
+
+        def count(self, text):
+            return len(text.split())
+
+    assert get_tokenizer("mock", "mock-model").name == "approximate"
+    register_tokenizer("mock", lambda model_name: WordTokenizer())
+    assert get_tokenizer("mock", "mock-model").name == "words"
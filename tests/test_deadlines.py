@@ -0,0 +1,113 @@
+import asyncio
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from utils.admission import AdmissionController, status_code_for
+from utils.deadlines import (
+    DeadlineExceeded, current_deadline, deadline_guard, deadline_scope, stream_with_deadline,
+)
+
+
+@pytest.fixture
+def client(mock_provider):
+    import main
+
+    with TestClient(main.app) as client:
+        yield client
+
+
+def generate_body(**fields) -> dict:
+    return {"api_key": "key", "model_name": "mock-model", "query": "query", "context": "context", "cache": False, **fields}
+
+
+def test_a_scope_never_extends_the_deadline_in_effect():
+    with deadline_scope(1):
+        outer = current_deadline.get()
+        with deadline_scope(60):
+            assert current_deadline.get() == outer
+        with deadline_scope(0.5):
+            assert current_deadline.get() < outer
+        with deadline_scope(60, detached=True):
+            assert current_deadline.get() > outer
+    assert current_deadline.get() is None
+
+
+@pytest.mark.anyio
+async def test_guard_cancels_the_block_at_the_deadline():
+    started = time.monotonic()
+    with deadline_scope(0.05):
+        with pytest.raises(DeadlineExceeded) as raised:
+            async with deadline_guard("the upstream call"):
+                await asyncio.sleep(10)
+    assert time.monotonic() - started < 1
+    assert status_code_for(raised.value) == 504
+
+
+@pytest.mark.anyio
+async def test_stream_deadline_closes_the_stream():
+    closed = False
+
+    async def chunks():
+        nonlocal closed
+        try:
+            yield "c0"
+            await asyncio.sleep(10)
+            yield "c1"
+        finally:
+            closed = True
+
+    received = []
+    with deadline_scope(0.05):
+        with pytest.raises(DeadlineExceeded):
+            async for chunk in stream_with_deadline(chunks()):
+                received.append(chunk)
+    assert received == ["c0"]
+    assert closed
+
+
+@pytest.mark.anyio
+async def test_deadline_passing_in_the_queue_is_504(monkeypatch):
+    monkeypatch.setenv("LLM_CONCURRENCY_INITIAL", "1")
+    monkeypatch.setenv("LLM_CONCURRENCY_MAX", "1")
+    controller = AdmissionController()
+    release = asyncio.Event()
+
+    async def hold():
+        await release.wait()
+
+    running = asyncio.ensure_future(controller.run("openai", "key", hold))
+    await asyncio.sleep(0)
+    with deadline_scope(0.05):
+        with pytest.raises(DeadlineExceeded, match="queued") as raised:
+            await controller.run("openai", "key", hold)
+    assert status_code_for(raised.value) == 504
+    release.set()
+    await running
+    assert controller._state("openai", "key").waiters == []
+
+
+def test_upstream_slower_than_the_budget_is_504(client, mock_provider):
+    mock_provider.settings["ttft_ms"] = 2000
+    started = time.monotonic()
+    response = client.post("/openai/generate", json=generate_body(), headers={"X-Request-Timeout-Ms": "200"})
+    assert response.status_code == 504
+    assert response.json()["statusCode"] == 504
+    assert time.monotonic() - started < 1.5
+
+
+def test_spent_budget_is_504_before_the_request_starts(client):
+    response = client.post("/openai/generate", json=generate_body(), headers={"X-Request-Timeout-Ms": "0"})
+    assert response.status_code == 504
+
+
+def test_invalid_budget_is_400(client):
+    response = client.post("/openai/generate", json=generate_body(), headers={"X-Request-Timeout-Ms": "soon"})
+    assert response.status_code == 400
+
+
+def test_request_within_its_budget_succeeds(client):
+    response = client.post("/openai/generate", json=generate_body(), headers={"X-Request-Timeout-Ms": "5000"})
+    assert response.status_code == 200
+    assert response.json()["response"].startswith("tok0")
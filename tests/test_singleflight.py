@@ -0,0 +1,173 @@
+import asyncio
+
+import pytest
+
+from utils.singleflight import SharedStream, SingleFlight, StreamFlight
+
+
+class Source:
+    """
+    Upstream stream recording how far it was read and whether it was closed.
+    """
+
+    def __init__(self, count: int, delay: float = 0):
+        self.count = count
+        self.delay = delay
+        self.produced = 0
+        self.closed = False
+
+    async def __call__(self):
+        try:
+            for index in range(self.count):
+                if self.delay:
+                    await asyncio.sleep(self.delay)
+                self.produced += 1
+                yield f"c{index}"
+        finally:
+            self.closed = True
+
+
+async def collect(stream):
+    return [chunk async for chunk in stream]
+
+
+async def settle():
+    # Let every ready task run until it blocks
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+@pytest.mark.anyio
+async def test_single_flight_runs_concurrent_calls_once():
+    flight = SingleFlight()
+    calls = 0
+
+    async def call():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return "result"
+
+    results = await asyncio.gather(*[flight.do("key", call) for _ in range(5)])
+    assert results == ["result"] * 5
+    assert calls == 1
+    assert flight.in_flight() == 0
+
+
+@pytest.mark.anyio
+async def test_single_flight_survives_a_cancelled_caller():
+    flight = SingleFlight()
+
+    async def call():
+        await asyncio.sleep(0.02)
+        return "result"
+
+    first = asyncio.ensure_future(flight.do("key", call))
+    second = asyncio.ensure_future(flight.do("key", call))
+    await settle()
+    first.cancel()
+    assert await second == "result"
+
+
+@pytest.mark.anyio
+async def test_stream_flight_fans_one_upstream_out():
+    flight = StreamFlight()
+    source = Source(5, delay=0.001)
+    calls = 0
+
+    def factory():
+        nonlocal calls
+        calls += 1
+        return source()
+
+    results = await asyncio.gather(*[collect(flight.subscribe("key", factory)) for _ in range(3)])
+    assert results == [[f"c{index}" for index in range(5)]] * 3
+    assert calls == 1
+    assert flight.in_flight() == 0
+
+
+@pytest.mark.anyio
+async def test_late_subscriber_replays_the_missed_chunks():
+    flight = StreamFlight()
+    source = Source(4, delay=0.005)
+    first = flight.subscribe("key", source)
+    head = [await first.__anext__(), await first.__anext__()]
+    late = flight.subscribe("key", source)
+    assert head + await collect(first) == await collect(late) == ["c0", "c1", "c2", "c3"]
+    assert source.produced == 4
+
+
+@pytest.mark.anyio
+async def test_upstream_waits_for_a_lagging_subscriber():
+    source = Source(20)
+    shared = SharedStream(source(), max_lag=3)
+    fast = asyncio.ensure_future(collect(shared.subscribe()))
+    slow = shared.subscribe()
+    await settle()
+    # The slow subscriber hasn't read anything, so the upstream stops max_lag chunks ahead
+    assert source.produced == 3
+    assert not fast.done()
+
+    assert await slow.__anext__() == "c0"
+    await settle()
+    assert source.produced == 4
+
+    # Once the slow subscriber leaves, the others get the rest of the stream
+    await slow.aclose()
+    assert await fast == [f"c{index}" for index in range(20)]
+    assert source.produced == 20
+
+
+@pytest.mark.anyio
+async def test_a_cancelled_subscriber_leaves_the_others_streaming():
+    flight = StreamFlight()
+    source = Source(10, delay=0.001)
+    leaving = flight.subscribe("key", source)
+    staying = asyncio.ensure_future(collect(flight.subscribe("key", source)))
+    assert await leaving.__anext__() == "c0"
+    await leaving.aclose()
+    assert await staying == [f"c{index}" for index in range(10)]
+    assert source.produced == 10
+
+
+@pytest.mark.anyio
+async def test_upstream_is_cancelled_when_every_subscriber_leaves():
+    flight = StreamFlight()
+    source = Source(1000, delay=0.001)
+    subscribers = [flight.subscribe("key", source) for _ in range(2)]
+    for subscriber in subscribers:
+        await subscriber.__anext__()
+    consumer = asyncio.ensure_future(collect(subscribers[0]))
+    await settle()
+    consumer.cancel()
+    await subscribers[1].aclose()
+    await asyncio.sleep(0.01)
+    assert source.closed
+    assert source.produced < 1000
+    assert flight.in_flight() == 0
+
+
+@pytest.mark.anyio
+async def test_unread_subscriber_keeps_the_upstream_alive():
+    flight = StreamFlight()
+    source = Source(3, delay=0.001)
+    reader = flight.subscribe("key", source)
+    waiting = flight.subscribe("key", source)
+    await reader.__anext__()
+    await reader.aclose()
+    # Subscribed but not iterated yet: still gets the whole stream
+    assert await collect(waiting) == ["c0", "c1", "c2"]
+
+
+@pytest.mark.anyio
+async def test_upstream_error_reaches_every_subscriber():
+    flight = StreamFlight()
+
+    async def failing():
+        yield "c0"
+        raise ValueError("upstream failed")
+
+    subscribers = [flight.subscribe("key", failing) for _ in range(2)]
+    for subscriber in subscribers:
+        with pytest.raises(ValueError, match="upstream failed"):
+            await collect(subscriber)